@@ -0,0 +1,82 @@
+"""Build the frontend for production: content-hashed, precompressed static files.
+
+build() copies the stylesheets and scripts that index.html references into
+dist/assets/ under names that contain a hash of their content
+(script.3f2a9c1b7d0e.js), writes a gzip copy next to each (and a brotli copy
+when the brotli package is installed) and writes dist/index.html pointing at
+the new names. A changed file gets a new name, so the assets can be cached by
+browsers forever; only index.html has to be revalidated. The web server in
+front of the app (deploy/nginx.conf) serves dist/ directly, picking the
+precompressed copies, so static requests never reach the Python workers.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIST = os.path.join(ROOT, 'dist')
+COMPRESSIBLE = ('.js', '.css', '.html', '.svg', '.json')
+MIN_COMPRESS_BYTES = 256
+
+# href="Frontend/styles.css", src="Frontend/script.js"
+ASSET_REFERENCE = re.compile(r'(href|src)="(Frontend/[^"?#]+)"')
+
+def hashed_name(name, content):
+    stem, extension = os.path.splitext(name)
+    return f'{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}'
+
+def write_compressed(path, content):
+    """Write path.gz (and path.br with the brotli package) when it saves space; returns the suffixes written."""
+    written = []
+    # mtime=0 keeps the .gz identical across builds of the same content
+    compressed = gzip.compress(content, compresslevel=9, mtime=0)
+    if len(compressed) < len(content):
+        with open(path + '.gz', 'wb') as file:
+            file.write(compressed)
+        written.append('.gz')
+    try:
+        import brotli
+    except ImportError:
+        return written
+    compressed = brotli.compress(content, quality=11)
+    if len(compressed) < len(content):
+        with open(path + '.br', 'wb') as file:
+            file.write(compressed)
+        written.append('.br')
+    return written
+
+def write_asset(folder, name, content):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as file:
+        file.write(content)
+    if name.endswith(COMPRESSIBLE) and len(content) >= MIN_COMPRESS_BYTES:
+        return write_compressed(path, content)
+    return []
+
+def build(root=ROOT, dist=DIST):
+    """Build dist/ from index.html and the Frontend files it references; returns the manifest."""
+    with open(os.path.join(root, 'index.html'), 'rb') as file:
+        page = file.read().decode('utf-8')
+
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    folder = os.path.join(dist, 'assets')
+    os.makedirs(folder)
+
+    manifest = {}
+    for reference in sorted({match.group(2) for match in ASSET_REFERENCE.finditer(page)}):
+        with open(os.path.join(root, reference), 'rb') as file:
+            content = file.read()
+        name = hashed_name(os.path.basename(reference), content)
+        variants = write_asset(folder, name, content)
+        manifest[reference] = {'path': f'assets/{name}', 'bytes': len(content), 'precompressed': variants}
+
+    page = ASSET_REFERENCE.sub(lambda match: f'{match.group(1)}="{manifest[match.group(2)]["path"]}"', page)
+    manifest['index.html'] = {'path': 'index.html', 'bytes': len(page.encode('utf-8')),
+                              'precompressed': write_asset(dist, 'index.html', page.encode('utf-8'))}
+    with open(os.path.join(dist, 'manifest.json'), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, indent=2)
+    return manifest
@@ -0,0 +1 @@
+"""Benchmarks for the livestock backend. Run modules from Backend/ with python -m benchmarks.<name>."""
@@ -0,0 +1,199 @@
+"""Deterministic synthetic herd for benchmarks.
+
+Fills the database the app is configured with (DATABASE_URL, livestock.db by
+default) with farms, lots, a multi-generation herd with sires and dams, lot
+movements, weight, emission, finance and resource logs, health records and
+carcass weights. The same arguments and seed always give the same rows, so
+benchmark results of different commits can be compared. Rows are written with
+bulk INSERTs in batches, then the derived tables (rollups, lot history, log
+buckets) and the ID counters are rebuilt once at the end.
+
+Usage (from Backend/, into an empty database):
+    python -m benchmarks.herd [--database livestock.db] [--farms 5] [--lots-per-farm 10] [--animals 5000]
+                              [--generations 4] [--days 90] [--readings-per-day 1] [--seed 42]
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+# Readings end here rather than at the current time, so the data does not depend on when it is generated
+END = datetime(2024, 7, 1)
+BATCH_ROWS = 20000
+BREEDS = ['Brahman', 'Cebú', 'Normando', 'Holstein', 'Romosinuano', 'Angus']
+ACTIVITIES = ['Cría', 'Levante', 'Ceba', 'Recuperación']
+DEPARTMENTS = [('Antioquia', 'Montería'), ('Córdoba', 'Montería'), ('Meta', 'Villavicencio'),
+               ('Casanare', 'Yopal'), ('Cesar', 'Valledupar')]
+
+def herd_rows(farms=5, lots_per_farm=10, animals=5000, generations=4, days=90, readings_per_day=1,
+              weigh_every_days=7, moves_per_animal=2, seed=42):
+    """Yield (model name, row dict) pairs for the whole data set, parents before their offspring."""
+    rng = random.Random(seed)
+    start = END - timedelta(days=days)
+
+    for farm in range(1, farms + 1):
+        depto, municipio = DEPARTMENTS[(farm - 1) % len(DEPARTMENTS)]
+        yield 'Fincas', {'FincaID': farm, 'Nombre': f'Finca {farm}', 'Depto': depto, 'Municipio': municipio,
+                         'Area_ha': round(rng.uniform(50, 2000), 1), 'Uso_Suelo': 'Ganadería',
+                         'Fecha_Registro': start}
+    lots_of_farm = {}
+    for farm in range(1, farms + 1):
+        for i in range(lots_per_farm):
+            lot = (farm - 1) * lots_per_farm + i + 1
+            lots_of_farm.setdefault(farm, []).append(lot)
+            yield 'Lotes', {'LoteID': lot, 'FincaID': farm, 'Nombre_Lote': f'Lote {lot}',
+                            'Area_ha': round(rng.uniform(2, 40), 1), 'Actividad_Ganado': rng.choice(ACTIVITIES)}
+
+    # Generation 0 are founders without recorded parents; each later generation is born
+    # two years after the previous one and takes its sire and dam from it
+    per_generation = [animals // generations + (1 if g < animals % generations else 0) for g in range(generations)]
+    previous = {'M': [], 'F': []}
+    number = 0
+    herd = []
+    for generation, count in enumerate(per_generation):
+        born_around = END - timedelta(days=730 * (generations - generation))
+        current = {'M': [], 'F': []}
+        for _ in range(count):
+            number += 1
+            animal_id = f'BOV{number:06d}'
+            sex = rng.choice('MF')
+            farm = rng.randint(1, farms)
+            lot = rng.choice(lots_of_farm[farm])
+            birth = born_around + timedelta(days=rng.randint(0, 364))
+            sire = rng.choice(previous['M']) if previous['M'] else None
+            dam = rng.choice(previous['F']) if previous['F'] else None
+            herd.append([animal_id, farm, lot, birth])
+            current[sex].append(animal_id)
+            yield 'Bovinos', {'BovinoID': animal_id, 'FincaID': farm, 'LoteID': lot, 'Sexo': sex,
+                              'Raza': rng.choice(BREEDS), 'Fecha_Nac': birth, 'Estado': 'Activo',
+                              'MadreID': dam, 'PadreID': sire, 'Origen': 'Nacido en finca' if dam else 'Compra',
+                              'Propósito': rng.choice(['Carne', 'Leche', 'Doble propósito'])}
+        previous = current
+
+    # Moves between the lots of the animal's farm during the logged period; the
+    # animal's LoteID ends up on its last destination, as the app keeps it
+    movement = 0
+    for animal in herd:
+        animal_id, farm, lot, _ = animal
+        moments = sorted(start + timedelta(minutes=rng.randint(0, days * 1440)) for _ in range(moves_per_animal))
+        for moment in moments:
+            destination = rng.choice(lots_of_farm[farm])
+            if destination == lot:
+                continue
+            movement += 1
+            yield 'Movimientos_Animales', {'MovID': f'MOV{movement:07d}', 'BovinoID': animal_id, 'Tipo_Mov': 'Traslado',
+                                           'Fecha': moment, 'Finca_Origen': str(farm), 'Lote_Origen': str(lot),
+                                           'Finca_Destino': str(farm), 'Lote_Destino': str(destination),
+                                           'Motivo': 'Rotación de potreros'}
+            lot = animal[2] = destination
+
+    for i, (animal_id, _, _, _) in enumerate(herd, start=1):
+        yield 'Registros_Sanitarios', {'RegistroID': f'RS{i:07d}', 'BovinoID': animal_id, 'Tipo_Prueba': 'Brucelosis',
+                                       'Estado_Salud': 'Sano' if rng.random() < 0.9 else 'Enfermo',
+                                       'Fecha_Muestra': start + timedelta(days=rng.randint(0, days)),
+                                       'Laboratorio': 'ICA', 'Costo_Examen': round(rng.uniform(20000, 90000))}
+    for i, (animal_id, _, _, _) in enumerate(herd[::10], start=1):
+        live = rng.uniform(420, 600)
+        carcass = live * rng.uniform(0.5, 0.6)
+        yield 'Pesajes_Canales', {'CanalID': f'CAN{i:06d}', 'BovinoID': animal_id, 'Fecha_Sacrificio': END,
+                                  'Peso_Vivo': round(live, 1), 'Peso_Canal': round(carcass, 1),
+                                  'Rendimiento': round(carcass / live * 100, 1), 'Planta': 'Frigorífico'}
+
+    # Logs: weights every weigh_every_days along a growth curve, emission readings
+    # readings_per_day times a day, one finance entry a month per animal
+    step = timedelta(days=1) / readings_per_day
+    for animal_id, _, _, birth in herd:
+        gain = rng.uniform(0.4, 1.0)
+        for day in range(0, days, weigh_every_days):
+            moment = start + timedelta(days=day, minutes=rng.randint(360, 720))
+            age = max((moment - birth).days, 0)
+            yield 'WeightLog', {'animal_id': animal_id, 'weight_kg': round(min(35 + gain * age, 650) + rng.gauss(0, 3), 1),
+                                'measured_at': moment}
+        for reading in range(days * readings_per_day):
+            yield 'EmissionLog', {'animal_id': animal_id, 'co2_emissions': round(rng.uniform(5, 12), 3),
+                                  'methane_emissions': round(rng.uniform(0.2, 0.6), 3), 'logged_at': start + reading * step}
+        for day in range(0, days, 30):
+            yield 'FinanceLog', {'animal_id': animal_id, 'cost_feed': round(rng.uniform(50000, 150000)),
+                                 'cost_medical': round(rng.uniform(0, 30000)), 'revenue_sale': 0,
+                                 'logged_at': start + timedelta(days=day)}
+    for lot in range(1, farms * lots_per_farm + 1):
+        for reading in range(days * readings_per_day):
+            yield 'ResourceLog', {'land_id': lot, 'feed_available': round(rng.uniform(0, 500), 1),
+                                  'water_available': round(rng.uniform(0, 200), 1), 'logged_at': start + reading * step}
+
+def populate(**params):
+    """Insert herd_rows(**params) into the app's database; returns the row count of each table.
+
+    Must run inside an app context, on a database without these rows.
+    """
+    import models
+    from derived import refresh_animal_locations, refresh_animal_rollups
+    from logs import rebuild_log_buckets
+
+    db = models.db
+    counts = {}
+    batch, batch_model = [], None
+
+    def flush():
+        if batch:
+            db.session.execute(getattr(models, batch_model).__table__.insert(), batch)
+            batch.clear()
+
+    for model, row in herd_rows(**params):
+        if model != batch_model or len(batch) >= BATCH_ROWS:
+            flush()
+            batch_model = model
+        batch.append(row)
+        counts[model] = counts.get(model, 0) + 1
+    flush()
+    db.session.commit()
+
+    refresh_animal_rollups()
+    refresh_animal_locations()
+    rebuild_log_buckets()
+    for prefix, column in (('RS', models.Registros_Sanitarios.RegistroID), ('MOV', models.Movimientos_Animales.MovID),
+                           ('CAN', models.Pesajes_Canales.CanalID)):
+        last = counts.get(column.class_.__name__, 0)
+        if last:
+            models.advance_sequence(prefix, column, last)
+    db.session.commit()
+    return {getattr(models, model).__tablename__: count for model, count in counts.items()}
+
+def add_arguments(parser):
+    parser.add_argument('--farms', type=int, default=5)
+    parser.add_argument('--lots-per-farm', type=int, default=10)
+    parser.add_argument('--animals', type=int, default=5000)
+    parser.add_argument('--generations', type=int, default=4, help='pedigree depth')
+    parser.add_argument('--days', type=int, default=90, help='length of the logged period')
+    parser.add_argument('--readings-per-day', type=int, default=1, help='emission and resource readings per day')
+    parser.add_argument('--weigh-every-days', type=int, default=7)
+    parser.add_argument('--moves-per-animal', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=42)
+
+def herd_params(args):
+    return {name: getattr(args, name) for name in ('farms', 'lots_per_farm', 'animals', 'generations', 'days',
+                                                    'readings_per_day', 'weigh_every_days', 'moves_per_animal', 'seed')}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to fill (default: DATABASE_URL, else livestock.db)')
+    add_arguments(parser)
+    args = parser.parse_args()
+    if args.database:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+
+    from app import create_app, init_db
+    from models import db, Bovinos
+    with create_app().app_context():
+        init_db()
+        if db.session.query(Bovinos.BovinoID).first() is not None:
+            parser.error('the database already has animals; generate into an empty one')
+        started = time.perf_counter()
+        counts = populate(**herd_params(args))
+    for table, count in counts.items():
+        print(f'  {table}: {count} rows')
+    print(f'Generated in {time.perf_counter() - started:.1f} s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+"""Query plans and timings of the analytics queries before and after the index migrations.
+
+Builds a throwaway SQLite database from the app's models, drops the indexes
+that the migrations manage, fills it with synthetic rows, prints EXPLAIN QUERY
+PLAN and the best of a few runs for each query, then applies
+migrations.migrate() and prints them again.
+
+Usage (from Backend/):
+    python -m benchmarks.query_plans [--lots 200] [--animals 20000] [--logs-per-animal 20]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from migrations import MIGRATIONS, migrate
+
+QUERIES = {
+    'latest weight of an animal': (
+        'SELECT weight_kg FROM weight_logs WHERE animal_id = :animal ORDER BY measured_at DESC LIMIT 1'
+    ),
+    'emission total of an animal': (
+        'SELECT SUM(co2_emissions + methane_emissions) FROM emission_logs WHERE animal_id = :animal'
+    ),
+    'latest health record of an animal': (
+        'SELECT Estado_Salud FROM registros_sanitarios WHERE BovinoID = :animal ORDER BY Fecha_Muestra DESC LIMIT 1'
+    ),
+    'animals on a lot': 'SELECT COUNT(*) FROM bovinos WHERE LoteID = :lot',
+    'latest resources of a lot': (
+        'SELECT feed_available, water_available FROM resource_logs WHERE land_id = :lot ORDER BY logged_at DESC LIMIT 1'
+    ),
+    'carcass weight of a farm': (
+        'SELECT SUM(p.Peso_Canal) FROM pesajes_canales p JOIN bovinos b ON b.BovinoID = p.BovinoID WHERE b.FincaID = :farm'
+    ),
+}
+
+def create_unindexed_schema(path):
+    """Create the model schema in path, then undo the index migrations."""
+    from app import create_app, init_db
+    app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{path}'})
+    with app.app_context():
+        init_db()
+
+    conn = sqlite3.connect(path)
+    for _, _, statements in MIGRATIONS:
+        for statement in statements:
+            if statement.startswith('CREATE INDEX IF NOT EXISTS '):
+                conn.execute('DROP INDEX IF EXISTS ' + statement.split()[5])
+    conn.execute('DELETE FROM schema_version')
+    conn.commit()
+    return conn
+
+def populate(conn, lots, animals, logs_per_animal, seed=42):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    farms = max(1, lots // 20)
+    conn.executemany('INSERT INTO fincas (FincaID, Nombre) VALUES (?, ?)',
+                     [(f, f'Finca {f}') for f in range(1, farms + 1)])
+    conn.executemany('INSERT INTO lotes (LoteID, FincaID, Nombre_Lote) VALUES (?, ?, ?)',
+                     [(l, (l - 1) % farms + 1, f'Lote {l}') for l in range(1, lots + 1)])
+    animal_rows = []
+    for a in range(animals):
+        lot = rng.randint(1, lots)
+        animal_rows.append((f'BOV{a:06d}', (lot - 1) % farms + 1, lot))
+    conn.executemany('INSERT INTO bovinos (BovinoID, FincaID, LoteID) VALUES (?, ?, ?)', animal_rows)
+
+    def readings():
+        for animal_id, _, _ in animal_rows:
+            for i in range(logs_per_animal):
+                yield animal_id, start + timedelta(days=i * 7, minutes=rng.randint(0, 600))
+
+    conn.executemany('INSERT INTO weight_logs (animal_id, weight_kg, measured_at) VALUES (?, ?, ?)',
+                     ((a, rng.uniform(150, 600), t.isoformat(' ')) for a, t in readings()))
+    conn.executemany('INSERT INTO emission_logs (animal_id, co2_emissions, methane_emissions, logged_at) VALUES (?, ?, ?, ?)',
+                     ((a, rng.uniform(0, 10), rng.uniform(0, 2), t.isoformat(' ')) for a, t in readings()))
+    conn.executemany('INSERT INTO registros_sanitarios (RegistroID, BovinoID, Estado_Salud, Fecha_Muestra) VALUES (?, ?, ?, ?)',
+                     ((f'RS{i:07d}', a, rng.choice(['Sano', 'Enfermo']), (start + timedelta(days=rng.randint(0, 365))).isoformat(' '))
+                      for i, (a, _, _) in enumerate(animal_rows)))
+    conn.executemany('INSERT INTO pesajes_canales (CanalID, BovinoID, Peso_Canal) VALUES (?, ?, ?)',
+                     ((f'CAN{i:06d}', a, rng.uniform(150, 350)) for i, (a, _, _) in enumerate(animal_rows) if i % 4 == 0))
+    conn.executemany('INSERT INTO resource_logs (land_id, feed_available, water_available, logged_at) VALUES (?, ?, ?, ?)',
+                     ((lot, rng.uniform(0, 500), rng.uniform(0, 200), (start + timedelta(hours=h)).isoformat(' '))
+                      for lot in range(1, lots + 1) for h in range(0, 24 * 90, 6)))
+    conn.commit()
+    return {'animal': animal_rows[len(animal_rows) // 2][0], 'lot': lots // 2 or 1, 'farm': 1}
+
+def report(conn, params, repeat=5):
+    for name, sql in QUERIES.items():
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            best = min(best, time.perf_counter() - started)
+        print(f'  {name}: {best * 1000:.2f} ms')
+        for step in plan:
+            print(f'      {step}')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lots', type=int, default=200)
+    parser.add_argument('--animals', type=int, default=20000)
+    parser.add_argument('--logs-per-animal', type=int, default=20)
+    args = parser.parse_args()
+
+    fd, path = tempfile.mkstemp(suffix='.db')
+    os.close(fd)
+    conn = create_unindexed_schema(path)
+    try:
+        params = populate(conn, args.lots, args.animals, args.logs_per_animal)
+        conn.execute('ANALYZE')
+        print(f'{args.animals} animals, {args.animals * args.logs_per_animal} weight and emission logs each\n')
+        print('Before migrations:')
+        report(conn, params)
+        migrate(conn, verbose=True)
+        conn.execute('ANALYZE')
+        print('\nAfter migrations:')
+        report(conn, params)
+    finally:
+        conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+if __name__ == '__main__':
+    main()
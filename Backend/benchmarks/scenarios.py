@@ -0,0 +1,241 @@
+"""Request latency, SQL statements and memory of the API on a synthetic herd.
+
+Runs a fixed set of scenarios (CRUD, batches, list pages, analytics, pedigree) through
+the Flask test client against a database filled by benchmarks.herd, and reports
+per scenario the p50/p95/p99 latency, the SQL statements per request (from the
+Server-Timing header the app sets) and the peak Python memory of one request
+(measured with tracemalloc in a separate pass, since tracing slows requests
+down). Results can be written as JSON and compared with the JSON of another
+commit.
+
+Usage (from Backend/):
+    python -m benchmarks.scenarios [herd options, see benchmarks.herd] [--database bench.db]
+                                   [--iterations 50] [--only analytics] [--output results.json]
+                                   [--compare baseline.json]
+
+Without --database the herd is generated into a temporary SQLite file that is
+removed afterwards; with it, an existing database is reused as is, so the data
+is only generated once across runs. Set DATABASE_URL instead to run against
+PostgreSQL.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from benchmarks import herd
+
+QUERY_COUNT = re.compile(r'desc="(\d+) queries"')
+BATCH_SIZE = 100  # animals per request of the batch scenarios
+
+def scenarios(sample):
+    """(group, name, method, path of iteration i, JSON body of iteration i, clear the analytics cache first)."""
+    animal, lot, farm = sample['animal'], sample['lot'], sample['farm']
+    new_animal = lambda i: f'BENCH{i:06d}'
+    batch_animal = lambda i, k: f'BATCH{i:04d}-{k:03d}'
+    return [
+        ('crud', 'create animal', 'POST', lambda i: '/api/bovinos',
+         lambda i: {'BovinoID': new_animal(i), 'FincaID': farm, 'LoteID': lot, 'Sexo': 'F', 'Raza': 'Brahman',
+                    'Fecha_Nac': '2024-01-15', 'MadreID': animal}, False),
+        ('crud', 'get animal', 'GET', lambda i: f'/api/bovinos/{new_animal(i)}', None, False),
+        ('crud', 'update animal', 'PUT', lambda i: f'/api/bovinos/{new_animal(i)}', lambda i: {'Estado': 'Vendido'}, False),
+        ('crud', 'delete animal', 'DELETE', lambda i: f'/api/bovinos/{new_animal(i)}', None, False),
+        # The same writes for BATCH_SIZE animals per request (compare with BATCH_SIZE times the single ones)
+        ('batch', f'create {BATCH_SIZE} animals', 'POST', lambda i: '/api/bovinos/batch',
+         lambda i: {'create': [{'BovinoID': batch_animal(i, k), 'FincaID': farm, 'LoteID': lot, 'Sexo': 'F',
+                                'Raza': 'Brahman', 'Fecha_Nac': '2024-01-15', 'MadreID': animal}
+                               for k in range(BATCH_SIZE)]}, False),
+        ('batch', f'update {BATCH_SIZE} animals', 'POST', lambda i: '/api/bovinos/batch',
+         lambda i: {'update': [{'BovinoID': batch_animal(i, k), 'Estado': 'Vendido'} for k in range(BATCH_SIZE)]}, False),
+        ('batch', f'delete {BATCH_SIZE} animals', 'POST', lambda i: '/api/bovinos/batch',
+         lambda i: {'delete': [batch_animal(i, k) for k in range(BATCH_SIZE)]}, False),
+        ('list', 'animals page', 'GET', lambda i: '/api/bovinos?limit=100', None, False),
+        ('list', 'animals of a farm', 'GET', lambda i: f'/api/bovinos?FincaID={farm}', None, False),
+        ('list', 'weight logs of an animal', 'GET', lambda i: f'/api/weight_logs?BovinoID={animal}', None, False),
+        ('list', 'emission logs page', 'GET', lambda i: '/api/emission_logs?limit=500', None, False),
+        ('list', 'animals, largest page', 'GET', lambda i: '/api/bovinos?limit=1000', None, False),
+        ('list', 'lots', 'GET', lambda i: '/api/lotes', None, False),
+        ('list', 'bootstrap', 'GET', lambda i: '/api/bootstrap', None, False),
+        ('analytics', 'animal', 'GET', lambda i: f'/api/analytics/animal/{animal}', None, True),
+        ('analytics', 'animal (cached)', 'GET', lambda i: f'/api/analytics/animal/{animal}', None, False),
+        ('analytics', 'land', 'GET', lambda i: f'/api/analytics/land/{lot}', None, True),
+        ('analytics', 'farm', 'GET', lambda i: f'/api/analytics/farm/{farm}', None, True),
+        ('analytics', 'farm (cached)', 'GET', lambda i: f'/api/analytics/farm/{farm}', None, False),
+        ('analytics', 'daily gain of a farm', 'GET', lambda i: f'/api/analytics/adg?FincaID={farm}', None, False),
+        ('analytics', 'weight series by week', 'GET',
+         lambda i: f'/api/analytics/animal/{animal}/series?metric=weight_kg&bucket=week', None, False),
+        ('analytics', 'land emissions by day', 'GET',
+         lambda i: f'/api/analytics/land/{lot}/series?metric=co2_emissions,methane_emissions&bucket=day', None, False),
+        ('pedigree', 'ancestors', 'GET', lambda i: f'/api/bovinos/{animal}/ancestors', None, False),
+        ('pedigree', 'inbreeding', 'GET', lambda i: f'/api/bovinos/{animal}/inbreeding', None, False),
+    ]
+
+def pick_sample(app):
+    """An animal of the youngest generation (deepest pedigree) and its lot and farm."""
+    from models import db, Bovinos
+    with app.app_context():
+        row = db.session.execute(
+            db.select(Bovinos.BovinoID, Bovinos.LoteID, Bovinos.FincaID)
+            .where(Bovinos.MadreID.is_not(None))
+            .order_by(Bovinos.Fecha_Nac.desc(), Bovinos.BovinoID).limit(1)
+        ).first() or db.session.execute(db.select(Bovinos.BovinoID, Bovinos.LoteID, Bovinos.FincaID).limit(1)).first()
+    return {'animal': row.BovinoID, 'lot': row.LoteID, 'farm': row.FincaID}
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_scenario(app, client, scenario, iterations, warmup, memory_iterations):
+    _, _, method, path, body, cold = scenario
+    latencies, queries, peaks = [], [], []
+    errors = 0
+    log = io.StringIO()
+    for i in range(warmup + iterations + memory_iterations):
+        if cold:
+            app.extensions['analytics_cache'].clear()
+        traced = i >= warmup + iterations
+        if traced:
+            tracemalloc.start()
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(log):
+            response = client.open(path(i), method=method, json=body(i) if body else None)
+        elapsed = time.perf_counter() - started
+        if traced:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        elif i >= warmup:
+            latencies.append(elapsed)
+            match = QUERY_COUNT.search(response.headers.get('Server-Timing', ''))
+            queries.append(int(match.group(1)) if match else 0)
+            errors += response.status_code >= 400
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'queries_per_request': round(sum(queries) / len(queries), 1),
+        'max_queries': max(queries),
+        'peak_memory_kib': round(max(peaks) / 1024, 1) if peaks else None,
+        'errors': errors,
+        'nplusone_warnings': log.getvalue().count('Possible N+1 query'),
+    }
+
+def commit_id():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results):
+    print(f"{'scenario':<38}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'peak KiB':>10}")
+    for name, result in results['scenarios'].items():
+        peak = result['peak_memory_kib']
+        flags = (f"  {result['errors']} errors" if result['errors'] else '') + \
+                (f"  {result['nplusone_warnings']} N+1 warnings" if result['nplusone_warnings'] else '')
+        print(f"{name:<38}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+              f"{result['queries_per_request']:>9g}{peak if peak is not None else '-':>10}{flags}")
+
+def print_comparison(baseline, results):
+    print(f"\nCompared with {baseline.get('commit') or 'baseline'} ({baseline.get('date', '?')}):")
+    print(f"{'scenario':<38}{'p50 ms':>20}{'p95 ms':>20}{'queries':>14}")
+    for name, result in results['scenarios'].items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f'{name:<38}  (new)')
+            continue
+        cells = []
+        for key in ('p50_ms', 'p95_ms'):
+            change = (result[key] / before[key] - 1) * 100 if before[key] else 0
+            cells.append(f'{before[key]:.2f} -> {result[key]:.2f} {change:+4.0f}%')
+        print(f"{name:<38}{cells[0]:>20}{cells[1]:>20}"
+              f"{before['queries_per_request']:>6g} -> {result['queries_per_request']:<5g}")
+    for name in baseline['scenarios']:
+        if name not in results['scenarios']:
+            print(f'{name:<38}  (not run)')
+    if baseline.get('params') != results['params']:
+        print('Note: the runs used different herd or iteration parameters')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', help='SQLite file to use, generated when it has no animals yet')
+    herd.add_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--memory-iterations', type=int, default=3)
+    parser.add_argument('--only', action='append', help='run only this group or scenario (repeatable)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare with')
+    args = parser.parse_args()
+
+    path = None
+    if args.database:
+        os.environ['DATABASE_URL'] = f'sqlite:///{os.path.abspath(args.database)}'
+    elif not os.environ.get('DATABASE_URL'):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        os.environ['DATABASE_URL'] = f'sqlite:///{path}'
+    try:
+        from app import create_app, init_db
+        from models import db, Bovinos
+        app = create_app()
+        params = herd.herd_params(args)
+        with app.app_context():
+            init_db()
+            if db.session.query(Bovinos.BovinoID).first() is None:
+                started = time.perf_counter()
+                counts = herd.populate(**params)
+                print(f"Generated {sum(counts.values())} rows in {time.perf_counter() - started:.1f} s")
+            else:
+                print('Using the animals already in the database; herd options are ignored')
+                params = None
+            dialect = db.engine.dialect.name
+
+        sample = pick_sample(app)
+        selected = [scenario for scenario in scenarios(sample)
+                    if not args.only or scenario[0] in args.only or scenario[1] in args.only]
+        if not selected:
+            parser.error('--only matches no scenario')
+        client = app.test_client()
+        results = {
+            'commit': commit_id(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'database': dialect,
+            'params': {'herd': params, 'iterations': args.iterations, 'warmup': args.warmup},
+            'sample': sample,
+            'scenarios': {},
+        }
+        for scenario in selected:
+            name = f'{scenario[0]}: {scenario[1]}'
+            results['scenarios'][name] = run_scenario(app, client, scenario, args.iterations, args.warmup,
+                                                      args.memory_iterations)
+    finally:
+        if path:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(results, file, indent=2)
+        print(f'\nResults written to {args.output}')
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            print_comparison(json.load(file), results)
+    if any(result['errors'] for result in results['scenarios'].values()):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
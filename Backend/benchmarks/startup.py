@@ -0,0 +1,76 @@
+"""Cold-start time of the app and the cost of a fresh app per test.
+
+Reports, each as the median of a few runs:
+  import     importing the app module in a new interpreter (models, blueprints and
+             their dependencies), measured in a subprocess so nothing is cached
+  create     create_app() without touching the database
+  init-db    init_db() on an empty in-memory SQLite database
+  first      the first request of a new app (a list page and an analytics page)
+  per-test   create_app() + init_db() on in-memory SQLite + one request, the setup a
+             test using its own throwaway database pays
+
+Usage (from Backend/):
+    python -m benchmarks.startup [--runs 5] [--blueprints herd,analytics]
+
+--blueprints registers only those blueprints, to see what a test of one area pays.
+"""
+import argparse
+import contextlib
+import io
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_SCRIPT = 'import time; started = time.perf_counter(); import app; print(time.perf_counter() - started)'
+
+def import_time():
+    output = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True, check=True).stdout
+    return float(output.split()[-1])
+
+def measure(config):
+    """Seconds spent by each step of a fresh app on an in-memory database."""
+    from app import create_app, init_db
+
+    timings = {}
+    started = time.perf_counter()
+    # create_app() prints the SQLite profile it applies
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app(config)
+    timings['create'] = time.perf_counter() - started
+
+    with app.app_context():
+        started = time.perf_counter()
+        init_db()
+        timings['init-db'] = time.perf_counter() - started
+
+        client = app.test_client()
+        started = time.perf_counter()
+        client.get('/api/bovinos')
+        client.get('/api/analytics/farm/1')
+        timings['first'] = time.perf_counter() - started
+    timings['per-test'] = timings['create'] + timings['init-db'] + timings['first']
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--blueprints', help='comma-separated blueprints to register (default: all)')
+    args = parser.parse_args()
+
+    config = {'SQLALCHEMY_DATABASE_URI': 'sqlite://', 'TESTING': True}
+    if args.blueprints:
+        config['BLUEPRINTS'] = tuple(args.blueprints.split(','))
+
+    results = {'import': [import_time() for _ in range(args.runs)]}
+    measure(config)  # the first run also pays for importing the modules
+    for _ in range(args.runs):
+        for step, seconds in measure(config).items():
+            results.setdefault(step, []).append(seconds)
+
+    for step, values in results.items():
+        print(f'{step:<10}{statistics.median(values) * 1000:>10.1f} ms   (min {min(values) * 1000:.1f}, '
+              f'max {max(values) * 1000:.1f})')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""Analytics endpoints (animal, land, farm, daily gain, time series) and log maintenance."""
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, current_app, jsonify, request
+
+from derived import cached_analytics, parse_lot_id, stays_at
+from growth import daily_gain_by_animal, mean_gain_by
+from logs import (
+    BUCKET_ENTITIES, BUCKET_METRICS, BUCKET_SIZES, BULK_LOG_SPECS, bucket_start,
+    maintain_log_storage, packed_log_spec, rebuild_log_buckets
+)
+from models import (
+    db, AnimalLocation, AnimalRollup, Bovinos, Fincas, LogBucket, LogChunk, Lotes, Pesajes_Canales,
+    ResourceLog, WeightLog
+)
+
+bp = Blueprint('analytics', __name__, cli_group=None)
+
+@bp.cli.command('rebuild-log-buckets')
+@click.argument('tables', nargs=-1, type=click.Choice(list(BULK_LOG_SPECS)))
+def rebuild_log_buckets_command(tables):
+    """Recompute the day/week/month buckets of the log tables (all of them by default)."""
+    rebuild_log_buckets(tables or None)
+    db.session.commit()
+    print(f'Rebuilt {db.session.query(LogBucket).count()} log buckets')
+
+@bp.cli.command('compact-log-buckets')
+@click.option('--days', default=400, show_default=True, help='Keep day buckets of the last N days.')
+@click.option('--weeks', default=260, show_default=True, help='Keep week buckets of the last N weeks.')
+def compact_log_buckets_command(days, weeks):
+    """Delete old day and week buckets; month buckets are always kept."""
+    now = datetime.utcnow()
+    deleted = 0
+    for size, cutoff in (('day', bucket_start(now - timedelta(days=days), 'day')),
+                         ('week', bucket_start(now - timedelta(weeks=weeks), 'week'))):
+        deleted += db.session.execute(LogBucket.__table__.delete().where(
+            LogBucket.bucket == size, LogBucket.bucket_start < cutoff)).rowcount
+    db.session.commit()
+    print(f'Deleted {deleted} day and week buckets')
+
+@bp.route('/api/analytics/<string:entity>/<string:id>/series', methods=['GET'])
+def get_log_series(entity, id):
+    # ?metric=weight_kg[,co2_emissions...]&bucket=day|week|month&date_from=&date_to=
+    if entity not in BUCKET_ENTITIES:
+        return jsonify({'error': f'Unknown entity {entity}'}), 404
+    args = request.args
+    metrics = [metric for metric in args.get('metric', '').split(',') if metric]
+    unknown = [metric for metric in metrics if metric not in BUCKET_METRICS]
+    if not metrics or unknown:
+        return jsonify({'error': f"metric must be one or more of {', '.join(BUCKET_METRICS)}"}), 400
+    size = args.get('bucket', 'day')
+    if size not in BUCKET_SIZES:
+        return jsonify({'error': f"bucket must be one of {', '.join(BUCKET_SIZES)}"}), 400
+    try:
+        date_from = datetime.fromisoformat(args['date_from']) if args.get('date_from') else None
+        date_to = datetime.fromisoformat(args['date_to']) if args.get('date_to') else None
+    except ValueError:
+        return jsonify({'error': 'date_from and date_to must be ISO dates'}), 400
+    model = BUCKET_ENTITIES[entity]
+    key = id if model is Bovinos else parse_lot_id(id)  # lots and farms have integer IDs
+    if key is None or db.session.get(model, key) is None:
+        return jsonify({'error': f'{entity} {id} not found'}), 404
+
+    query = (db.select(LogBucket)
+             .where(LogBucket.metric.in_(metrics), LogBucket.entity == entity,
+                    LogBucket.entity_id == str(key), LogBucket.bucket == size)
+             .order_by(LogBucket.metric, LogBucket.bucket_start))
+    if date_from:
+        query = query.where(LogBucket.bucket_start >= bucket_start(date_from, size))
+    if date_to:
+        query = query.where(LogBucket.bucket_start <= date_to)
+    series = {metric: [] for metric in metrics}
+    for bucket in db.session.scalars(query):
+        series[bucket.metric].append({
+            'start': bucket.bucket_start.isoformat(),
+            'count': bucket.count,
+            'sum': bucket.total,
+            'mean': bucket.total / bucket.count,
+            'min': bucket.min_value,
+            'max': bucket.max_value,
+            'last': bucket.last_value,
+            'last_at': bucket.last_at.isoformat(),
+        })
+    return jsonify({'entity': entity, 'id': key, 'bucket': size, 'series': series})
+
+@bp.cli.command('pack-logs')
+def pack_logs_command():
+    """Pack, merge and downsample the emission and resource logs now (whatever LOG_STORAGE says)."""
+    for name, (packed, rewritten) in maintain_log_storage().items():
+        print(f'{name}: {packed} readings packed, {rewritten} chunks merged or downsampled')
+
+def run_log_maintenance(app):
+    while True:
+        with app.app_context():
+            try:
+                maintain_log_storage()
+            except Exception as e:
+                db.session.rollback()
+                print(f'Log maintenance failed: {e}')
+        time.sleep(app.config['LOG_MAINTENANCE_INTERVAL'])
+
+@bp.before_app_request
+def start_log_maintenance():
+    # Each app packs in the background once it serves its first request; the thread is
+    # kept in app.extensions (setdefault decides which thread starts when two requests race)
+    if 'log_maintenance' not in current_app.extensions and current_app.config['LOG_STORAGE'] == 'packed':
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=run_log_maintenance, args=(app,), name='log-maintenance', daemon=True)
+        if app.extensions.setdefault('log_maintenance', thread) is thread:
+            thread.start()
+
+# Analytics
+def compute_animal_analytics(id):
+    # 404 unless the animal exists
+    db.get_or_404(Bovinos, id)
+
+    # Latest weight, cumulative emissions/costs/revenue, latest health and carcass data
+    # all come from the animal's rollup row, maintained when those records are written
+    rollup = db.session.get(AnimalRollup, id) or AnimalRollup(total_emissions=0, total_costs=0, total_revenue=0)
+
+    # Determine animal health status based on latest weight and health records
+    # Status logic: Check health records first, then weight as secondary indicator
+    # Priority: Health records > Weight threshold > Default healthy
+    status = 'healthy'
+    if rollup.latest_health == 'Enfermo':
+        status = 'sick'
+    elif rollup.latest_weight_kg is not None and rollup.latest_weight_kg < 100:  # arbitrary threshold based on typical cattle weights
+        status = 'underweight'
+
+    # Calculate estimated energy consumption
+    # Formula: energy_consumption = weight_kg * 0.5 (arbitrary multiplier for demonstration)
+    # This represents daily energy requirements in some unit (e.g., MJ or kcal)
+    # In a real system, this would use breed-specific metabolic formulas
+    energy_consumption = (rollup.latest_weight_kg or 0) * 0.5
+
+    # Calculate meat yield if animal has been slaughtered
+    # This shows the efficiency of converting live weight to usable meat
+    meat_yield = None
+    if rollup.carcass_weight_kg is not None or rollup.slaughter_date is not None:
+        meat_yield = {
+            'carcass_weight_kg': rollup.carcass_weight_kg,
+            'live_weight_kg': rollup.carcass_live_weight_kg,
+            'yield_percentage': rollup.carcass_yield_percent,
+            'slaughter_date': rollup.slaughter_date.isoformat() if rollup.slaughter_date else None
+        }
+
+    # Regression-based average daily gain over the configured window
+    avg_daily_gain = compute_daily_gain(animal_ids=[id])['animals'].get(id)
+
+    return {
+        'animal_id': id,
+        'status': status,
+        'latest_weight': rollup.latest_weight_kg,
+        'avg_daily_gain_kg': avg_daily_gain,
+        'total_emissions': rollup.total_emissions,
+        'total_costs': rollup.total_costs,
+        'total_revenue': rollup.total_revenue,
+        'energy_consumption': energy_consumption,
+        'meat_yield': meat_yield
+    }
+
+@bp.route('/api/analytics/animal/<string:id>', methods=['GET'])
+def get_animal_analytics(id):
+    return cached_analytics(f'animal:{id}', lambda: compute_animal_analytics(id))
+
+# Analytics engine
+# Land and farm figures are computed for a whole set of lots at once, with one
+# grouped query per figure (GROUP BY LoteID / FincaID), so the cost does not grow
+# with the number of lots. The functions return plain dicts that the endpoints
+# serialize and that batch jobs can reuse directly.
+LOW_FEED_THRESHOLD = 100  # arbitrary threshold for feed availability
+LOW_WATER_THRESHOLD = 50  # arbitrary threshold for water availability
+
+def _lot_selection(land_ids=None, farm_ids=None):
+    query = db.select(Lotes.LoteID, Lotes.FincaID).order_by(Lotes.LoteID)
+    if land_ids is not None:
+        query = query.where(Lotes.LoteID.in_(land_ids))
+    if farm_ids is not None:
+        query = query.where(Lotes.FincaID.in_(farm_ids))
+    return query
+
+def day_number(column):
+    """Timestamp column as a float number of days, for regressions over time."""
+    if db.engine.dialect.name == 'sqlite':
+        return db.func.julianday(column)
+    return db.extract('epoch', column) / 86400.0
+
+def compute_daily_gain(land_ids=None, farm_ids=None, animal_ids=None, window_days=None):
+    """Average daily gain (kg/day) per animal, lot and farm for the selected animals.
+
+    The weight logs of every selected animal are loaded in one query and fitted
+    together (see growth.daily_gain_by_animal). Lot and farm figures are the mean
+    gain of the animals currently assigned to them.
+    """
+    if window_days is None:
+        window_days = current_app.config['ADG_WINDOW_DAYS']
+    animals = db.select(Bovinos.BovinoID, Bovinos.LoteID, Bovinos.FincaID)
+    if land_ids is not None:
+        animals = animals.where(Bovinos.LoteID.in_(land_ids))
+    if farm_ids is not None:
+        animals = animals.where(Bovinos.FincaID.in_(farm_ids))
+    if animal_ids is not None:
+        animals = animals.where(Bovinos.BovinoID.in_(animal_ids))
+    assignments = db.session.execute(animals).all()
+
+    rows = db.session.execute(
+        db.select(WeightLog.animal_id, day_number(WeightLog.measured_at), WeightLog.weight_kg)
+        # Weighings without a date or a weight would make the fit NaN (invalid JSON)
+        .where(WeightLog.animal_id.in_(animals.with_only_columns(Bovinos.BovinoID)),
+               WeightLog.measured_at.is_not(None), WeightLog.weight_kg.is_not(None))
+        .order_by(WeightLog.animal_id)
+    ).all()
+    gains = daily_gain_by_animal(rows, window_days)
+    return {
+        'window_days': window_days,
+        'animals': gains,
+        'lots': mean_gain_by(gains, ((a.BovinoID, a.LoteID) for a in assignments)),
+        'farms': mean_gain_by(gains, ((a.BovinoID, a.FincaID) for a in assignments))
+    }
+
+def compute_land_analytics(land_ids=None, farm_ids=None, at=None):
+    """Return {LoteID: analytics dict} for the given lots, the lots of the given farms, or every lot.
+
+    at: count the animals that were on each lot at that moment instead of the current ones.
+    """
+    selection = _lot_selection(land_ids, farm_ids)
+    lots = db.session.execute(selection).all()
+    if not lots:
+        return {}
+    lot_ids = db.select(selection.subquery().c.LoteID)
+
+    # Headcount of animals currently assigned to each lot, or on it at the requested moment
+    if at is None:
+        animal_counts = dict(db.session.execute(
+            db.select(Bovinos.LoteID, db.func.count(Bovinos.BovinoID))
+            .where(Bovinos.LoteID.in_(lot_ids))
+            .group_by(Bovinos.LoteID)
+        ).all())
+    else:
+        animal_counts = dict(db.session.execute(
+            db.select(AnimalLocation.LoteID, db.func.count(AnimalLocation.BovinoID))
+            .where(AnimalLocation.LoteID.in_(lot_ids), stays_at(at))
+            .group_by(AnimalLocation.LoteID)
+        ).all())
+
+    # Most recent resource log per lot
+    ranked = db.select(
+        ResourceLog.land_id,
+        ResourceLog.feed_available,
+        ResourceLog.water_available,
+        ResourceLog.logged_at,
+        ResourceLog.id,
+        db.func.row_number().over(
+            partition_by=ResourceLog.land_id,
+            order_by=(ResourceLog.logged_at.desc(), ResourceLog.id.desc())
+        ).label('rank')
+    ).where(ResourceLog.land_id.in_(lot_ids)).subquery()
+    latest_resources = {
+        row.land_id: row._asdict() for row in db.session.execute(
+            db.select(ranked.c.land_id, ranked.c.feed_available, ranked.c.water_available, ranked.c.logged_at, ranked.c.id)
+            .where(ranked.c.rank == 1)
+        )
+    }
+    if packed_log_spec(ResourceLog):
+        # The lot's latest reading may be in its newest chunk instead
+        ranked_chunks = db.select(
+            LogChunk.parent_id,
+            LogChunk.last_values,
+            LogChunk.last_at,
+            LogChunk.last_id,
+            db.func.row_number().over(
+                partition_by=LogChunk.parent_id,
+                order_by=(LogChunk.last_at.desc(), LogChunk.last_id.desc())
+            ).label('rank')
+        ).where(LogChunk.log_table == 'resource_logs',
+                LogChunk.parent_id.in_(db.select(db.cast(lot_ids.subquery().c.LoteID, db.String)))).subquery()
+        for chunk in db.session.execute(db.select(ranked_chunks).where(ranked_chunks.c.rank == 1)):
+            land_id = int(chunk.parent_id)
+            current = latest_resources.get(land_id)
+            if current is None or (current['logged_at'] or datetime.min, current['id']) < (chunk.last_at, chunk.last_id):
+                latest_resources[land_id] = {**chunk.last_values, 'logged_at': chunk.last_at, 'id': chunk.last_id}
+
+    # Carcass weight of the animals currently on each lot
+    meat_by_lot = dict(db.session.execute(
+        db.select(Bovinos.LoteID, db.func.sum(Pesajes_Canales.Peso_Canal))
+        .join(Bovinos, Bovinos.BovinoID == Pesajes_Canales.BovinoID)
+        .where(Bovinos.LoteID.in_(lot_ids))
+        .group_by(Bovinos.LoteID)
+    ).all())
+
+    # Mean regression-based daily gain of the animals on each lot
+    gain_by_lot = compute_daily_gain(land_ids=land_ids, farm_ids=farm_ids)['lots']
+
+    analytics = {}
+    for lote_id, finca_id in lots:
+        resources = latest_resources.get(lote_id)
+        low_resources = []
+        if resources:
+            if resources['feed_available'] is not None and resources['feed_available'] < LOW_FEED_THRESHOLD:
+                low_resources.append('feed')
+            if resources['water_available'] is not None and resources['water_available'] < LOW_WATER_THRESHOLD:
+                low_resources.append('water')
+        analytics[lote_id] = {
+            'land_id': lote_id,
+            'farm_id': finca_id,
+            'status': 'good' if not low_resources else 'low_resources',
+            'low_resources': low_resources,
+            'animal_count': animal_counts.get(lote_id, 0),
+            'latest_feed': resources['feed_available'] if resources else None,
+            'latest_water': resources['water_available'] if resources else None,
+            'total_meat_produced_kg': meat_by_lot.get(lote_id) or 0,
+            'avg_daily_weight_gain_kg': gain_by_lot.get(lote_id) or 0
+        }
+    return analytics
+
+def compute_farm_analytics(farm_ids=None, at=None):
+    """Return {FincaID: analytics dict} for the given farms, or for every farm (headcounts as of at, if given)."""
+    farms = db.select(Fincas.FincaID).order_by(Fincas.FincaID)
+    if farm_ids is not None:
+        farms = farms.where(Fincas.FincaID.in_(farm_ids))
+    farm_list = db.session.scalars(farms).all()
+    if not farm_list:
+        return {}
+
+    lands_by_farm = {farm_id: [] for farm_id in farm_list}
+    for land in compute_land_analytics(farm_ids=farm_ids, at=at).values():
+        lands_by_farm[land['farm_id']].append(land)
+
+    # Carcass totals and average yield of the animals registered on each farm
+    carcass_by_farm = {
+        row.FincaID: row for row in db.session.execute(
+            db.select(
+                Bovinos.FincaID,
+                db.func.sum(Pesajes_Canales.Peso_Canal).label('total_meat'),
+                db.func.avg(Pesajes_Canales.Rendimiento).label('avg_yield')
+            )
+            .join(Bovinos, Bovinos.BovinoID == Pesajes_Canales.BovinoID)
+            .where(Bovinos.FincaID.in_(farms))
+            .group_by(Bovinos.FincaID)
+        )
+    }
+
+    analytics = {}
+    for farm_id in farm_list:
+        lands = lands_by_farm[farm_id]
+        carcass = carcass_by_farm.get(farm_id)
+        # A farm needs attention as soon as any of its lands is low on resources
+        needs_attention = any(land['low_resources'] for land in lands)
+        analytics[farm_id] = {
+            'farm_id': farm_id,
+            'status': 'good' if not needs_attention else 'attention_needed',
+            'total_lands': len(lands),
+            'total_animals': sum(land['animal_count'] for land in lands),
+            'total_meat_production_kg': (carcass.total_meat if carcass else None) or 0,
+            'average_carcass_yield_percent': (carcass.avg_yield if carcass else None) or 0,
+            'lands_status': lands
+        }
+    return analytics
+
+@bp.route('/api/analytics/land/<int:id>', methods=['GET'])
+def get_land_analytics(id):
+    try:
+        at = datetime.fromisoformat(request.args['at']) if request.args.get('at') else None
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO date'}), 400
+
+    def compute():
+        db.get_or_404(Lotes, id)
+        return compute_land_analytics(land_ids=[id], at=at)[id]
+    return cached_analytics(f'land:{id}', compute)
+
+@bp.route('/api/analytics/adg', methods=['GET'])
+def get_daily_gain():
+    # Optional FincaID / LoteID / BovinoID filters and a window_days override
+    args = request.args
+    try:
+        gain = compute_daily_gain(
+            land_ids=[int(args['LoteID'])] if args.get('LoteID') else None,
+            farm_ids=[int(args['FincaID'])] if args.get('FincaID') else None,
+            animal_ids=[args['BovinoID']] if args.get('BovinoID') else None,
+            window_days=float(args['window_days']) if args.get('window_days') else None
+        )
+    except ValueError:
+        return jsonify({'error': 'LoteID and FincaID must be integers and window_days a number'}), 400
+    return jsonify(gain)
+
+@bp.route('/api/analytics/farm/<int:id>', methods=['GET'])
+def get_farm_analytics(id):
+    try:
+        at = datetime.fromisoformat(request.args['at']) if request.args.get('at') else None
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO date'}), 400
+
+    def compute():
+        db.get_or_404(Fincas, id)
+        return compute_farm_analytics(farm_ids=[id], at=at)[id]
+    return cached_analytics(f'farm:{id}', compute)
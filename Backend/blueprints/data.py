@@ -0,0 +1,451 @@
+"""Reference data, bulk import and CSV/NDJSON export."""
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from datetime import datetime
+from itertools import islice
+
+import click
+from flask import Blueprint, current_app, jsonify, request, stream_with_context
+from werkzeug.utils import secure_filename
+
+from blueprints.jobs import JOB_KINDS, enqueue_job, job_accepted
+from derived import analytics_cache, invalidate_analytics, refresh_animal_locations, refresh_animal_rollups
+from importer import coerce_cell, match_columns, read_sheets
+from listing import ListQueryError, list_query, list_rows, serialize_value
+from logs import BULK_LOG_SPECS, insert_log_batch, validate_log_row
+from models import (
+    db, Alimentacion, Bovinos, Certificados, Compras, Documentos_Exportacion, EmissionLog,
+    Energia_Sostenibilidad, FinanceLog, Fincas, Ingredientes_Racion, Insumos, Lotes,
+    Movimientos_Animales, Pesajes_Canales, Proveedores, Racion_Animal, Registros_Sanitarios,
+    ResourceLog, Usuario_Finca, Usuarios, Ventas, WeightLog, advance_sequence, next_sequence_value, table_versions
+)
+
+bp = Blueprint('data', __name__, cli_group=None)
+
+# Lookups
+# The page fills its <select> options (and the short lists of the reference tables) from
+# /api/bootstrap: a few columns of every reference table, one array of values per row in
+# the order of "fields", id and label first. Each set carries a version, the hash of its
+# rows; a client sending the versions it holds only downloads the sets that changed.
+# Sets are kept in analytics_cache under their table's change counter (models.table_versions),
+# so a write committed by any process is seen by all of them on their next request.
+LOOKUP_SETS = {
+    'fincas': (Fincas, ['FincaID', 'Nombre', 'Depto', 'Municipio', 'Uso_Suelo', 'Area_ha']),
+    'lotes': (Lotes, ['LoteID', 'Nombre_Lote', 'FincaID', 'Area_ha', 'Actividad_Ganado']),
+    'bovinos': (Bovinos, ['BovinoID', 'Raza', 'Estado', 'FincaID', 'LoteID', 'Fecha_Nac']),
+    'proveedores': (Proveedores, ['ProveedorID', 'Nombre', 'Correo', 'Telefono']),
+    'insumos': (Insumos, ['InsumoID', 'Nombre', 'Categoria', 'Unidad', 'Precio_Unit']),
+    'alimentacion': (Alimentacion, ['RacionID', 'Nombre_Racion', 'Tipo', 'Objetivo']),
+}
+
+def lookup_set(name, table_version):
+    """(version, JSON array of rows) of a lookup set whose table is at table_version."""
+    model = LOOKUP_SETS[name][0]
+    key = f'lookup:{name}:{table_version}'
+    entry = analytics_cache.get(key, '')
+    if entry is None:
+        fields = LOOKUP_SETS[name][1]
+        columns = [getattr(model, field) for field in fields]
+        rows = db.session.execute(db.select(*columns).order_by(columns[0]))
+        body = json.dumps([[serialize_value(value) for value in row] for row in rows],
+                          ensure_ascii=False, separators=(',', ':')).encode()
+        entry = (hashlib.sha1(body).hexdigest()[:16], body)
+        # Rows read after a write of this transaction may yet be rolled back
+        if model.__tablename__ not in db.session.info.get('changed_tables', ()):
+            analytics_cache.set(key, '', entry)
+    return entry
+
+@bp.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    # sets=fincas,bovinos limits the response (default: every set);
+    # versions=fincas:<version>,... names the versions the client already has
+    names = [name.strip() for name in request.args.get('sets', '').split(',') if name.strip()] or list(LOOKUP_SETS)
+    unknown = [name for name in names if name not in LOOKUP_SETS]
+    if unknown:
+        return jsonify({'error': f"Unknown sets: {', '.join(unknown)}"}), 400
+    known = dict(pair.partition(':')[::2] for pair in request.args.get('versions', '').split(',') if pair)
+
+    # The cached row arrays are spliced into the response as they are
+    table_version = table_versions([LOOKUP_SETS[name][0].__tablename__ for name in names])
+    parts = []
+    for name in names:
+        version, rows = lookup_set(name, table_version[LOOKUP_SETS[name][0].__tablename__])
+        if known.get(name) == version:
+            parts.append(json.dumps({name: {'version': version}})[1:-1].encode())
+        else:
+            head = json.dumps({name: {'version': version, 'fields': LOOKUP_SETS[name][1]}})[1:-2].encode()
+            parts.append(head + b', "rows": ' + rows + b'}')
+    response = current_app.response_class(b'{' + b', '.join(parts) + b'}', mimetype='application/json')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+# Bulk import
+# Onboarding a farm from a workbook in the relaciones_ganaderia.xlsx layout, or from
+# one CSV file per table (see importer.py). Tables are loaded parents first, every
+# row is validated on its own and the valid ones are inserted with executemany,
+# committing every IMPORT_BATCH_SIZE rows, so progress is kept and reported as it goes.
+IMPORT_BATCH_SIZE = 5000
+MAX_IMPORT_ERRORS = 100  # errors listed per table in the summary, the rest are only counted
+
+# Tables in foreign key order: each one only references tables listed before it
+# (bovino MadreID/PadreID links are set once the whole bovinos sheet is loaded)
+IMPORT_TABLES = [
+    Fincas, Lotes, Proveedores, Insumos, Alimentacion, Ingredientes_Racion, Usuarios, Usuario_Finca,
+    Bovinos, Registros_Sanitarios, Movimientos_Animales, Pesajes_Canales, Compras, Ventas, Racion_Animal,
+    Energia_Sostenibilidad, Documentos_Exportacion, Certificados,
+    WeightLog, EmissionLog, FinanceLog, ResourceLog,
+]
+
+# Prefixes of the IDs generated for rows that leave their ID blank, as in the create endpoints
+IMPORT_ID_PREFIXES = {
+    Registros_Sanitarios: 'RS', Movimientos_Animales: 'MOV', Pesajes_Canales: 'CAN', Proveedores: 'PRO',
+    Insumos: 'INS', Compras: 'COM', Alimentacion: 'Alim-', Ventas: 'Ve-', Ingredientes_Racion: 'ING',
+    Racion_Animal: 'animalalim-',
+}
+
+# Tables whose rows feed the animal rollups (the log tables go through BULK_LOG_SPECS)
+IMPORT_ROLLUP_TABLES = (Registros_Sanitarios, Pesajes_Canales)
+# Tables whose rows change the animals' lot history
+IMPORT_LOCATION_TABLES = (Bovinos, Movimientos_Animales)
+
+def reject_import_row(result, row, message):
+    result['rejected'] += 1
+    if len(result['errors']) < MAX_IMPORT_ERRORS:
+        result['errors'].append({'row': row, 'error': message})
+
+def validate_import_row(model, columns, values):
+    """Turn a sheet row into an insert dict; columns are the matched column names (None to skip)."""
+    table = model.__table__
+    row = {}
+    for name, value in zip(columns, values):
+        if name is None:
+            continue
+        try:
+            row[name] = coerce_cell(value, table.c[name].type.python_type)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {name}: {value}')
+    for column in table.c:
+        if row.get(column.name) is None and not column.nullable:
+            if column.primary_key and model in IMPORT_ID_PREFIXES:
+                row[column.name] = None  # generated when the batch is inserted
+            else:
+                raise ValueError(f'{column.name} is required')
+    return row
+
+def validate_log_import_row(model, columns, values):
+    """Sheet row of a log table, checked like a bulk ingest item (validate_log_row)."""
+    table = model.__table__
+    item = {}
+    for name, value in zip(columns, values):
+        if name is None:
+            continue
+        try:
+            value = coerce_cell(value, table.c[name].type.python_type)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {name}: {value}')
+        if value is not None:
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+    return validate_log_row(item, BULK_LOG_SPECS[table.name])
+
+def insert_import_batch(model, batch, result, links):
+    """Check the IDs and parents of a validated batch, insert the valid rows and return them.
+
+    Self references (MadreID/PadreID) are inserted empty and queued in links.
+    """
+    table = model.__table__
+    pk = table.primary_key.columns[0]
+    prefix = IMPORT_ID_PREFIXES.get(model)
+    if prefix:
+        # Keep the ID counter ahead of imported IDs, then number the rows without one
+        highest = max((int(row[pk.name][len(prefix):]) for _, row in batch
+                       if row[pk.name] and row[pk.name].startswith(prefix) and row[pk.name][len(prefix):].isdigit()),
+                      default=0)
+        if highest:
+            advance_sequence(prefix, pk, highest)
+        missing = [row for _, row in batch if row[pk.name] is None]
+        if missing:
+            first = next_sequence_value(prefix, pk, len(missing))
+            for offset, row in enumerate(missing):
+                row[pk.name] = f'{prefix}{first + offset:03d}'
+
+    existing = set(db.session.scalars(db.select(pk).where(pk.in_([row[pk.name] for _, row in batch]))))
+    parents = {}
+    self_references = []
+    for fk in table.foreign_keys:
+        if fk.column.table is table:
+            self_references.append(fk.parent.name)
+            continue
+        wanted = {row.get(fk.parent.name) for _, row in batch} - {None}
+        parents[fk.parent.name] = set(db.session.scalars(db.select(fk.column).where(fk.column.in_(wanted))))
+
+    rows = []
+    for index, row in batch:
+        if row[pk.name] in existing:
+            reject_import_row(result, index, f'{pk.name} {row[pk.name]} already exists')
+            continue
+        missing_parent = next((name for name, found in parents.items()
+                               if row.get(name) is not None and row[name] not in found), None)
+        if missing_parent:
+            reject_import_row(result, index, f'{missing_parent} {row[missing_parent]} does not exist')
+            continue
+        existing.add(row[pk.name])
+        if any(row.get(name) is not None for name in self_references):
+            links.append((index, row[pk.name], {name: row.get(name) for name in self_references}))
+        for name in self_references:
+            row[name] = None
+        rows.append(row)
+    if rows:
+        db.session.execute(table.insert(), rows)
+        if model in IMPORT_ROLLUP_TABLES:
+            refresh_animal_rollups({row['BovinoID'] for row in rows})
+        if model in IMPORT_LOCATION_TABLES:
+            refresh_animal_locations({row['BovinoID'] for row in rows})
+        if 'BovinoID' in table.c:
+            invalidate_analytics(animal_ids={row['BovinoID'] for row in rows})
+        elif model is Lotes:
+            invalidate_analytics(lot_ids={row['LoteID'] for row in rows})
+    return rows
+
+def link_import_parents(model, links, result):
+    """Set the queued self references, now that every row of the sheet is loaded."""
+    table = model.__table__
+    pk = table.primary_key.columns[0]
+    for start in range(0, len(links), IMPORT_BATCH_SIZE):
+        chunk = links[start:start + IMPORT_BATCH_SIZE]
+        wanted = {value for _, _, values in chunk for value in values.values()} - {None}
+        found = set(db.session.scalars(db.select(pk).where(pk.in_(wanted))))
+        updates = []
+        for index, row_id, values in chunk:
+            for name, value in values.items():
+                if value is not None and value not in found:
+                    # The row itself is kept, only the link is left empty
+                    result.setdefault('warnings', [])
+                    if len(result['warnings']) < MAX_IMPORT_ERRORS:
+                        result['warnings'].append({'row': index, 'warning': f'{name} {value} does not exist, left empty'})
+            updates.append({'_id': row_id, **{name: value if value in found else None for name, value in values.items()}})
+        db.session.execute(table.update().where(pk == db.bindparam('_id')), updates)
+
+def import_sheets(sheets, progress=None):
+    """Load (sheet name, header, rows) tuples from importer.read_sheets() into their tables.
+
+    Returns {'tables': {table: {'inserted', 'rejected', 'errors'}}, 'skipped_sheets': [...]};
+    progress(table, result) is called after every committed batch.
+    """
+    by_name = {name: (header, rows) for name, header, rows in sheets}
+    known = {model.__tablename__ for model in IMPORT_TABLES}
+    summary = {'tables': {}, 'skipped_sheets': [name for name in by_name if name not in known]}
+
+    for model in IMPORT_TABLES:
+        if model.__tablename__ not in by_name:
+            continue
+        header, rows = by_name[model.__tablename__]
+        columns = match_columns(header, model.__table__.c.keys())
+        result = {'inserted': 0, 'rejected': 0, 'errors': []}
+        ignored = [str(cell) for cell, column in zip(header, columns) if column is None and cell not in (None, '')]
+        if ignored:
+            result['ignored_columns'] = ignored
+        summary['tables'][model.__tablename__] = result
+        spec = BULK_LOG_SPECS.get(model.__tablename__)
+        validate = validate_log_import_row if spec else validate_import_row
+        links = []
+
+        def load(batch):
+            if spec:
+                errors = []
+                result['inserted'] += insert_log_batch(spec, batch, errors)
+                for error in errors:
+                    reject_import_row(result, error['row'], error['error'])
+            else:
+                result['inserted'] += len(insert_import_batch(model, batch, result, links))
+            db.session.commit()
+            if progress:
+                progress(model.__tablename__, result)
+
+        batch = []
+        try:
+            for number, values in enumerate(rows, start=2):  # spreadsheet row numbers, the header is row 1
+                if all(value is None or str(value).strip() == '' for value in values):
+                    continue
+                try:
+                    batch.append((number, validate(model, columns, values)))
+                except ValueError as e:
+                    reject_import_row(result, number, str(e))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    load(batch)
+                    batch = []
+            if batch:
+                load(batch)
+            if links:
+                link_import_parents(model, links, result)
+                db.session.commit()
+            result['errors'].sort(key=lambda error: error['row'])
+        except Exception:
+            db.session.rollback()
+            raise
+    return summary
+
+def import_paths(paths, progress=None):
+    """import_sheets() of the workbooks and CSV files at these paths."""
+    files = [open(path, 'rb') for path in paths]
+    try:
+        sheets = [sheet for file, path in zip(files, paths) for sheet in read_sheets(file, path)]
+        return import_sheets(sheets, progress)
+    finally:
+        for file in files:
+            file.close()
+
+def run_import_job(params, report):
+    tables = None
+
+    def progress(table, result):
+        nonlocal tables
+        if tables is None:
+            tables = [name for name in (model.__tablename__ for model in IMPORT_TABLES) if name in names]
+        report(tables.index(table) / len(tables), f"{table}: {result['inserted']} imported, {result['rejected']} rejected")
+
+    names = set()
+    for path in params['paths']:
+        with open(path, 'rb') as file:
+            names.update(name for name, _, _ in read_sheets(file, path))
+    try:
+        return import_paths(params['paths'], progress)
+    finally:
+        shutil.rmtree(os.path.dirname(params['paths'][0]), ignore_errors=True)
+
+# Queued by POST /api/import?async=1; the files are removed once imported
+JOB_KINDS['import'] = (run_import_job, False)
+
+@bp.cli.command('import-data')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def import_data_command(paths):
+    """Import an .xlsx workbook or per-table .csv files (e.g. relaciones_ganaderia.xlsx)."""
+    summary = import_paths(paths, progress=lambda table, result: print(
+        f"{table}: {result['inserted']} imported, {result['rejected']} rejected"))
+    for table, result in summary['tables'].items():
+        for error in result['errors']:
+            print(f"{table} row {error['row']}: {error['error']}")
+        for warning in result.get('warnings', []):
+            print(f"{table} row {warning['row']}: {warning['warning']}")
+    if summary['skipped_sheets']:
+        print(f"Skipped sheets without a table: {', '.join(summary['skipped_sheets'])}")
+
+@bp.route('/api/import', methods=['POST'])
+def import_data():
+    # multipart/form-data with one or more "file" fields: an .xlsx workbook or one .csv per table
+    files = [file for file in request.files.getlist('file') if file and file.filename]
+    if not files:
+        return jsonify({'error': 'No file uploaded'}), 400
+    if request.args.get('async') in ('1', 'true'):
+        # Keep the files for a worker and answer at once; the job's result is the summary
+        folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'imports')
+        os.makedirs(folder, exist_ok=True)
+        folder = tempfile.mkdtemp(dir=folder)
+        paths = []
+        for file in files:
+            paths.append(os.path.join(folder, secure_filename(file.filename)))
+            file.save(paths[-1])
+        return job_accepted(enqueue_job('import', {'paths': paths}))
+    try:
+        sheets = [sheet for file in files for sheet in read_sheets(file.stream, file.filename)]
+        summary = import_sheets(sheets)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+    inserted = sum(result['inserted'] for result in summary['tables'].values())
+    rejected = sum(result['rejected'] for result in summary['tables'].values())
+    status = 400 if rejected and not inserted else 201
+    return jsonify(summary), status
+
+# Streaming export
+# Full table dumps are read with a server-side cursor (yield_per) and written as
+# NDJSON or CSV chunks from a generator, so memory stays constant whatever the
+# table size. The list endpoint parameters (fields, filters, date range) apply.
+EXPORT_BATCH_ROWS = 1000
+
+# Exportable tables: name -> (model, date column used by date_from/date_to)
+EXPORT_TABLES = {
+    'fincas': (Fincas, Fincas.Fecha_Registro),
+    'lotes': (Lotes, None),
+    'bovinos': (Bovinos, Bovinos.Fecha_Nac),
+    'registros_sanitarios': (Registros_Sanitarios, Registros_Sanitarios.Fecha_Muestra),
+    'movimientos_animales': (Movimientos_Animales, Movimientos_Animales.Fecha),
+    'pesajes_canales': (Pesajes_Canales, Pesajes_Canales.Fecha_Sacrificio),
+    'proveedores': (Proveedores, None),
+    'insumos': (Insumos, None),
+    'compras': (Compras, Compras.Fecha),
+    'ventas': (Ventas, Ventas.Fecha),
+    'alimentacion': (Alimentacion, None),
+    'ingredientes_racion': (Ingredientes_Racion, None),
+    'racion_animal': (Racion_Animal, Racion_Animal.Fecha_Inicio),
+    'weight_logs': (WeightLog, WeightLog.measured_at),
+    'emission_logs': (EmissionLog, EmissionLog.logged_at),
+    'finance_logs': (FinanceLog, FinanceLog.logged_at),
+    'resource_logs': (ResourceLog, ResourceLog.logged_at),
+}
+
+def export_batches(model, query, selected, names, date_column):
+    """Yield lists of serialized rows, EXPORT_BATCH_ROWS at a time."""
+    positions = [selected.index(name) for name in names]
+    rows = list_rows(model, query, selected, request.args, date_column, yield_per=EXPORT_BATCH_ROWS)
+    while True:
+        batch = [[serialize_value(row[i]) for i in positions] for row in islice(rows, EXPORT_BATCH_ROWS)]
+        if not batch:
+            break
+        yield batch
+
+def ndjson_chunks(names, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(names, values)), ensure_ascii=False) + '\n' for values in batch).encode()
+
+def csv_chunks(names, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(names)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # Empty export: only the header was written
+        yield buffer.getvalue().encode()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@bp.route('/api/export/<string:table>', methods=['GET'])
+def export_table(table):
+    # format=ndjson (default) or csv; gzip=1 compresses the stream (Content-Encoding: gzip)
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    model, date_column = EXPORT_TABLES[table]
+    try:
+        names, selected, query, _ = list_query(model, request.args, date_column)
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    write = ndjson_chunks if export_format == 'ndjson' else csv_chunks
+    chunks = write(names, export_batches(model, query, selected, names, date_column))
+    headers = {'Content-Disposition': f'attachment; filename={table}.{export_format}'}
+    if request.args.get('gzip') in ('1', 'true'):
+        chunks = gzip_chunks(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    mimetype = 'application/x-ndjson' if export_format == 'ndjson' else 'text/csv'
+    return current_app.response_class(stream_with_context(chunks), mimetype=mimetype, headers=headers)
@@ -0,0 +1,28 @@
+"""Ventas and the finance log."""
+from flask import Blueprint
+
+from logs import BULK_LOG_SPECS, bulk_insert_logs
+from models import Ventas
+from resources import Resource, ResourceError, log_resource
+
+bp = Blueprint('finance', __name__, cli_group=None)
+
+# Finance Logs
+log_resource(BULK_LOG_SPECS['finance_logs'], 'Finance log').register(bp)
+
+@bp.route('/api/finance_logs/bulk', methods=['POST'])
+def create_finance_logs_bulk():
+    return bulk_insert_logs(BULK_LOG_SPECS['finance_logs'])
+
+# Ventas
+# IDs are "Ve-001", "Ve-002", etc.
+def split_sale_total(values):
+    # Subtotal and taxes are calculated from the total
+    try:
+        total = float(values.get('Total') or 0)
+    except (TypeError, ValueError):
+        raise ResourceError('Total must be a number')
+    values.update(Total=total, Subtotal=total * 0.81, Impuestos=total * 0.19)
+
+Resource(Ventas, 'ventas', 'Venta', date_column=Ventas.Fecha, id_prefix='Ve-', required=['FincaID'],
+         prepare=split_sale_total).register(bp)
@@ -0,0 +1,36 @@
+"""The single-page frontend and its built assets."""
+import os
+
+from flask import Blueprint, send_from_directory
+
+import assets
+
+bp = Blueprint('frontend', __name__, cli_group=None)
+
+# After `flask --app app build-assets` the page and its content-hashed assets come from
+# dist/ (in production the web server in front serves them, see deploy/nginx.conf)
+@bp.route("/")
+def hello_world():
+    if os.path.exists(os.path.join(assets.DIST, "index.html")):
+        return send_from_directory(assets.DIST, "index.html", max_age=0)
+    return send_from_directory("..", "index.html")
+
+@bp.route("/assets/<path:filename>")
+def serve_asset(filename):
+    # The file name changes with the content, so clients may keep it for good
+    return send_from_directory(os.path.join(assets.DIST, "assets"), filename, max_age=365 * 24 * 3600)
+
+@bp.route("/<path:filename>")
+def serve_frontend(filename):
+    if filename.startswith("Frontend/"):
+        return send_from_directory("../Frontend", filename[len("Frontend/"):])
+    return send_from_directory("../Frontend", filename)
+
+# Static assets
+@bp.cli.command('build-assets')
+def build_assets_command():
+    """Write index.html and its assets, content-hashed and precompressed, to dist/."""
+    manifest = assets.build()
+    for source, entry in manifest.items():
+        print(f"  {source} -> {entry['path']} ({entry['bytes']} bytes{''.join(', ' + v for v in entry['precompressed'])})")
+    print(f'Built {len(manifest)} files into {assets.DIST}')
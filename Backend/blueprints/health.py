@@ -0,0 +1,192 @@
+"""Registros sanitarios and the certificates attached to them."""
+import os
+import threading
+from datetime import datetime, timedelta
+
+from flask import Blueprint, current_app, jsonify, request, send_from_directory
+from sqlalchemy.exc import IntegrityError
+
+import certificates
+from derived import invalidate_analytics, refresh_animal_rollups
+from models import db, CertificateFile, Registros_Sanitarios, dialect_insert, generate_id
+from resources import Resource, ResourceError
+
+bp = Blueprint('health', __name__, cli_group=None)
+ALLOWED_EXTENSIONS = {'pdf', 'jpg', 'jpeg'}
+
+# Helper functions for file handling
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+# Registros Sanitarios
+# Created from a multipart form with the certificate file (below); read, changed and
+# deleted like the other tables
+def health_records_written(action, rows):
+    ids = list({row['BovinoID'] for row in rows})
+    refresh_animal_rollups(ids)
+    invalidate_analytics(animal_ids=ids, with_lots=False)
+
+registros = Resource(Registros_Sanitarios, 'registros_sanitarios', 'Registro Sanitario',
+                     date_column=Registros_Sanitarios.Fecha_Muestra, methods=('list', 'get', 'update', 'delete', 'batch'),
+                     required=['BovinoID'], fixed=['BovinoID'], after_write=health_records_written)
+registros.register(bp)
+
+@bp.route('/api/registros_sanitarios', methods=['POST'])
+def create_registro_sanitario():
+    # Form fields (multipart/form-data instead of JSON) are checked like a JSON body;
+    # empty fields count as not sent
+    try:
+        values = registros.new_values({name: value for name, value in request.form.items() if value != ''})
+    except ResourceError as e:
+        return registros.rejected(e)
+
+    # Handle file upload (or the path of a file already sent to /api/uploads)
+    file = request.files.get('archivo_certificado')
+    if file and file.filename != '' and allowed_file(file.filename):
+        try:
+            values['Archivo_Certificado'] = store_certificate(file.stream, file.filename).path
+        except certificates.UploadTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    if not values.get('RegistroID'):
+        # Generate RegistroID as string (e.g., "RS001", "RS002", etc.)
+        values['RegistroID'] = generate_id('RS', Registros_Sanitarios.RegistroID)
+    try:
+        registro_id = registros.create_values(values)
+        db.session.commit()
+    except IntegrityError as e:
+        return registros.rejected(e)
+    if file:
+        certificate_queued().set()
+    return jsonify({'RegistroID': registro_id}), 201
+
+# Certificate uploads
+# Files are streamed into the content-addressed store and registered in certificate_files;
+# a registro refers to one by its path (Archivo_Certificado). Metadata and thumbnails are
+# extracted by a background thread of each server process, or by process-certificates.
+def store_certificate(stream, filename):
+    """Store an uploaded file and register it (pending processing) unless it already is."""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension not in certificates.FILE_TYPES:
+        raise ValueError(f"Allowed file types: {', '.join(sorted(ALLOWED_EXTENSIONS))}")
+    digest, path, size = certificates.store_stream(
+        stream, current_app.config['UPLOAD_FOLDER'], extension, current_app.config['CERTIFICATE_MAX_BYTES'])
+    db.session.execute(dialect_insert(CertificateFile.__table__).values(
+        sha256=digest, path=path, content_type=certificates.FILE_TYPES[extension][0], size=size,
+        uploaded_at=datetime.utcnow(), status='pending',
+    ).on_conflict_do_nothing(index_elements=['sha256']))
+    return db.session.get(CertificateFile, digest)
+
+def certificate_json(certificate):
+    return {
+        'sha256': certificate.sha256,
+        'path': certificate.path,
+        'content_type': certificate.content_type,
+        'size': certificate.size,
+        'uploaded_at': certificate.uploaded_at.isoformat(),
+        'status': certificate.status,
+        'info': certificate.info,
+        'thumbnail': certificate.thumbnail,
+        'error': certificate.error,
+    }
+
+@bp.route('/api/uploads', methods=['POST'])
+def upload_certificate():
+    # The file is the request body, streamed as it arrives (chunked transfer encoding works too);
+    # ?filename=certificado.pdf gives its type. Returns the path to use as Archivo_Certificado.
+    filename = request.args.get('filename', '')
+    if not allowed_file(filename):
+        return jsonify({'error': f"filename must end in one of: {', '.join(sorted(ALLOWED_EXTENSIONS))}"}), 400
+    if request.content_length is not None and request.content_length > current_app.config['CERTIFICATE_MAX_BYTES']:
+        return jsonify({'error': f"File exceeds {current_app.config['CERTIFICATE_MAX_BYTES']} bytes"}), 413
+    try:
+        certificate = store_certificate(request.stream, filename)
+    except certificates.UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    db.session.commit()
+    certificate_queued().set()
+    return jsonify(certificate_json(certificate)), 201
+
+@bp.route('/api/uploads/<string:sha256>', methods=['GET'])
+def get_upload(sha256):
+    return jsonify(certificate_json(db.get_or_404(CertificateFile, sha256)))
+
+def claim_certificates(limit=20):
+    """Mark up to limit pending files (or files whose processing timed out) as processing."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['CERTIFICATE_CLAIM_TIMEOUT'])
+    claimable = (CertificateFile.status == 'pending') | (
+        (CertificateFile.status == 'processing') & (CertificateFile.claimed_at < stale))
+    waiting = db.select(CertificateFile.sha256).where(claimable).order_by(CertificateFile.uploaded_at).limit(limit)
+    # claimable is checked again by the UPDATE, so a file claimed meanwhile by another process is skipped
+    claimed = db.session.execute(
+        db.update(CertificateFile).where(CertificateFile.sha256.in_(waiting.scalar_subquery()), claimable)
+        .values(status='processing', claimed_at=now)
+        .returning(CertificateFile.sha256, CertificateFile.path)
+        .execution_options(synchronize_session=False)).all()
+    db.session.commit()
+    return claimed
+
+def process_certificates():
+    """Extract metadata and thumbnails of the pending files; returns how many were processed."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    processed = 0
+    while True:
+        claimed = claim_certificates()
+        if not claimed:
+            return processed
+        for digest, path in claimed:
+            values = {'status': 'done', 'error': None}
+            try:
+                values['info'] = certificates.extract_metadata(os.path.join(folder, path))
+                thumbnail = os.path.join('thumbs', certificates.shard_path(digest, 'jpg'))
+                if certificates.make_thumbnail(os.path.join(folder, path), os.path.join(folder, thumbnail)):
+                    values['thumbnail'] = thumbnail
+            except Exception as e:
+                values = {'status': 'failed', 'error': str(e)}
+            db.session.execute(db.update(CertificateFile).where(CertificateFile.sha256 == digest).values(**values))
+            db.session.commit()
+            processed += 1
+
+@bp.cli.command('process-certificates')
+def process_certificates_command():
+    """Extract the metadata and thumbnails of every pending certificate now."""
+    print(f'{process_certificates()} certificates processed')
+
+def certificate_queued():
+    """The Event that wakes the current app's certificate worker."""
+    return current_app.extensions.setdefault('certificate_queued', threading.Event())
+
+def run_certificate_worker(app, queued):
+    while True:
+        queued.wait(app.config['CERTIFICATE_POLL_INTERVAL'])
+        queued.clear()
+        with app.app_context():
+            try:
+                process_certificates()
+            except Exception as e:
+                db.session.rollback()
+                print(f'Certificate processing failed: {e}')
+
+@bp.before_app_request
+def start_certificate_worker():
+    # One worker per app, started by its first request and kept in app.extensions
+    # (setdefault decides which thread starts when two requests race)
+    if 'certificate_worker' not in current_app.extensions:
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=run_certificate_worker, args=(app, certificate_queued()),
+                                  name='certificate-worker', daemon=True)
+        if app.extensions.setdefault('certificate_worker', thread) is thread:
+            thread.start()
+
+# File serving endpoint
+@bp.route('/uploads/<path:filename>')
+def uploaded_file(filename):
+    # Content-addressed files never change, so clients may keep them; older flat uploads may be replaced
+    if os.path.dirname(filename):
+        return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename, max_age=365 * 24 * 3600)
+    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
@@ -0,0 +1,301 @@
+"""Farms, lots, animals, their movements, weighings, emissions and pedigree."""
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, request
+
+from derived import (
+    analytics_cache, invalidate_analytics, lot_exists, parse_as_of, refresh_animal_locations,
+    refresh_animal_rollups, stays_at
+)
+from listing import serialize_value
+from logs import BULK_LOG_SPECS, bulk_insert_logs
+from models import (
+    db, AnimalLocation, AnimalRollup, Bovinos, Fincas, LogBucket, Lotes, Movimientos_Animales,
+    Pesajes_Canales, table_versions
+)
+from pedigree import Pedigree
+from resources import Resource, log_resource
+
+bp = Blueprint('herd', __name__, cli_group=None)
+
+@bp.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Recompute animal_rollups from the log, registro and pesaje tables."""
+    refresh_animal_rollups()
+    db.session.commit()
+    analytics_cache.clear()
+    print(f'Rebuilt rollups for {db.session.query(AnimalRollup).count()} animals')
+
+@bp.cli.command('rebuild-locations')
+def rebuild_locations_command():
+    """Recompute animal_locations from the movimientos_animales table."""
+    refresh_animal_locations()
+    db.session.commit()
+    analytics_cache.clear()
+    print(f'Rebuilt {db.session.query(AnimalLocation).count()} lot stays')
+
+# Fincas
+def before_farms_written(action, rows):
+    if action == 'delete':
+        invalidate_analytics(farm_ids=[row['FincaID'] for row in rows])
+
+Resource(Fincas, 'fincas', 'Finca', date_column=Fincas.Fecha_Registro, auto_id=True,
+         before_write=before_farms_written).register(bp)
+
+# Lotes
+def before_lots_written(action, rows):
+    if action == 'create':
+        invalidate_analytics(farm_ids=[row['FincaID'] for row in rows])
+    elif action == 'delete':
+        invalidate_analytics(lot_ids=[row['LoteID'] for row in rows])
+
+Resource(Lotes, 'lotes', 'Lote', auto_id=True, required=['FincaID'], fixed=['FincaID'],
+         before_write=before_lots_written).register(bp)
+
+# Bovinos
+# FincaID and LoteID change through movements, which keep the lot history
+def before_animals_written(action, rows):
+    if action == 'delete':
+        ids = [row['BovinoID'] for row in rows]
+        invalidate_analytics(animal_ids=ids)
+        db.session.execute(AnimalRollup.__table__.delete().where(AnimalRollup.BovinoID.in_(ids)))
+        db.session.execute(AnimalLocation.__table__.delete().where(AnimalLocation.BovinoID.in_(ids)))
+        db.session.execute(LogBucket.__table__.delete().where(LogBucket.entity == 'animal', LogBucket.entity_id.in_(ids)))
+
+def animals_written(action, rows):
+    if action == 'create':
+        ids = [row['BovinoID'] for row in rows]
+        refresh_animal_locations(ids)
+        invalidate_analytics(animal_ids=ids)
+
+Resource(Bovinos, 'bovinos', 'Bovino', date_column=Bovinos.Fecha_Nac, required=['BovinoID', 'FincaID', 'LoteID'],
+         fixed=['FincaID', 'LoteID'], before_write=before_animals_written, after_write=animals_written).register(bp)
+
+# Movimientos Animales
+# Every change rebuilds the lot history of the animals moved; their lots are
+# invalidated before (where they were) and after (where they are now)
+def check_destination(values, current):
+    if values.get('Lote_Destino') and not lot_exists(values['Lote_Destino']):
+        return 'Lote_Destino must be an existing LoteID'
+
+def before_movements_written(action, rows):
+    ids = list({row['BovinoID'] for row in rows})
+    invalidate_analytics(animal_ids=ids)
+    if action == 'delete':
+        # The animals' stays may point at these movements: clear them before deleting them. The
+        # stay before their first movement points at none and keeps their registered lot
+        db.session.execute(AnimalLocation.__table__.delete().where(AnimalLocation.BovinoID.in_(ids),
+                                                                    AnimalLocation.MovID.is_not(None)))
+
+def movements_written(action, rows):
+    ids = list({row['BovinoID'] for row in rows})
+    refresh_animal_locations(ids)
+    invalidate_analytics(animal_ids=ids)
+
+Resource(Movimientos_Animales, 'movimientos_animales', 'Movimiento Animal', date_column=Movimientos_Animales.Fecha,
+         id_prefix='MOV', required=['BovinoID'], fixed=['BovinoID'], validate=check_destination,
+         before_write=before_movements_written, after_write=movements_written).register(bp)
+
+# Lot history
+# Point-in-time questions answered from animal_locations: who was on a lot at a given
+# moment, how its headcount changed over a period, and where an animal has been.
+@bp.route('/api/lotes/<int:id>/animals', methods=['GET'])
+def get_lote_animals(id):
+    db.get_or_404(Lotes, id)
+    try:
+        at = parse_as_of(request.args.get('at'))
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO date'}), 400
+    stays = db.session.execute(
+        db.select(AnimalLocation.BovinoID, AnimalLocation.valid_from, AnimalLocation.valid_to)
+        .where(AnimalLocation.LoteID == id, stays_at(at))
+        .order_by(AnimalLocation.BovinoID)
+    )
+    return jsonify({
+        'land_id': id,
+        'at': at.isoformat(),
+        'animals': [{'BovinoID': stay.BovinoID, 'since': serialize_value(stay.valid_from),
+                     'until': serialize_value(stay.valid_to)} for stay in stays]
+    })
+
+@bp.route('/api/lotes/<int:id>/occupancy', methods=['GET'])
+def get_lote_occupancy(id):
+    # Headcount of the lot after every change between date_from and date_to (both optional);
+    # the first point is the headcount at date_from, or before any recorded movement
+    db.get_or_404(Lotes, id)
+    try:
+        start = datetime.fromisoformat(request.args['date_from']) if request.args.get('date_from') else None
+        end = datetime.fromisoformat(request.args['date_to']) if request.args.get('date_to') else None
+    except ValueError:
+        return jsonify({'error': 'date_from and date_to must be ISO dates'}), 400
+
+    query = db.select(AnimalLocation.valid_from, AnimalLocation.valid_to).where(AnimalLocation.LoteID == id)
+    if start:
+        query = query.where(db.or_(AnimalLocation.valid_to.is_(None), AnimalLocation.valid_to > start))
+    if end:
+        query = query.where(db.or_(AnimalLocation.valid_from.is_(None), AnimalLocation.valid_from <= end))
+
+    count = 0
+    changes = {}
+    for valid_from, valid_to in db.session.execute(query):
+        if valid_from is None or (start and valid_from <= start):
+            count += 1
+        else:
+            changes[valid_from] = changes.get(valid_from, 0) + 1
+        if valid_to is not None and (end is None or valid_to <= end):
+            changes[valid_to] = changes.get(valid_to, 0) - 1
+
+    timeline = [{'date': serialize_value(start), 'animal_count': count}]
+    for date in sorted(changes):
+        if changes[date]:
+            count += changes[date]
+            timeline.append({'date': date.isoformat(), 'animal_count': count})
+    return jsonify({'land_id': id, 'timeline': timeline})
+
+@bp.route('/api/bovinos/<string:id>/locations', methods=['GET'])
+def get_bovino_locations(id):
+    db.get_or_404(Bovinos, id)
+    stays = db.session.execute(
+        db.select(AnimalLocation.FincaID, AnimalLocation.LoteID, AnimalLocation.valid_from,
+                  AnimalLocation.valid_to, AnimalLocation.MovID)
+        .where(AnimalLocation.BovinoID == id)
+        .order_by(AnimalLocation.valid_from.asc().nulls_first())
+    )
+    return jsonify([{'FincaID': stay.FincaID, 'LoteID': stay.LoteID, 'since': serialize_value(stay.valid_from),
+                     'until': serialize_value(stay.valid_to), 'MovID': stay.MovID} for stay in stays])
+
+# Pesajes Canales
+def carcasses_written(action, rows):
+    ids = list({row['BovinoID'] for row in rows})
+    refresh_animal_rollups(ids)
+    invalidate_analytics(animal_ids=ids)
+
+Resource(Pesajes_Canales, 'pesajes_canales', 'Pesaje Canal', date_column=Pesajes_Canales.Fecha_Sacrificio,
+         id_prefix='CAN', required=['BovinoID'], fixed=['BovinoID'], after_write=carcasses_written).register(bp)
+
+# Weight and Emission Logs
+log_resource(BULK_LOG_SPECS['weight_logs'], 'Weight log').register(bp)
+log_resource(BULK_LOG_SPECS['emission_logs'], 'Emission log').register(bp)
+
+@bp.route('/api/weight_logs/bulk', methods=['POST'])
+def create_weight_logs_bulk():
+    return bulk_insert_logs(BULK_LOG_SPECS['weight_logs'])
+
+@bp.route('/api/emission_logs/bulk', methods=['POST'])
+def create_emission_logs_bulk():
+    return bulk_insert_logs(BULK_LOG_SPECS['emission_logs'])
+
+# Pedigree
+# Ancestors and descendants are read with recursive CTEs over MadreID/PadreID;
+# inbreeding coefficients come from pedigree.Pedigree, kept in memory and rebuilt
+# when the bovinos table has changed (its counter in models.table_versions).
+MAX_PEDIGREE_GENERATIONS = 20
+DEFAULT_MAX_INBREEDING = 0.0625  # offspring F of a half-sib mating
+
+def current_pedigree():
+    """The app's cached Pedigree, rebuilt if a bovino has been written since it was built."""
+    cache = current_app.extensions.setdefault('pedigree', {'version': None, 'pedigree': None})
+    version = table_versions([Bovinos.__tablename__])[Bovinos.__tablename__]
+    # Within a transaction that wrote bovinos the counter may yet be rolled back
+    uncommitted = Bovinos.__tablename__ in db.session.info.get('changed_tables', ())
+    if version == cache['version'] and not uncommitted:
+        return cache['pedigree']
+    links = db.session.execute(
+        db.select(Bovinos.BovinoID, Bovinos.PadreID, Bovinos.MadreID)
+        .where(db.or_(Bovinos.PadreID.is_not(None), Bovinos.MadreID.is_not(None)))
+        .order_by(Bovinos.BovinoID)
+    ).all()
+    pedigree = Pedigree([tuple(link) for link in links])
+    if not uncommitted:
+        cache.update(version=version, pedigree=pedigree)
+    return pedigree
+
+def lineage(animal_id, generations, ancestors=True):
+    """Relatives of an animal up to N generations away, nearest generation first."""
+    relative = db.aliased(Bovinos)
+    tree = (db.select(Bovinos.BovinoID, db.literal(0).label('generation'))
+            .where(Bovinos.BovinoID == animal_id)
+            .cte('lineage', recursive=True))
+    if ancestors:
+        # Parents of the animals found so far
+        child = db.aliased(Bovinos)
+        step = (db.select(relative.BovinoID, tree.c.generation + 1)
+                .join(child, child.BovinoID == tree.c.BovinoID)
+                .join(relative, db.or_(relative.BovinoID == child.MadreID, relative.BovinoID == child.PadreID)))
+    else:
+        # Offspring of the animals found so far
+        step = (db.select(relative.BovinoID, tree.c.generation + 1)
+                .join(relative, db.or_(relative.MadreID == tree.c.BovinoID, relative.PadreID == tree.c.BovinoID)))
+    # UNION (not UNION ALL) keeps animals reached through several paths once per generation
+    tree = tree.union(step.where(tree.c.generation < generations))
+
+    nearest = (db.select(tree.c.BovinoID, db.func.min(tree.c.generation).label('generation'))
+               .where(tree.c.generation > 0)
+               .group_by(tree.c.BovinoID)
+               .subquery())
+    columns = [Bovinos.BovinoID, Bovinos.Sexo, Bovinos.Raza, Bovinos.Fecha_Nac, Bovinos.MadreID, Bovinos.PadreID,
+               Bovinos.FincaID, Bovinos.LoteID]
+    rows = db.session.execute(
+        db.select(nearest.c.generation, *columns)
+        .join(Bovinos, Bovinos.BovinoID == nearest.c.BovinoID)
+        .order_by(nearest.c.generation, Bovinos.BovinoID)
+    )
+    names = ['generation'] + [column.key for column in columns]
+    return [{name: serialize_value(value) for name, value in zip(names, row)} for row in rows]
+
+def lineage_response(id, ancestors):
+    db.get_or_404(Bovinos, id)
+    generations = request.args.get('generations', 3, type=int)
+    if not 1 <= generations <= MAX_PEDIGREE_GENERATIONS:
+        return jsonify({'error': f'generations must be between 1 and {MAX_PEDIGREE_GENERATIONS}'}), 400
+    key = 'ancestors' if ancestors else 'descendants'
+    return jsonify({'BovinoID': id, 'generations': generations, key: lineage(id, generations, ancestors)})
+
+@bp.route('/api/bovinos/<string:id>/ancestors', methods=['GET'])
+def get_bovino_ancestors(id):
+    return lineage_response(id, ancestors=True)
+
+@bp.route('/api/bovinos/<string:id>/descendants', methods=['GET'])
+def get_bovino_descendants(id):
+    return lineage_response(id, ancestors=False)
+
+@bp.route('/api/bovinos/<string:id>/inbreeding', methods=['GET'])
+def get_bovino_inbreeding(id):
+    db.get_or_404(Bovinos, id)
+    return jsonify({'BovinoID': id, 'inbreeding_coefficient': current_pedigree().inbreeding(id)})
+
+@bp.route('/api/pedigree/mating_check', methods=['POST'])
+def check_matings():
+    # {"bull": "B001", "cows": ["V001", ...], "max_inbreeding": 0.0625}: the inbreeding of the
+    # calf of each pairing, lowest first
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    bull = data.get('bull')
+    cows = data.get('cows')
+    if not bull or not isinstance(cows, list) or not cows:
+        return jsonify({'error': 'bull and a non-empty cows list are required'}), 400
+    if not isinstance(bull, str) or not all(isinstance(cow, str) for cow in cows):
+        return jsonify({'error': 'bull and cows must be BovinoIDs (strings)'}), 400
+    try:
+        max_inbreeding = float(data.get('max_inbreeding', DEFAULT_MAX_INBREEDING))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'max_inbreeding must be a number'}), 400
+
+    wanted = {bull, *cows}
+    found = set(db.session.scalars(db.select(Bovinos.BovinoID).where(Bovinos.BovinoID.in_(wanted))))
+    if wanted - found:
+        return jsonify({'error': f"Unknown animals: {', '.join(sorted(map(str, wanted - found)))}"}), 404
+
+    pedigree = current_pedigree()
+    matings = []
+    for cow in dict.fromkeys(cows):
+        inbreeding = pedigree.offspring_inbreeding(bull, cow)
+        matings.append({
+            'cow': cow,
+            'offspring_inbreeding': inbreeding,
+            'relationship': 2 * inbreeding,
+            'acceptable': inbreeding <= max_inbreeding
+        })
+    matings.sort(key=lambda mating: (mating['offspring_inbreeding'], mating['cow']))
+    return jsonify({'bull': bull, 'max_inbreeding': max_inbreeding, 'matings': matings})
@@ -0,0 +1,220 @@
+"""Background jobs: the jobs API and the `worker` command that runs them."""
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import Blueprint, current_app, jsonify, request
+
+from blueprints.analytics import compute_farm_analytics
+from derived import analytics_cache, refresh_animal_locations, refresh_animal_rollups
+from listing import list_response, serialize_value
+from logs import rebuild_log_buckets
+from models import db, AnimalLocation, AnimalRollup, Fincas, Job
+
+bp = Blueprint('jobs', __name__, cli_group=None)
+
+# Jobs
+# Operations that take minutes (farm-wide analytics, imports, rebuilds) are queued in
+# the jobs table and answered with 202 and the job's URL. `flask --app app worker`
+# starts a pool of processes that claim queued jobs with UPDATE ... RETURNING, run
+# them and store their result; clients poll GET /api/jobs/<id> for status and progress.
+# A job whose worker stops sending heartbeats is run again, up to JOB_MAX_ATTEMPTS times.
+JOB_FARM_BATCH = 100  # farms computed between two progress reports
+
+def job_json(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'params': job.params,
+        'status': job.status,
+        'progress': job.progress,
+        'message': job.message,
+        'result': job.result,
+        'error': job.error,
+        'attempts': job.attempts,
+        'created_at': serialize_value(job.created_at),
+        'started_at': serialize_value(job.started_at),
+        'finished_at': serialize_value(job.finished_at),
+    }
+
+def enqueue_job(kind, params):
+    job = Job(kind=kind, params=params, status='queued', progress=0, attempts=0, created_at=datetime.utcnow())
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def job_accepted(job):
+    response = jsonify(job_json(job))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+def update_job(job_id, **values):
+    # On a connection of its own, so reporting never commits the job's own work
+    with db.engine.begin() as connection:
+        connection.execute(db.update(Job).where(Job.id == job_id).values(**values))
+
+def run_farm_analytics_job(params, report):
+    at = datetime.fromisoformat(params['at']) if params.get('at') else None
+    farms = db.select(Fincas.FincaID).order_by(Fincas.FincaID)
+    if params.get('farm_ids') is not None:
+        farms = farms.where(Fincas.FincaID.in_(params['farm_ids']))
+    farm_ids = db.session.scalars(farms).all()
+    result = {}
+    for start in range(0, len(farm_ids), JOB_FARM_BATCH):
+        result.update(compute_farm_analytics(farm_ids=farm_ids[start:start + JOB_FARM_BATCH], at=at))
+        db.session.rollback()  # end the read transaction between batches
+        report(min(start + JOB_FARM_BATCH, len(farm_ids)) / len(farm_ids), f'{len(result)} of {len(farm_ids)} farms')
+    return result
+
+def run_rebuild_job(params, report):
+    refresh_animal_rollups()
+    db.session.commit()
+    report(1 / 3, 'Rollups rebuilt')
+    refresh_animal_locations()
+    db.session.commit()
+    report(2 / 3, 'Lot history rebuilt')
+    rebuild_log_buckets()
+    db.session.commit()
+    analytics_cache.clear()
+    return {'rollups': db.session.query(AnimalRollup).count(), 'stays': db.session.query(AnimalLocation).count()}
+
+# kind -> (function(params, report) returning the JSON result, whether POST /api/jobs may queue it);
+# report(progress, message) must be called between transactions. Blueprints add their own
+# kinds when imported (blueprints/data.py adds 'import').
+JOB_KINDS = {
+    'farm_analytics': (run_farm_analytics_job, True),  # params: farm_ids (default all), at
+    'rebuild': (run_rebuild_job, True),  # rollups, lot history and log buckets
+}
+
+def claim_job():
+    """Take the oldest runnable job, or None."""
+    now = datetime.utcnow()
+    stale = now - timedelta(seconds=current_app.config['JOB_TIMEOUT'])
+    abandoned = (Job.status == 'running') & (Job.heartbeat_at < stale)
+    db.session.execute(db.update(Job).where(abandoned, Job.attempts >= current_app.config['JOB_MAX_ATTEMPTS'])
+                       .values(status='failed', error='The worker stopped responding', finished_at=now))
+    runnable = (Job.status == 'queued') | (abandoned & (Job.attempts < current_app.config['JOB_MAX_ATTEMPTS']))
+    oldest = db.select(Job.id).where(runnable).order_by(Job.id).limit(1).scalar_subquery()
+    # runnable is checked again by the UPDATE, so two workers never claim the same job
+    claimed = db.session.execute(
+        db.update(Job).where(Job.id == oldest, runnable)
+        .values(status='running', attempts=Job.attempts + 1, started_at=now, heartbeat_at=now)
+        .returning(Job.id, Job.kind, Job.params)
+        .execution_options(synchronize_session=False)).first()
+    db.session.commit()
+    return claimed
+
+def run_job(job_id, kind, params):
+    stopped = threading.Event()
+    app = current_app._get_current_object()
+
+    def beat():
+        with app.app_context():
+            while not stopped.wait(app.config['JOB_HEARTBEAT_INTERVAL']):
+                try:
+                    update_job(job_id, heartbeat_at=datetime.utcnow())
+                except Exception as e:
+                    print(f'Job {job_id} heartbeat failed: {e}')
+
+    def report(progress, message=None):
+        update_job(job_id, progress=progress, message=message, heartbeat_at=datetime.utcnow())
+
+    threading.Thread(target=beat, name=f'job-{job_id}-heartbeat', daemon=True).start()
+    try:
+        function, _ = JOB_KINDS[kind]
+        values = {'status': 'done', 'progress': 1, 'result': function(params, report)}
+    except Exception as e:
+        db.session.rollback()
+        values = {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+    finally:
+        stopped.set()
+    update_job(job_id, finished_at=datetime.utcnow(), **values)
+    return values['status']
+
+def work(app, burst=False):
+    """Worker loop: run jobs until stopped (or, with burst, until the queue is empty)."""
+    with app.app_context():
+        while True:
+            job = claim_job()
+            if job is None:
+                if burst:
+                    return
+                time.sleep(app.config['JOB_POLL_INTERVAL'])
+                continue
+            print(f'Job {job.id} ({job.kind}): {run_job(*job)}')
+
+def work_process(config, burst):
+    """Entry point of a worker process: builds its own app from the parent's settings.
+
+    Only the config crosses the process boundary (the app itself can't be pickled), so
+    this works with the spawn start method as well as fork.
+    """
+    from app import create_app
+    work(create_app(config), burst)
+
+@bp.cli.command('worker')
+@click.option('--processes', default=os.cpu_count() or 1, show_default=True, help='Worker processes to start')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty')
+def worker_command(processes, burst):
+    """Run queued jobs in a pool of worker processes."""
+    app = current_app._get_current_object()
+    if processes <= 1:
+        work(app, burst)
+        return
+    # Forked workers must not share the parent's pooled connections
+    db.engine.dispose()
+    config = dict(app.config)
+    workers = [multiprocessing.Process(target=work_process, args=(config, burst), name=f'worker-{number}')
+               for number in range(processes)]
+    for process in workers:
+        process.start()
+    try:
+        for process in workers:
+            process.join()
+    except KeyboardInterrupt:
+        for process in workers:
+            process.terminate()
+
+@bp.route('/api/jobs', methods=['GET'])
+def get_jobs():
+    return list_response(Job, date_column=Job.created_at)
+
+@bp.route('/api/jobs', methods=['POST'])
+def create_job():
+    data = request.get_json(silent=True) or {}
+    kind = data.get('kind')
+    if kind not in JOB_KINDS or not JOB_KINDS[kind][1]:
+        queueable = ', '.join(name for name, (_, public) in JOB_KINDS.items() if public)
+        return jsonify({'error': f'kind must be one of: {queueable}'}), 400
+    params = data.get('params') or {}
+    if not isinstance(params, dict):
+        return jsonify({'error': 'params must be an object'}), 400
+    farm_ids = params.get('farm_ids')
+    if farm_ids is not None and not (isinstance(farm_ids, list) and all(isinstance(i, int) for i in farm_ids)):
+        return jsonify({'error': 'farm_ids must be a list of integers'}), 400
+    if params.get('at'):
+        try:
+            datetime.fromisoformat(params['at'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'at must be an ISO date'}), 400
+    return job_accepted(enqueue_job(kind, params))
+
+@bp.route('/api/jobs/<int:id>', methods=['GET'])
+def get_job(id):
+    return jsonify(job_json(db.get_or_404(Job, id)))
+
+@bp.route('/api/jobs/<int:id>', methods=['DELETE'])
+def cancel_job(id):
+    # Only jobs still waiting can be cancelled
+    cancelled = db.session.execute(
+        db.update(Job).where(Job.id == id, Job.status == 'queued')
+        .values(status='cancelled', finished_at=datetime.utcnow())).rowcount
+    db.session.commit()
+    if not cancelled:
+        job = db.get_or_404(Job, id)
+        return jsonify({'error': f'Job {id} is {job.status}'}), 409
+    return jsonify({'message': 'Job cancelled'})
@@ -0,0 +1,110 @@
+"""Request metrics at /metrics, Server-Timing headers and opt-in profiling."""
+import cProfile
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import Blueprint, current_app, g, has_request_context, request
+from sqlalchemy import event
+
+import metrics
+from models import db
+
+bp = Blueprint('monitoring', __name__, cli_group=None)
+
+# Request metrics
+# Latency and status of every request by route, plus the number and time of the SQL
+# statements it ran (counted by SQLAlchemy cursor events while a request is active),
+# in the Prometheus text format at GET /metrics. Each response also carries the SQL
+# figures in a Server-Timing header, which browser developer tools display.
+metrics_registry = metrics.Registry()
+request_duration = metrics_registry.histogram(
+    'http_request_duration_seconds', 'Request latency by route', ('method', 'route'))
+request_count = metrics_registry.counter(
+    'http_requests_total', 'Requests by route and status', ('method', 'route', 'status'))
+request_queries = metrics_registry.histogram(
+    'db_queries_per_request', 'SQL statements run by one request', ('method', 'route'), metrics.QUERY_COUNT_BUCKETS)
+request_query_time = metrics_registry.histogram(
+    'db_query_seconds_per_request', 'Time one request spent in SQL', ('method', 'route'))
+nplusone_count = metrics_registry.counter(
+    'db_nplusone_requests_total', 'Requests that ran one SQL statement NPLUSONE_THRESHOLD times or more', ('method', 'route'))
+
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        conn.info.setdefault('statement_started', []).append(time.perf_counter())
+
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and conn.info.get('statement_started'):
+        elapsed = time.perf_counter() - conn.info['statement_started'].pop()
+        if 'sql_statements' not in g:
+            g.sql_statements = Counter()
+            g.sql_time = 0.0
+        g.sql_statements[statement] += 1
+        g.sql_time += elapsed
+
+def clear_statement_timer(context):
+    # A failed statement gets no after_cursor_execute; its start time must not stay on the
+    # pooled connection
+    started = context.connection.info.get('statement_started') if context.connection is not None else None
+    if started:
+        started.pop()
+
+@bp.record_once
+def listen_to_statements(state):
+    with state.app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', start_statement_timer)
+        event.listen(db.engine, 'after_cursor_execute', record_statement)
+        event.listen(db.engine, 'handle_error', clear_statement_timer)
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if current_app.config['PROFILE_REQUESTS'] and request.args.get('profile') == '1':
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@bp.after_app_request
+def record_request(response):
+    if 'request_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    statements = g.get('sql_statements') or Counter()
+    queries, sql_time = sum(statements.values()), g.get('sql_time', 0.0)
+    request_duration.observe(elapsed, request.method, route)
+    request_count.inc(request.method, route, str(response.status_code))
+    request_queries.observe(queries, request.method, route)
+    request_query_time.observe(sql_time, request.method, route)
+    response.headers['Server-Timing'] = f'db;dur={sql_time * 1000:.1f};desc="{queries} queries", total;dur={elapsed * 1000:.1f}'
+
+    repeated = [(count, statement) for statement, count in statements.items() if count >= current_app.config['NPLUSONE_THRESHOLD']]
+    if repeated:
+        nplusone_count.inc(request.method, route)
+        count, statement = max(repeated)
+        current_app.logger.warning('Possible N+1 query in %s %s: %d x %s', request.method, route, count,
+                                   ' '.join(statement.split())[:200])
+
+    if 'profiler' in g:
+        g.profiler.disable()
+        os.makedirs(current_app.config['PROFILE_DIR'], exist_ok=True)
+        name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}-{request.endpoint or 'unmatched'}"
+        g.profiler.dump_stats(os.path.join(current_app.config['PROFILE_DIR'], f'{name}.prof'))
+        # The SQL the request ran, most repeated first, next to the Python profile
+        with open(os.path.join(current_app.config['PROFILE_DIR'], f'{name}.sql'), 'w', encoding='utf-8') as file:
+            file.write(f'-- {request.method} {request.full_path}: {queries} statements, {sql_time * 1000:.1f} ms\n')
+            for statement, count in statements.most_common():
+                file.write(f'-- {count} x\n{statement.strip()};\n')
+        response.headers['X-Profile'] = f'{name}.prof'
+    return response
+
+@bp.teardown_app_request
+def stop_profiler(error):
+    # A request that raised skips the after_request hooks; its profiler must not keep running
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+@bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    return current_app.response_class(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,39 @@
+"""Rations, their ingredients, feeding records and the resource log."""
+from flask import Blueprint
+
+from logs import BULK_LOG_SPECS, bulk_insert_logs
+from models import db, Alimentacion, Ingredientes_Racion, Racion_Animal
+from resources import Resource, log_resource
+
+bp = Blueprint('nutrition', __name__, cli_group=None)
+
+# Ingredientes_Racion API endpoints
+def check_ration_total(values, current):
+    # The PorcentajeMS of a ration's ingredients may not add up to more than 100%
+    if current is not None:
+        return None
+    current_total = db.session.query(db.func.sum(Ingredientes_Racion.PorcentajeMS)).filter_by(RacionID=values['RacionID']).scalar() or 0
+    new_percentage = values.get('PorcentajeMS') or 0
+    if current_total + new_percentage > 100:
+        return (f'La suma de porcentajes MS para esta ración no puede superar 100%. '
+                f'Porcentaje actual: {current_total}%, Nuevo porcentaje: {new_percentage}%, '
+                f'Total sería: {current_total + new_percentage}%')
+
+Resource(Ingredientes_Racion, 'ingredientes_racion', 'Ingrediente Racion', id_prefix='ING',
+         required=['RacionID', 'InsumoID'], validate=check_ration_total).register(bp)
+
+# Resource Logs
+log_resource(BULK_LOG_SPECS['resource_logs'], 'Resource log').register(bp)
+
+@bp.route('/api/resource_logs/bulk', methods=['POST'])
+def create_resource_logs_bulk():
+    return bulk_insert_logs(BULK_LOG_SPECS['resource_logs'])
+
+# Alimentacion
+# IDs are "Alim-001", "Alim-002", etc.
+Resource(Alimentacion, 'alimentacion', 'Alimentacion', id_prefix='Alim-', required=['Nombre_Racion']).register(bp)
+
+# Racion Animal API endpoints
+# IDs are "animalalim-001", "animalalim-002", etc.
+Resource(Racion_Animal, 'racion_animal', 'Racion Animal', date_column=Racion_Animal.Fecha_Inicio,
+         id_prefix='animalalim-', required=['RacionID', 'BovinoID']).register(bp)
@@ -0,0 +1,12 @@
+"""Suppliers, supplies and purchases."""
+from flask import Blueprint
+
+from models import Compras, Insumos, Proveedores
+from resources import Resource
+
+bp = Blueprint('supply_chain', __name__, cli_group=None)
+
+Resource(Proveedores, 'proveedores', 'Proveedor', id_prefix='PRO', required=['Nombre']).register(bp)
+Resource(Insumos, 'insumos', 'Insumo', id_prefix='INS', required=['ProveedorID']).register(bp)
+Resource(Compras, 'compras', 'Compra', date_column=Compras.Fecha, id_prefix='COM',
+         required=['ProveedorID', 'FincaID', 'InsumoID']).register(bp)
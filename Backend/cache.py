@@ -0,0 +1,84 @@
+"""Response cache for the analytics endpoints.
+
+Entries are grouped by entity key ("animal:B001", "land:3", "farm:1"); each
+entity holds one entry per query string variant, so invalidating an entity
+drops all of its variants at once. Two backends share the same interface:
+
+- LocalCache: in-process LRU with a TTL, the default
+- RedisCache: shared by every worker process, for ANALYTICS_CACHE_URL=redis://...
+  (requires the redis package)
+
+An entry is an (etag, body) pair, body being the JSON response bytes.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+class LocalCache:
+    def __init__(self, max_entities=1024, ttl=60):
+        self.max_entities = max_entities
+        self.ttl = ttl
+        self._entities = OrderedDict()  # key -> {variant: (expires, entry)}
+        self._lock = threading.Lock()
+
+    def get(self, key, variant):
+        with self._lock:
+            variants = self._entities.get(key)
+            if not variants or variant not in variants:
+                return None
+            expires, entry = variants[variant]
+            if expires <= time.monotonic():
+                del variants[variant]
+                return None
+            self._entities.move_to_end(key)
+            return entry
+
+    def set(self, key, variant, entry):
+        with self._lock:
+            self._entities.setdefault(key, {})[variant] = (time.monotonic() + self.ttl, entry)
+            self._entities.move_to_end(key)
+            while len(self._entities) > self.max_entities:
+                self._entities.popitem(last=False)
+
+    def invalidate(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entities.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entities.clear()
+
+class RedisCache:
+    """Each entity is a Redis hash of variant -> etag + newline + body, expiring after ttl seconds."""
+
+    def __init__(self, url, ttl=60, prefix='analytics:'):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key, variant):
+        value = self.client.hget(self.prefix + key, variant)
+        if value is None:
+            return None
+        etag, _, body = value.partition(b'\n')
+        return etag.decode(), body
+
+    def set(self, key, variant, entry):
+        etag, body = entry
+        name = self.prefix + key
+        pipeline = self.client.pipeline()
+        pipeline.hset(name, variant, etag.encode() + b'\n' + body)
+        pipeline.expire(name, self.ttl)
+        pipeline.execute()
+
+    def invalidate(self, keys):
+        names = [self.prefix + key for key in keys]
+        if names:
+            self.client.delete(*names)
+
+    def clear(self):
+        names = list(self.client.scan_iter(self.prefix + '*'))
+        if names:
+            self.client.delete(*names)
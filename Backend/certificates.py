@@ -0,0 +1,129 @@
+"""Content-addressed storage for uploaded certificates (PDF and JPEG).
+
+A file is stored once under the SHA-256 of its content, sharded two levels deep
+by the first hex digits (ab/cd/abcd...pdf), so no directory grows past a few
+hundred entries however many certificates a farm uploads, and uploading the
+same certificate again reuses the stored copy. Uploads are copied in chunks
+into a temporary file while they are hashed, and only moved into place once
+complete and within the size limit.
+
+Metadata (PDF version and page count, JPEG dimensions) and thumbnails are
+extracted afterwards by the certificate worker in blueprints/health.py.
+Thumbnails of JPEG files need Pillow (pip install Pillow); without it only
+metadata is extracted.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+CHUNK_SIZE = 64 * 1024
+
+# Extension -> (content type, leading bytes of such a file)
+FILE_TYPES = {
+    'pdf': ('application/pdf', b'%PDF-'),
+    'jpg': ('image/jpeg', b'\xff\xd8\xff'),
+    'jpeg': ('image/jpeg', b'\xff\xd8\xff'),
+}
+
+class UploadTooLarge(ValueError):
+    pass
+
+def shard_path(digest, extension):
+    return os.path.join(digest[:2], digest[2:4], f'{digest}.{extension}')
+
+def store_stream(stream, folder, extension, max_bytes):
+    """Copy a file-like object into the store; returns (sha256, path relative to folder, size).
+
+    Raises UploadTooLarge past max_bytes and ValueError when the content does not
+    match the extension. Nothing is left behind in either case.
+    """
+    content_type, magic = FILE_TYPES[extension]
+    scratch = os.path.join(folder, 'tmp')
+    os.makedirs(scratch, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    descriptor, temporary = tempfile.mkstemp(dir=scratch)
+    try:
+        with os.fdopen(descriptor, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if size == 0 and not chunk.startswith(magic[:len(chunk)]):
+                    raise ValueError(f'File content is not {content_type}')
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f'File exceeds {max_bytes} bytes')
+                digest.update(chunk)
+                out.write(chunk)
+        if size < len(magic):
+            raise ValueError(f'File content is not {content_type}')
+        relative = shard_path(digest.hexdigest(), 'jpg' if content_type == 'image/jpeg' else extension)
+        destination = os.path.join(folder, relative)
+        if os.path.exists(destination):
+            os.remove(temporary)
+        else:
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            os.replace(temporary, destination)
+        return digest.hexdigest(), relative, size
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+def pdf_metadata(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    info = {}
+    version = re.match(rb'%PDF-(\d\.\d)', data)
+    if version:
+        info['pdf_version'] = version.group(1).decode()
+    # The page tree root holds the page count; files with compressed object
+    # streams hide it, then single page objects are counted if any are visible
+    counts = [int(count) for count in re.findall(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)', data)]
+    counts += [int(count) for count in re.findall(rb'/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', data)]
+    pages = max(counts) if counts else len(re.findall(rb'/Type\s*/Page\b(?!s)', data))
+    if pages:
+        info['pages'] = pages
+    return info
+
+def jpeg_metadata(path):
+    """Width and height from the first start-of-frame marker."""
+    with open(path, 'rb') as file:
+        data = file.read()
+    position = 2
+    while position + 4 <= len(data):
+        if data[position] != 0xFF:
+            break
+        marker = data[position + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            position += 2
+            continue
+        length = int.from_bytes(data[position + 2:position + 4], 'big')
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC) and position + 9 <= len(data):
+            return {
+                'height': int.from_bytes(data[position + 5:position + 7], 'big'),
+                'width': int.from_bytes(data[position + 7:position + 9], 'big'),
+            }
+        position += 2 + length
+    return {}
+
+def extract_metadata(path):
+    if path.endswith('.pdf'):
+        return pdf_metadata(path)
+    return jpeg_metadata(path)
+
+def make_thumbnail(path, destination, size=256):
+    """Write a JPEG thumbnail; returns False when it cannot be made (PDF, or no Pillow)."""
+    if path.endswith('.pdf'):
+        return False
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    with Image.open(path) as image:
+        image.thumbnail((size, size))
+        image.convert('RGB').save(destination, 'JPEG', quality=80)
+    return True
@@ -0,0 +1,239 @@
+"""Tables and caches derived from the records: animal rollups, lot history and analytics responses.
+
+Every write endpoint keeps these up to date in the same transaction as the row it
+changes; the refresh functions rebuild them from scratch (init-db, rebuild-rollups).
+"""
+import hashlib
+from datetime import datetime
+
+from flask import current_app, jsonify, request
+from sqlalchemy import event
+from werkzeug.local import LocalProxy
+
+from models import (
+    db, AnimalLocation, AnimalRollup, Bovinos, EmissionLog, FinanceLog, LogChunk, Lotes,
+    Movimientos_Animales, Pesajes_Canales, Registros_Sanitarios, WeightLog, dialect_insert
+)
+
+def refresh_animal_rollups(animal_ids=None):
+    """Recompute the rollup rows of the given animals from their records (every animal when None)."""
+    def latest(column, time_column, animal_column):
+        return (db.select(column).where(animal_column == Bovinos.BovinoID)
+                .order_by(time_column.desc().nulls_last()).limit(1).scalar_subquery())
+
+    def total(expression, animal_column):
+        return (db.select(db.func.coalesce(db.func.sum(expression), 0))
+                .where(animal_column == Bovinos.BovinoID).scalar_subquery())
+
+    # Emission readings packed into log_chunks count through each chunk's sums
+    packed_emissions = (
+        db.select(db.func.coalesce(db.func.sum(
+            LogChunk.sums['co2_emissions'].as_float() + LogChunk.sums['methane_emissions'].as_float()), 0))
+        .where(LogChunk.log_table == 'emission_logs', LogChunk.parent_id == Bovinos.BovinoID).scalar_subquery()
+    )
+
+    rollups = AnimalRollup.__table__
+    values = {
+        'BovinoID': Bovinos.BovinoID,
+        'latest_weight_kg': latest(WeightLog.weight_kg, WeightLog.measured_at, WeightLog.animal_id),
+        'latest_weight_at': latest(WeightLog.measured_at, WeightLog.measured_at, WeightLog.animal_id),
+        'total_emissions': total(EmissionLog.co2_emissions + EmissionLog.methane_emissions, EmissionLog.animal_id)
+                           + packed_emissions,
+        'total_costs': total(FinanceLog.cost_feed + FinanceLog.cost_medical, FinanceLog.animal_id),
+        'total_revenue': total(FinanceLog.revenue_sale, FinanceLog.animal_id),
+        'latest_health': latest(Registros_Sanitarios.Estado_Salud, Registros_Sanitarios.Fecha_Muestra, Registros_Sanitarios.BovinoID),
+        'latest_health_at': latest(Registros_Sanitarios.Fecha_Muestra, Registros_Sanitarios.Fecha_Muestra, Registros_Sanitarios.BovinoID),
+        'carcass_weight_kg': latest(Pesajes_Canales.Peso_Canal, Pesajes_Canales.Fecha_Sacrificio, Pesajes_Canales.BovinoID),
+        'carcass_live_weight_kg': latest(Pesajes_Canales.Peso_Vivo, Pesajes_Canales.Fecha_Sacrificio, Pesajes_Canales.BovinoID),
+        'carcass_yield_percent': latest(Pesajes_Canales.Rendimiento, Pesajes_Canales.Fecha_Sacrificio, Pesajes_Canales.BovinoID),
+        'slaughter_date': latest(Pesajes_Canales.Fecha_Sacrificio, Pesajes_Canales.Fecha_Sacrificio, Pesajes_Canales.BovinoID),
+    }
+    source = db.select(*values.values())
+    delete = rollups.delete()
+    if animal_ids is not None:
+        source = source.where(Bovinos.BovinoID.in_(animal_ids))
+        delete = delete.where(rollups.c.BovinoID.in_(animal_ids))
+    db.session.execute(delete)
+    db.session.execute(rollups.insert().from_select(list(values), source))
+
+def rollup_delta(animal_id, emissions=0, costs=0, revenue=0, weight_kg=None, weighed_at=None):
+    return {
+        'BovinoID': animal_id,
+        'total_emissions': emissions,
+        'total_costs': costs,
+        'total_revenue': revenue,
+        'latest_weight_kg': weight_kg,
+        'latest_weight_at': weighed_at,
+    }
+
+def merge_rollup_deltas(deltas):
+    """Combine deltas of the same animal so a batch needs one upsert per animal."""
+    merged = {}
+    for delta in deltas:
+        current = merged.get(delta['BovinoID'])
+        if current is None:
+            merged[delta['BovinoID']] = dict(delta)
+            continue
+        for field in ('total_emissions', 'total_costs', 'total_revenue'):
+            current[field] += delta[field]
+        if delta['latest_weight_at'] is not None and (
+                current['latest_weight_at'] is None or delta['latest_weight_at'] >= current['latest_weight_at']):
+            current['latest_weight_kg'] = delta['latest_weight_kg']
+            current['latest_weight_at'] = delta['latest_weight_at']
+    return list(merged.values())
+
+def add_to_rollups(deltas):
+    """Apply rollup_delta() dicts for newly inserted logs: totals are added, the latest weight kept."""
+    if not deltas:
+        return
+    rollups = AnimalRollup.__table__
+    insert = dialect_insert(rollups)
+    newer_weight = insert.excluded.latest_weight_at.is_not(None) & (
+        rollups.c.latest_weight_at.is_(None) | (insert.excluded.latest_weight_at >= rollups.c.latest_weight_at)
+    )
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=[rollups.c.BovinoID],
+        set_={
+            'total_emissions': rollups.c.total_emissions + insert.excluded.total_emissions,
+            'total_costs': rollups.c.total_costs + insert.excluded.total_costs,
+            'total_revenue': rollups.c.total_revenue + insert.excluded.total_revenue,
+            'latest_weight_kg': db.case((newer_weight, insert.excluded.latest_weight_kg), else_=rollups.c.latest_weight_kg),
+            'latest_weight_at': db.case((newer_weight, insert.excluded.latest_weight_at), else_=rollups.c.latest_weight_at),
+        }
+    ), deltas)
+
+def parse_lot_id(value):
+    """LoteID from a movement's Lote_Origen/Lote_Destino string, or None if it is not a lot number."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+def lot_exists(value):
+    lot_id = parse_lot_id(value)
+    return lot_id is not None and db.session.get(Lotes, lot_id) is not None
+
+def refresh_animal_locations(animal_ids=None):
+    """Rebuild the lot history of the given animals (every animal when None) from their movements.
+
+    The stay before the first dated movement is on its Lote_Origen or, when that is missing, on
+    the lot already recorded for that stay: the animal's registered lot, which the refresh after
+    its creation records. Each movement closes the current stay and, when it has a Lote_Destino,
+    opens the next one; the animal's FincaID/LoteID follow its open stay.
+    """
+    animals = db.select(Bovinos.BovinoID, Bovinos.FincaID, Bovinos.LoteID)
+    movements = (db.select(Movimientos_Animales.BovinoID, Movimientos_Animales.MovID, Movimientos_Animales.Fecha,
+                           Movimientos_Animales.Lote_Origen, Movimientos_Animales.Lote_Destino)
+                 .where(Movimientos_Animales.Fecha.is_not(None))
+                 .order_by(Movimientos_Animales.BovinoID, Movimientos_Animales.Fecha, Movimientos_Animales.MovID))
+    locations = AnimalLocation.__table__
+    initial = db.select(locations.c.BovinoID, locations.c.LoteID).where(locations.c.valid_from.is_(None))
+    delete = locations.delete()
+    if animal_ids is not None:
+        animal_ids = list(animal_ids)
+        animals = animals.where(Bovinos.BovinoID.in_(animal_ids))
+        movements = movements.where(Movimientos_Animales.BovinoID.in_(animal_ids))
+        initial = initial.where(locations.c.BovinoID.in_(animal_ids))
+        delete = delete.where(locations.c.BovinoID.in_(animal_ids))
+    farm_of_lot = dict(db.session.execute(db.select(Lotes.LoteID, Lotes.FincaID)).all())
+    initial_lot = dict(db.session.execute(initial).all())
+
+    moves_by_animal = {}
+    for move in db.session.execute(movements):
+        moves_by_animal.setdefault(move.BovinoID, []).append(move)
+
+    rows = []
+    current = []
+    for animal in db.session.execute(animals).all():
+        moves = moves_by_animal.get(animal.BovinoID, [])
+        first_lot = parse_lot_id(moves[0].Lote_Origen) if moves else None
+        if first_lot not in farm_of_lot:
+            # Until a refresh records it, the animal's LoteID is still the one it was registered on
+            first_lot = initial_lot.get(animal.BovinoID, animal.LoteID)
+        stay = (first_lot, None, None)
+        for move in moves:
+            if stay and stay[1] != move.Fecha:
+                rows.append({'BovinoID': animal.BovinoID, 'FincaID': farm_of_lot.get(stay[0], animal.FincaID),
+                             'LoteID': stay[0], 'valid_from': stay[1], 'valid_to': move.Fecha, 'MovID': stay[2]})
+            lot = parse_lot_id(move.Lote_Destino)
+            stay = (lot, move.Fecha, move.MovID) if lot in farm_of_lot else None
+        if stay:
+            rows.append({'BovinoID': animal.BovinoID, 'FincaID': farm_of_lot.get(stay[0], animal.FincaID),
+                         'LoteID': stay[0], 'valid_from': stay[1], 'valid_to': None, 'MovID': stay[2]})
+            if stay[0] != animal.LoteID:
+                current.append({'_id': animal.BovinoID, 'LoteID': stay[0], 'FincaID': farm_of_lot[stay[0]]})
+
+    db.session.execute(delete)
+    if rows:
+        db.session.execute(locations.insert(), rows)
+    if current:
+        bovinos = Bovinos.__table__
+        db.session.execute(bovinos.update().where(bovinos.c.BovinoID == db.bindparam('_id')), current)
+
+def parse_as_of(value):
+    """Datetime of an ?at= parameter, now when it is missing; raises ValueError when malformed."""
+    return datetime.fromisoformat(value) if value else datetime.utcnow()
+
+def stays_at(at):
+    """Condition on AnimalLocation for the stays that include the moment at."""
+    return db.and_(
+        db.or_(AnimalLocation.valid_from.is_(None), AnimalLocation.valid_from <= at),
+        db.or_(AnimalLocation.valid_to.is_(None), AnimalLocation.valid_to > at)
+    )
+
+# Analytics cache
+# The LocalCache or RedisCache that create_app() set up for the current app
+analytics_cache = LocalProxy(lambda: current_app.extensions['analytics_cache'])
+
+def invalidate_analytics(animal_ids=(), lot_ids=(), farm_ids=(), with_lots=True):
+    """Queue the cache keys a write affects; they are dropped when the transaction commits.
+
+    An animal affects its own analytics and, with_lots, every lot it is or has been on and
+    their farms (weights, carcasses and headcounts feed those; health, emission and finance
+    records do not). A lot affects its farm. Call it before deleting a row, so its lot and
+    farm can still be found.
+    """
+    animal_ids, lot_ids, farm_ids = set(animal_ids), set(lot_ids), set(farm_ids)
+    if animal_ids and with_lots:
+        for lot_id, farm_id in db.session.execute(
+                db.select(Bovinos.LoteID, Bovinos.FincaID).where(Bovinos.BovinoID.in_(animal_ids))):
+            lot_ids.add(lot_id)
+            farm_ids.add(farm_id)
+        lot_ids.update(db.session.scalars(
+            db.select(AnimalLocation.LoteID).where(AnimalLocation.BovinoID.in_(animal_ids)).distinct()))
+    if lot_ids:
+        farm_ids.update(db.session.scalars(db.select(Lotes.FincaID).where(Lotes.LoteID.in_(lot_ids))))
+    keys = db.session.info.setdefault('analytics_keys', set())
+    keys.update(f'animal:{animal_id}' for animal_id in animal_ids)
+    keys.update(f'land:{lot_id}' for lot_id in lot_ids)
+    keys.update(f'farm:{farm_id}' for farm_id in farm_ids)
+
+@event.listens_for(db.session, 'after_commit')
+def drop_invalidated_analytics(session):
+    keys = session.info.pop('analytics_keys', None)
+    if keys:
+        analytics_cache.invalidate(keys)
+
+@event.listens_for(db.session, 'after_transaction_end')
+def forget_invalidated_analytics(session, transaction):
+    # A rolled back transaction changed nothing (commits already took their keys)
+    if transaction.parent is None:
+        session.info.pop('analytics_keys', None)
+
+def cached_analytics(key, compute):
+    """JSON response of compute(), cached under key per query string and tagged with an ETag,
+    so a client polling with If-None-Match gets a 304 while nothing changed."""
+    variant = request.query_string.decode()
+    entry = analytics_cache.get(key, variant)
+    if entry is None:
+        body = jsonify(compute()).get_data()
+        entry = (hashlib.sha1(body).hexdigest(), body)
+        analytics_cache.set(key, variant, entry)
+    etag, body = entry
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'  # always revalidate, the ETag makes that cheap
+    return response
@@ -0,0 +1,63 @@
+"""Average daily gain (ADG) from weight logs.
+
+ADG is the slope of a least-squares line through an animal's weighings
+(kg per day). The fit is computed for every animal at once with NumPy
+group sums, so a whole herd costs one pass over its weight logs.
+"""
+import numpy as np
+
+def daily_gain_by_animal(rows, window_days=None):
+    """Least-squares weight gain per day for each animal.
+
+    rows: (animal_id, day number, weight_kg) tuples sorted by animal_id, where the
+    day number is any float day scale (e.g. julianday()); neither may be None.
+    window_days: only use weighings from the last N days before each animal's
+    latest weighing; None uses the whole history.
+
+    Returns {animal_id: kg per day}. Animals with fewer than two weighings on
+    different days have no gain and are left out.
+    """
+    if not rows:
+        return {}
+    ids, days, weights = zip(*rows)
+    ids = np.array(ids, dtype=object)
+    days = np.array(days, dtype=float)
+    weights = np.array(weights, dtype=float)
+
+    # Rows are sorted by animal, so each animal is a contiguous run starting at `starts`
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    groups = len(starts)
+    group = np.repeat(np.arange(groups), np.diff(np.r_[starts, len(ids)]))
+
+    if window_days is not None:
+        latest = np.maximum.reduceat(days, starts)
+        keep = days >= latest[group] - window_days
+        days, weights, group = days[keep], weights[keep], group[keep]
+
+    # Slope = sum(dx * dy) / sum(dx^2) with x and y centred on each animal's means
+    counts = np.bincount(group, minlength=groups)
+    mean_day = np.bincount(group, days, groups) / counts
+    mean_weight = np.bincount(group, weights, groups) / counts
+    dx = days - mean_day[group]
+    dy = weights - mean_weight[group]
+    sxx = np.bincount(group, dx * dx, groups)
+    sxy = np.bincount(group, dx * dy, groups)
+
+    valid = np.flatnonzero((counts >= 2) & (sxx > 0))
+    slopes = sxy[valid] / sxx[valid]
+    return dict(zip(ids[starts[valid]].tolist(), slopes.tolist()))
+
+def mean_gain_by(gains, assignments):
+    """Average animal gains per group.
+
+    assignments: (animal_id, group key) pairs, e.g. (BovinoID, LoteID).
+    Returns {group key: mean kg per day} for groups with at least one animal gain.
+    """
+    totals = {}
+    for animal_id, key in assignments:
+        gain = gains.get(animal_id)
+        if gain is None:
+            continue
+        total, count = totals.get(key, (0.0, 0))
+        totals[key] = (total + gain, count + 1)
+    return {key: total / count for key, (total, count) in totals.items()}
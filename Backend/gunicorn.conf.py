@@ -0,0 +1,42 @@
+"""Gunicorn settings for serving the app in production (run from Backend/):
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every setting can be overridden with the environment variables below or on the
+command line.
+"""
+import multiprocessing
+import os
+
+chdir = os.path.dirname(os.path.abspath(__file__))  # livestock.db and uploads/ are relative paths
+bind = os.environ.get('BIND', '127.0.0.1:8000')
+
+# WAL, busy_timeout and a pool sized for the threads below (see SQLITE_PROFILES in app.py)
+os.environ.setdefault('SQLITE_PROFILE', 'production')
+
+# Threaded workers keep idle keep-alive connections open without tying up a process
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))  # longer than the proxy's upstream keep-alive
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+
+# Create the app once in the master, so the workers share the loaded code instead of
+# importing it each (the schema is created beforehand with `flask --app app init-db`)
+preload_app = True
+
+# Replace workers now and then, so slow growth of a process's memory never accumulates
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 5000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+def post_fork(server, worker):
+    # Connections the master opened while loading the app must not be shared: a forked worker
+    # opens its own instead of using those sockets and file handles
+    from models import db
+    from wsgi import app
+    with app.app_context():
+        db.engine.dispose(close=False)
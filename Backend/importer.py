@@ -0,0 +1,100 @@
+"""Sheet readers for the bulk import (see import_sheets() in blueprints/data.py).
+
+A workbook in the layout of relaciones_ganaderia.xlsx has one sheet per table,
+named after it, with a header row of column names. CSV files are read as a
+single sheet named after the file (bovinos.csv -> bovinos). Rows are read
+lazily, so files of any size are streamed rather than loaded into memory.
+
+Usage (from Backend/): flask --app app import-data relaciones_ganaderia.xlsx
+"""
+import csv
+import io
+import os
+import unicodedata
+from datetime import date, datetime
+
+# Workbook headers that differ from the model column they fill (normalized names)
+HEADER_ALIASES = {
+    'fecha_nacimiento': 'fecha_nac',
+    'estado_salud': 'estado',
+    'actividad_actual_del_ganado': 'actividad_ganado',
+    'unidades': 'unidad',
+    'porcentajemasa': 'porcentajems',
+}
+
+def normalize_name(name):
+    """Compare sheet and column names ignoring case, accents, spaces and trailing notes.
+
+    'Nombre_Lote/identificacion interna' -> 'nombre_lote', 'Propósito' -> 'proposito'.
+    """
+    text = str(name or '').split('/')[0].split(' - ')[0].strip()
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return '_'.join(text.lower().split())
+
+def match_columns(header, columns):
+    """Map each header position to a column name, or None when it has no column.
+
+    columns: the model's column names.
+    """
+    by_name = {normalize_name(column): column for column in columns}
+    matched = []
+    for cell in header:
+        name = normalize_name(cell)
+        matched.append(by_name.get(name) or by_name.get(HEADER_ALIASES.get(name)))
+    return matched
+
+def read_sheets(stream, filename):
+    """List (normalized sheet name, header, rows iterator) for an .xlsx or .csv file.
+
+    stream: a binary file object (an open file or an uploaded file's stream); it
+    must stay open while the rows are read.
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    if extension == '.csv':
+        reader = csv.reader(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+        header = next(reader, [])
+        return [(normalize_name(os.path.splitext(os.path.basename(filename))[0]), header, reader)]
+    if extension == '.xlsx':
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ValueError('Reading .xlsx files requires openpyxl (pip install openpyxl)')
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+        except Exception:
+            raise ValueError(f'{filename} is not a valid .xlsx workbook')
+        sheets = []
+        for sheet in workbook.worksheets:
+            rows = sheet.iter_rows(values_only=True)
+            sheets.append((normalize_name(sheet.title), next(rows, ()), rows))
+        return sheets
+    raise ValueError(f'{filename}: only .xlsx and .csv files can be imported')
+
+def coerce_cell(value, python_type):
+    """Convert a spreadsheet cell to python_type; blank cells become None.
+
+    Raises ValueError when the value cannot be converted.
+    """
+    if isinstance(value, str):
+        value = value.strip()
+    if value is None or value == '':
+        return None
+    if python_type is datetime:
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, date):
+            return datetime(value.year, value.month, value.day)
+        return datetime.fromisoformat(str(value))
+    if python_type is int:
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f'{value} is not a whole number')
+        return int(number)
+    if python_type is float:
+        return float(value)
+    if isinstance(value, float) and value.is_integer():
+        # Excel stores codes typed as numbers as floats (12 -> 12.0)
+        return str(int(value))
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
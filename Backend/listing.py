@@ -0,0 +1,202 @@
+"""Filtering, keyset pagination and serialization shared by the list endpoints."""
+import base64
+import heapq
+import json
+from datetime import date, datetime
+from itertools import islice
+from operator import itemgetter
+
+from flask import current_app, jsonify, request
+
+from logs import chunk_readings, packed_log_spec
+from models import db, LogChunk
+
+try:
+    import orjson  # optional (pip install orjson): encodes list pages several times faster
+except ImportError:
+    orjson = None
+
+# Helper functions for list endpoints
+MAX_PAGE_SIZE = 1000
+
+# Columns list endpoints can filter on, mapped to the query parameter used for them
+# (the log tables name the same foreign keys animal_id and land_id)
+LIST_FILTER_PARAMS = {
+    'FincaID': 'FincaID',
+    'LoteID': 'LoteID',
+    'BovinoID': 'BovinoID',
+    'animal_id': 'BovinoID',
+    'land_id': 'LoteID',
+}
+
+class ListQueryError(ValueError):
+    pass
+
+def encode_cursor(value):
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode()
+
+def decode_cursor(cursor, python_type):
+    """The primary key value a cursor holds, which must be of the key's type."""
+    try:
+        value = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ListQueryError('Invalid cursor')
+    if isinstance(value, bool) or not isinstance(value, python_type):
+        raise ListQueryError('Invalid cursor')
+    return value
+
+def serialize_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def encode_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def dumps(value):
+    """JSON bytes of value, with dates and datetimes as ISO strings (orjson writes them the same way)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, default=encode_default, ensure_ascii=False, separators=(',', ':')).encode()
+
+def json_response(value, status=200):
+    """Like jsonify(), but encoded with dumps(): keys keep their order and rows need no conversion."""
+    return current_app.response_class(dumps(value), status=status, mimetype='application/json')
+
+def list_query(model, args, date_column=None):
+    """Build the column projection and filtered, keyset-paginated select for a list endpoint.
+
+    Supported query parameters:
+      fields     comma separated column names to return (default: all columns)
+      FincaID, LoteID, BovinoID   equality filters, where the model has the column
+      date_from, date_to          inclusive ISO date range on date_column
+      limit      page size (max MAX_PAGE_SIZE); without it every row is returned
+      cursor     value of X-Next-Cursor from the previous page
+    """
+    columns = {c.key: c for c in model.__table__.columns}
+    pk = model.__mapper__.primary_key[0]
+
+    if args.get('fields'):
+        names = [name.strip() for name in args['fields'].split(',') if name.strip()]
+        unknown = [name for name in names if name not in columns]
+        if unknown:
+            raise ListQueryError(f"Unknown fields: {', '.join(unknown)}")
+    else:
+        names = list(columns)
+
+    # The primary key is always selected so the next cursor can be built
+    selected = names if pk.key in names else names + [pk.key]
+    query = db.select(*[columns[name] for name in selected]).order_by(pk)
+
+    for key, column in columns.items():
+        param = LIST_FILTER_PARAMS.get(key)
+        if param and args.get(param) is not None:
+            try:
+                value = column.type.python_type(args[param])
+            except ValueError:
+                raise ListQueryError(f'Invalid value for {param}')
+            query = query.where(column == value)
+
+    if date_column is not None:
+        try:
+            if args.get('date_from'):
+                query = query.where(date_column >= datetime.fromisoformat(args['date_from']))
+            if args.get('date_to'):
+                query = query.where(date_column <= datetime.fromisoformat(args['date_to']))
+        except ValueError:
+            raise ListQueryError('date_from and date_to must be ISO dates')
+
+    if args.get('cursor'):
+        query = query.where(pk > decode_cursor(args['cursor'], pk.type.python_type))
+
+    page_size = None
+    if args.get('limit') is not None:
+        # Checked here rather than with type=int, which would turn limit=abc into no limit at all
+        limit = args['limit'].strip().lstrip('0')
+        if not (limit.isascii() and limit.isdigit()):
+            raise ListQueryError('limit must be a positive integer')
+        # Larger limits are capped; one with more digits than MAX_PAGE_SIZE needn't be parsed
+        page_size = MAX_PAGE_SIZE if len(limit) > len(str(MAX_PAGE_SIZE)) else min(int(limit), MAX_PAGE_SIZE)
+        # Fetch one extra row to know whether there is a next page
+        query = query.limit(page_size + 1)
+
+    return names, selected, query, page_size
+
+def list_rows(model, query, selected, args, date_column=None, yield_per=None):
+    """Rows of a list_query() select; those of a packed log table are merged in id order with
+    the readings of its chunks that match the same parameters (see packed_log_rows)."""
+    if yield_per:
+        query = query.execution_options(yield_per=yield_per)
+    rows = db.session.execute(query)
+    spec = packed_log_spec(model)
+    if spec is None:
+        return rows
+    pk_index = selected.index(model.__mapper__.primary_key[0].key)
+    return heapq.merge(rows, packed_log_rows(spec, args, date_column, selected), key=itemgetter(pk_index))
+
+def list_response(model, date_column=None):
+    try:
+        names, selected, query, page_size = list_query(model, request.args, date_column)
+    except ListQueryError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows = list(islice(list_rows(model, query, selected, request.args, date_column),
+                       None if page_size is None else page_size + 1))
+    next_cursor = None
+    if page_size is not None and len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][selected.index(model.__mapper__.primary_key[0].key)])
+
+    # names is a prefix of selected (the primary key may follow), so zip() stops before it
+    response = json_response([dict(zip(names, row)) for row in rows])
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
+
+def packed_log_rows(spec, args, date_column, selected):
+    """Packed readings matching the list_query() parameters, as tuples of the selected columns in id order.
+
+    Chunks are read in first_id order and decoded only when the merge reaches them,
+    so a limited page decodes just the chunks its ids fall into.
+    """
+    key, timestamp = spec['key'], spec['timestamp']
+    table = spec['model'].__table__
+    query = db.select(LogChunk).where(LogChunk.log_table == table.name).order_by(LogChunk.first_id)
+    parent = args.get(LIST_FILTER_PARAMS[key])
+    if parent is not None:
+        parent = table.c[key].type.python_type(parent)
+        query = query.where(LogChunk.parent_id == str(parent))
+    low = datetime.fromisoformat(args['date_from']) if date_column is not None and args.get('date_from') else None
+    high = datetime.fromisoformat(args['date_to']) if date_column is not None and args.get('date_to') else None
+    if low:
+        query = query.where(LogChunk.last_at >= low)
+    if high:
+        query = query.where(LogChunk.first_at <= high)
+    after = decode_cursor(args['cursor'], table.c.id.type.python_type) if args.get('cursor') else None
+    if after is not None:
+        query = query.where(LogChunk.last_id > after)
+
+    def matching(chunk):
+        for reading in chunk_readings(spec, chunk):
+            moment = reading[timestamp]
+            if (after is None or reading['id'] > after) and (low is None or moment >= low) and (high is None or moment <= high):
+                yield tuple(reading[name] for name in selected)
+
+    pk_index = selected.index('id')
+    heap = []
+    def push(readings):
+        row = next(readings, None)
+        if row is not None:
+            heapq.heappush(heap, (row[pk_index], id(readings), row, readings))
+
+    for chunk in db.session.scalars(query.execution_options(yield_per=100)):
+        # Every reading below this chunk's first id is already in the heap
+        while heap and heap[0][0] < chunk.first_id:
+            _, _, row, readings = heapq.heappop(heap)
+            yield row
+            push(readings)
+        push(matching(chunk))
+    while heap:
+        _, _, row, readings = heapq.heappop(heap)
+        yield row
+        push(readings)
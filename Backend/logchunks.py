@@ -0,0 +1,71 @@
+"""Compact encoding of log readings packed into chunks (see the log_chunks table in models.py).
+
+A chunk holds the readings of one animal or lot for one day as columns:
+ids and timestamps (microseconds) delta-encoded, each value field XORed with
+the previous value (repeated or slowly changing sensor values become runs of
+zero bits), all of them byte-shuffled and zlib-compressed. Decoding gives the
+readings back exactly, in id order.
+"""
+import zlib
+
+import numpy as np
+
+def _shuffle(array):
+    # Group the n-th byte of every element together, so zlib sees the long zero runs
+    return array.view(np.uint8).reshape(-1, array.itemsize).T.tobytes()
+
+def _unshuffle(data, dtype, count):
+    return np.frombuffer(data, dtype=np.uint8).reshape(np.dtype(dtype).itemsize, count).T.copy().view(dtype).ravel()
+
+def encode(ids, times, values):
+    """Pack readings into bytes.
+
+    ids: int64 array, times: datetime64[us] array, values: float64 array of shape
+    (readings, fields), NaN for missing values. The readings must be sorted by id.
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    micros = np.asarray(times, dtype='datetime64[us]').astype(np.int64)
+    bits = np.ascontiguousarray(values, dtype=np.float64).view(np.uint64)
+    parts = [np.diff(ids, prepend=0), np.diff(micros, prepend=0)]
+    for field in bits.T:
+        parts.append(np.bitwise_xor(field, np.concatenate((np.zeros(1, np.uint64), field[:-1]))))
+    return zlib.compress(b''.join(_shuffle(np.ascontiguousarray(part)) for part in parts))
+
+def decode(data, count, fields):
+    """Inverse of encode(): (ids, times, values) for a chunk of count readings with fields value fields."""
+    raw = zlib.decompress(data)
+    size = count * 8
+    parts = [_unshuffle(raw[i * size:(i + 1) * size], np.uint64, count) for i in range(2 + fields)]
+    ids = np.cumsum(parts[0].view(np.int64))
+    times = np.cumsum(parts[1].view(np.int64)).astype('datetime64[us]')
+    values = np.empty((count, fields), dtype=np.float64)
+    for i, part in enumerate(parts[2:]):
+        values[:, i] = np.bitwise_xor.accumulate(part).view(np.float64)
+    return ids, times, values
+
+def downsample(ids, times, values, seconds, how):
+    """Merge the readings of each interval of the given length into one reading.
+
+    The merged reading is timestamped at the start of its interval and keeps the
+    id of the interval's latest reading; its values are the sum ('sum', for amounts)
+    or the mean ('mean', for levels) of the interval's values, ignoring NaNs.
+    Returns arrays sorted by id, as encode() expects.
+    """
+    step = np.int64(seconds * 1_000_000)
+    micros = np.asarray(times, dtype='datetime64[us]').astype(np.int64)
+    slots = micros - micros % step
+    order = np.lexsort((ids, micros))  # within a slot, the latest reading comes last
+    slots, ids, values = slots[order], np.asarray(ids)[order], values[order]
+    starts = np.flatnonzero(np.r_[True, slots[1:] != slots[:-1]])
+    ends = np.r_[starts[1:], len(slots)]
+    known = ~np.isnan(values)
+    totals = np.add.reduceat(np.where(known, values, 0.0), starts)
+    if how == 'mean':
+        counts = np.add.reduceat(known, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            totals = np.where(counts > 0, totals / counts, np.nan)
+    else:
+        totals = np.where(np.add.reduceat(known, starts) > 0, totals, np.nan)
+    merged_ids = ids[ends - 1]
+    order = np.argsort(merged_ids, kind='stable')
+    return merged_ids[order], slots[starts][order].astype('datetime64[us]'), totals[order]
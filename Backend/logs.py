@@ -0,0 +1,430 @@
+"""Log tables: bulk ingest, day/week/month buckets and packed storage of old readings."""
+import io
+import json
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app, jsonify, request
+
+import logchunks
+from derived import add_to_rollups, invalidate_analytics, merge_rollup_deltas, rollup_delta
+from models import (
+    db, AnimalLocation, Bovinos, EmissionLog, FinanceLog, Fincas, LogBucket, LogChunk, Lotes,
+    ResourceLog, WeightLog, dialect_insert
+)
+
+# Bulk log ingest
+# Readings from scales and sensor gateways arrive as a JSON array or as an NDJSON
+# stream (one object per line, Content-Type: application/x-ndjson). Every row is
+# validated on its own, the valid ones are inserted with executemany in batches,
+# and the whole request is committed as a single transaction.
+BULK_BATCH_SIZE = 5000
+BULK_READ_BUFFER = 64 * 1024
+
+# key: the foreign key field and the column it must exist in
+# numbers: numeric fields and their default (None means required)
+# rollup: optional function turning a row into its animal rollup delta
+# downsample: how readings are merged past LOG_RETENTION_DAYS ('sum' for amounts, 'mean' for
+#   levels); the tables that have it are the ones LOG_STORAGE=packed packs into log_chunks
+BULK_LOG_SPECS = {
+    'weight_logs': {
+        'model': WeightLog, 'key': 'animal_id', 'parent': Bovinos.BovinoID,
+        'numbers': {'weight_kg': None}, 'timestamp': 'measured_at',
+        'rollup': lambda row: rollup_delta(row['animal_id'], weight_kg=row['weight_kg'], weighed_at=row['measured_at'])
+    },
+    'emission_logs': {
+        'model': EmissionLog, 'key': 'animal_id', 'parent': Bovinos.BovinoID,
+        'numbers': {'co2_emissions': 0, 'methane_emissions': 0}, 'timestamp': 'logged_at', 'downsample': 'sum',
+        'rollup': lambda row: rollup_delta(row['animal_id'], emissions=row['co2_emissions'] + row['methane_emissions'])
+    },
+    'finance_logs': {
+        'model': FinanceLog, 'key': 'animal_id', 'parent': Bovinos.BovinoID,
+        'numbers': {'cost_feed': 0, 'cost_medical': 0, 'revenue_sale': 0}, 'timestamp': 'logged_at',
+        'rollup': lambda row: rollup_delta(row['animal_id'], costs=row['cost_feed'] + row['cost_medical'],
+                                           revenue=row['revenue_sale'])
+    },
+    'resource_logs': {
+        'model': ResourceLog, 'key': 'land_id', 'parent': Lotes.LoteID,
+        'numbers': {'feed_available': 0, 'water_available': 0}, 'timestamp': 'logged_at', 'downsample': 'mean'
+    },
+}
+
+def iter_bulk_items():
+    """Yield the submitted items, or a ValueError in place of an unparseable NDJSON line."""
+    if request.mimetype in ('application/x-ndjson', 'application/jsonlines'):
+        # Buffer the raw WSGI stream, which is otherwise read a byte at a time per line
+        for line in io.BufferedReader(request.stream, BULK_READ_BUFFER):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield ValueError('Invalid JSON')
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, list):
+            raise ValueError('Expected a JSON array or an NDJSON body')
+        yield from data
+
+def validate_log_row(item, spec):
+    if isinstance(item, Exception):
+        raise item
+    if not isinstance(item, dict):
+        raise ValueError('Row must be a JSON object')
+    table = spec['model'].__table__
+    key = spec['key']
+    if item.get(key) in (None, ''):
+        raise ValueError(f'{key} is required')
+    try:
+        row = {key: table.c[key].type.python_type(item[key])}
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid value for {key}')
+    for field, default in spec['numbers'].items():
+        value = item.get(field, default)
+        if value is None:
+            raise ValueError(f'{field} is required')
+        try:
+            if isinstance(value, bool):
+                raise TypeError
+            row[field] = float(value)
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f'{field} must be a number')
+        # NaN would be stored as NULL and infinities can't be written back as JSON
+        if not math.isfinite(row[field]):
+            raise ValueError(f'{field} must be a finite number')
+    timestamp = spec['timestamp']
+    try:
+        row[timestamp] = datetime.fromisoformat(item[timestamp]) if item.get(timestamp) else datetime.utcnow()
+    except (TypeError, ValueError):
+        raise ValueError(f'{timestamp} must be an ISO date')
+    return row
+
+def insert_log_batch(spec, batch, errors):
+    """Drop rows whose parent does not exist, insert the rest and return how many were inserted."""
+    key = spec['key']
+    keys = {row[key] for _, row in batch}
+    existing = set(db.session.scalars(db.select(spec['parent']).where(spec['parent'].in_(keys))))
+    rows = []
+    for index, row in batch:
+        if row[key] in existing:
+            rows.append(row)
+        else:
+            errors.append({'row': index, 'error': f'{key} {row[key]} does not exist'})
+    if rows:
+        db.session.execute(spec['model'].__table__.insert(), rows)
+        logs_added(spec, rows)
+    return len(rows)
+
+def logs_added(spec, rows):
+    """Bring the rollups, buckets and analytics cache up to date with newly inserted log rows."""
+    key = spec['key']
+    if spec.get('rollup'):
+        add_to_rollups(merge_rollup_deltas(spec['rollup'](row) for row in rows))
+    add_to_log_buckets(spec, rows)
+    if spec['parent'] is Lotes.LoteID:
+        invalidate_analytics(lot_ids={row[key] for row in rows})
+    else:
+        # Of the animal logs, only weights feed the lot and farm figures (daily gain)
+        invalidate_analytics(animal_ids={row[key] for row in rows}, with_lots=spec['model'] is WeightLog)
+
+def bulk_insert_logs(spec):
+    inserted = 0
+    errors = []
+    batch = []
+    try:
+        for index, item in enumerate(iter_bulk_items()):
+            try:
+                batch.append((index, validate_log_row(item, spec)))
+            except ValueError as e:
+                errors.append({'row': index, 'error': str(e)})
+            if len(batch) >= BULK_BATCH_SIZE:
+                inserted += insert_log_batch(spec, batch, errors)
+                batch = []
+        if batch:
+            inserted += insert_log_batch(spec, batch, errors)
+        db.session.commit()
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Bulk insert into %s failed', spec['model'].__tablename__)
+        return jsonify({'error': 'Bulk insert failed, nothing was written'}), 500
+
+    errors.sort(key=lambda error: error['row'])
+    status = 400 if errors and not inserted else 201
+    return jsonify({'inserted': inserted, 'rejected': len(errors), 'errors': errors}), status
+
+# Log buckets
+# Time series of the log fields are read from log_buckets: count, sum, min, max and last
+# value per metric, entity (animal, land, farm) and day/week/month bucket, upserted by
+# every log insert. An animal's reading also counts for the lot and farm it was on when
+# the reading was taken (animal_locations); rebuild-log-buckets recomputes everything,
+# e.g. after backdated movements, and compact-log-buckets drops old day/week buckets.
+BUCKET_SIZES = ('day', 'week', 'month')
+BUCKET_ENTITIES = {'animal': Bovinos, 'land': Lotes, 'farm': Fincas}
+LOG_BUCKET_REBUILD_ROWS = 50000
+
+# Metric -> the log table it comes from
+BUCKET_METRICS = {field: name for name, spec in BULK_LOG_SPECS.items() for field in spec['numbers']}
+
+def bucket_start(moment, size):
+    day = datetime(moment.year, moment.month, moment.day)
+    if size == 'week':
+        return day - timedelta(days=day.weekday())  # weeks start on Monday
+    if size == 'month':
+        return day.replace(day=1)
+    return day
+
+def bucket_places(spec, ids=None):
+    """Where the logs' parents belong (every one when ids is None): the lot stays
+    {BovinoID: [(valid_from, valid_to, LoteID, FincaID)]} of animals, or {LoteID: FincaID} of lots."""
+    if spec['parent'] is Lotes.LoteID:
+        query = db.select(Lotes.LoteID, Lotes.FincaID)
+        if ids is not None:
+            query = query.where(Lotes.LoteID.in_(ids))
+        return dict(db.session.execute(query).all())
+    query = db.select(AnimalLocation.BovinoID, AnimalLocation.valid_from, AnimalLocation.valid_to,
+                      AnimalLocation.LoteID, AnimalLocation.FincaID)
+    if ids is not None:
+        query = query.where(AnimalLocation.BovinoID.in_(ids))
+    stays = {}
+    for animal_id, *stay in db.session.execute(query):
+        stays.setdefault(animal_id, []).append(stay)
+    return stays
+
+def place_at(stays, moment):
+    """(LoteID, FincaID) of the stay covering moment, (None, None) when the animal was on no lot."""
+    for valid_from, valid_to, lot_id, farm_id in stays:
+        if (valid_from is None or valid_from <= moment) and (valid_to is None or moment < valid_to):
+            return lot_id, farm_id
+    return None, None
+
+def aggregate_log_buckets(spec, rows, places, buckets):
+    """Fold log rows (dicts of the spec's fields) into buckets: {key: [count, total, min, max, last, last_at]}."""
+    key = spec['key']
+    timestamp = spec['timestamp']
+    for row in rows:
+        moment = row[timestamp]
+        if moment is None:
+            continue
+        if spec['parent'] is Lotes.LoteID:
+            entities = (('land', row[key]), ('farm', places.get(row[key])))
+        else:
+            entities = (('animal', row[key]), *zip(('land', 'farm'), place_at(places.get(row[key], ()), moment)))
+        starts = [(size, bucket_start(moment, size)) for size in BUCKET_SIZES]
+        for metric in spec['numbers']:
+            value = row[metric]
+            if value is None:
+                continue
+            for entity, entity_id in entities:
+                if entity_id is None:
+                    continue
+                for size, start in starts:
+                    bucket = buckets.get((metric, entity, str(entity_id), size, start))
+                    if bucket is None:
+                        buckets[metric, entity, str(entity_id), size, start] = [1, value, value, value, value, moment]
+                        continue
+                    bucket[0] += 1
+                    bucket[1] += value
+                    bucket[2] = min(bucket[2], value)
+                    bucket[3] = max(bucket[3], value)
+                    if moment >= bucket[5]:
+                        bucket[4], bucket[5] = value, moment
+
+def upsert_log_buckets(buckets):
+    """Merge aggregate_log_buckets() output into the stored buckets."""
+    if not buckets:
+        return
+    table = LogBucket.__table__
+    insert = dialect_insert(table)
+    newer = insert.excluded.last_at >= table.c.last_at
+    db.session.execute(insert.on_conflict_do_update(
+        index_elements=list(table.primary_key.columns),
+        set_={
+            'count': table.c.count + insert.excluded.count,
+            'total': table.c.total + insert.excluded.total,
+            'min_value': db.case((insert.excluded.min_value < table.c.min_value, insert.excluded.min_value),
+                                 else_=table.c.min_value),
+            'max_value': db.case((insert.excluded.max_value > table.c.max_value, insert.excluded.max_value),
+                                 else_=table.c.max_value),
+            'last_value': db.case((newer, insert.excluded.last_value), else_=table.c.last_value),
+            'last_at': db.case((newer, insert.excluded.last_at), else_=table.c.last_at),
+        }
+    ), [
+        dict(zip(('metric', 'entity', 'entity_id', 'bucket', 'bucket_start'), key),
+             count=count, total=total, min_value=low, max_value=high, last_value=last, last_at=last_at)
+        for key, (count, total, low, high, last, last_at) in buckets.items()
+    ])
+
+def add_to_log_buckets(spec, rows):
+    """Add newly inserted log rows (dicts of the spec's key, timestamp and number fields) to the buckets."""
+    buckets = {}
+    aggregate_log_buckets(spec, rows, bucket_places(spec, {row[spec['key']] for row in rows}), buckets)
+    upsert_log_buckets(buckets)
+
+def rebuild_log_buckets(table_names=None):
+    """Recompute the buckets of the given log tables (all of them when None) from the logs."""
+    for name in table_names or BULK_LOG_SPECS:
+        spec = BULK_LOG_SPECS[name]
+        model = spec['model']
+        db.session.execute(LogBucket.__table__.delete().where(LogBucket.metric.in_(list(spec['numbers']))))
+        places = bucket_places(spec)
+        columns = [model.id] + [getattr(model, field) for field in (spec['key'], spec['timestamp'], *spec['numbers'])]
+        last_id = None
+        while True:
+            query = db.select(*columns).order_by(model.id).limit(LOG_BUCKET_REBUILD_ROWS)
+            if last_id is not None:
+                query = query.where(model.id > last_id)
+            rows = db.session.execute(query).mappings().all()
+            if not rows:
+                break
+            buckets = {}
+            aggregate_log_buckets(spec, rows, places, buckets)
+            upsert_log_buckets(buckets)
+            last_id = rows[-1]['id']
+        # ... and the readings packed into log_chunks
+        chunks = db.select(LogChunk).where(LogChunk.log_table == name).execution_options(yield_per=100)
+        for partition in db.session.scalars(chunks).partitions():
+            buckets = {}
+            aggregate_log_buckets(spec, (reading for chunk in partition for reading in chunk_readings(spec, chunk)),
+                                  places, buckets)
+            upsert_log_buckets(buckets)
+
+# Packed logs
+# Sensors reporting every minute make emission_logs and resource_logs grow by a row per
+# reading. With LOG_STORAGE=packed, maintain_log_storage() moves each finished day of
+# an animal's or lot's readings into one log_chunks row (logchunks.py), merges the
+# chunks of the same day and downsamples the days past the retention. Rows and chunks
+# are taken with DELETE ... RETURNING, so concurrent runs never handle a reading twice.
+LOG_PACK_BATCH_ROWS = 50000
+LOG_REPACK_BATCH_DAYS = 500
+
+PACKED_LOG_SPECS = {name: spec for name, spec in BULK_LOG_SPECS.items() if spec.get('downsample')}
+
+def packed_log_spec(model):
+    """The BULK_LOG_SPECS entry of a log table that has chunks, None for every other table."""
+    spec = PACKED_LOG_SPECS.get(model.__tablename__)
+    if spec is None or db.session.query(LogChunk.id).filter_by(log_table=model.__tablename__).first() is None:
+        return None
+    return spec
+
+def chunk_row(spec, parent_id, day, resolution, ids, times, values):
+    """log_chunks row for readings sorted by id (logchunks.encode arrays)."""
+    latest = np.lexsort((ids, times))[-1]
+    return {
+        'log_table': spec['model'].__tablename__,
+        'parent_id': parent_id,
+        'period_start': day,
+        'resolution': resolution,
+        'count': len(ids),
+        'first_id': int(ids[0]),
+        'last_id': int(ids[-1]),
+        'first_at': times.min().item(),
+        'last_at': times[latest].item(),
+        'sums': {field: float(np.nansum(values[:, i])) for i, field in enumerate(spec['numbers'])},
+        'last_values': {field: None if np.isnan(values[latest, i]) else float(values[latest, i])
+                        for i, field in enumerate(spec['numbers'])},
+        'data': logchunks.encode(ids, times, values),
+    }
+
+def chunk_readings(spec, chunk):
+    """Decode a chunk into reading dicts with the log table's columns, in id order."""
+    ids, times, values = logchunks.decode(chunk.data, chunk.count, len(spec['numbers']))
+    key = spec['key']
+    parent = spec['model'].__table__.c[key].type.python_type(chunk.parent_id)
+    for reading_id, moment, row in zip(ids.tolist(), times.tolist(), values.tolist()):
+        reading = {'id': reading_id, key: parent, spec['timestamp']: moment}
+        for field, value in zip(spec['numbers'], row):
+            reading[field] = None if value != value else value  # NaN marks a missing value
+        yield reading
+
+def build_chunks(spec, groups, resolutions=None):
+    """log_chunks rows for {(parent_id, day): [(ids, times, values), ...]} readings, one per day,
+    downsampled to resolutions[(parent_id, day)] seconds where that is not 0."""
+    rows = []
+    for (parent_id, day), parts in groups.items():
+        ids = np.concatenate([part[0] for part in parts])
+        times = np.concatenate([part[1] for part in parts])
+        values = np.concatenate([part[2] for part in parts])
+        order = np.argsort(ids, kind='stable')
+        ids, times, values = ids[order], times[order], values[order]
+        resolution = (resolutions or {}).get((parent_id, day), 0)
+        if resolution:
+            ids, times, values = logchunks.downsample(ids, times, values, resolution, spec['downsample'])
+        rows.append(chunk_row(spec, parent_id, day, resolution, ids, times, values))
+    return rows
+
+def pack_logs(spec, before):
+    """Move the readings taken before the given day into chunks; returns how many were packed."""
+    table = spec['model'].__table__
+    key, timestamp = table.c[spec['key']], table.c[spec['timestamp']]
+    numbers = [table.c[field] for field in spec['numbers']]
+    # The packed tables are AUTOINCREMENT on SQLite, so the ids moved into chunks are not reused
+    packed = 0
+    while True:
+        # One animal or lot after another, so each batch fills whole days
+        claim = (db.select(table.c.id).where(timestamp < before)
+                 .order_by(key, timestamp).limit(LOG_PACK_BATCH_ROWS))
+        rows = db.session.execute(
+            table.delete().where(table.c.id.in_(claim)).returning(table.c.id, key, timestamp, *numbers)).all()
+        if not rows:
+            return packed
+        groups = {}
+        for row in rows:
+            groups.setdefault((str(row[1]), bucket_start(row[2], 'day')), []).append(row)
+        for day, day_rows in groups.items():
+            ids = np.array([row[0] for row in day_rows], dtype=np.int64)
+            times = np.array([row[2] for row in day_rows], dtype='datetime64[us]')
+            values = np.array([[np.nan if value is None else value for value in row[3:]] for row in day_rows],
+                              dtype=np.float64).reshape(len(day_rows), len(numbers))
+            groups[day] = [(ids, times, values)]
+        db.session.execute(LogChunk.__table__.insert(), build_chunks(spec, groups))
+        db.session.commit()
+        packed += len(rows)
+
+def repack_chunks(spec, resolutions):
+    """Replace the chunks of each (parent_id, day) in resolutions by a single chunk at that resolution."""
+    chunks = LogChunk.__table__
+    claimed = db.session.execute(
+        chunks.delete()
+        .where(chunks.c.log_table == spec['model'].__tablename__,
+               db.tuple_(chunks.c.parent_id, chunks.c.period_start).in_(list(resolutions)))
+        .returning(chunks.c.parent_id, chunks.c.period_start, chunks.c.count, chunks.c.data)).all()
+    groups = {}
+    for chunk in claimed:
+        groups.setdefault((chunk.parent_id, chunk.period_start), []).append(
+            logchunks.decode(chunk.data, chunk.count, len(spec['numbers'])))
+    if groups:
+        db.session.execute(chunks.insert(), build_chunks(spec, groups, resolutions))
+    db.session.commit()
+    return len(claimed)
+
+def maintain_log_storage(now=None):
+    """Pack the finished days of the packed log tables, merge the chunks of the same day
+    and downsample the days past the retention. Returns {table: (readings packed, chunks rewritten)}."""
+    now = now or datetime.utcnow()
+    pack_before = bucket_start(now - timedelta(days=current_app.config['LOG_PACK_AFTER_DAYS']), 'day')
+    retention = bucket_start(now - timedelta(days=current_app.config['LOG_RETENTION_DAYS']), 'day')
+    target = current_app.config['LOG_DOWNSAMPLE_MINUTES'] * 60
+    summary = {}
+    for name, spec in PACKED_LOG_SPECS.items():
+        packed = pack_logs(spec, pack_before)
+        # Days split over several chunks (packed by different runs, or late readings), and
+        # days past the retention that still hold every reading
+        days = db.session.execute(
+            db.select(LogChunk.parent_id, LogChunk.period_start, db.func.max(LogChunk.resolution))
+            .where(LogChunk.log_table == name)
+            .group_by(LogChunk.parent_id, LogChunk.period_start)
+            .having((db.func.count() > 1) |
+                    ((LogChunk.period_start < retention) & (db.func.max(LogChunk.resolution) < target)))
+        ).all()
+        rewritten = 0
+        for start in range(0, len(days), LOG_REPACK_BATCH_DAYS):
+            rewritten += repack_chunks(spec, {
+                (parent_id, day): target if day < retention else resolution
+                for parent_id, day, resolution in days[start:start + LOG_REPACK_BATCH_DAYS]
+            })
+        summary[name] = (packed, rewritten)
+    return summary
@@ -0,0 +1,119 @@
+"""Versioned schema migrations for livestock.db.
+
+Each migration is a version number, a description and a list of SQL statements,
+or a dict of such lists by dialect name for the changes only one database needs.
+The applied version is kept in the schema_version table, so running migrate()
+on an existing database only applies the migrations it is missing. Statements
+must be idempotent (IF NOT EXISTS) because fresh databases created by
+db.create_all() already contain what the models declare, and portable:
+mixed-case column names are double quoted, as SQLAlchemy creates them on
+PostgreSQL.
+
+Usage:
+    python migrations.py [path/to/livestock.db]
+
+The app applies them in init_db(), run by `flask --app app init-db`, on
+any database (see DATABASE_URL).
+"""
+import sqlite3
+import sys
+
+def rebuild_with_autoincrement(table, columns, index):
+    """SQLite statements recreating a log table with an AUTOINCREMENT id, its rows kept and its
+    sequence started after the highest id of its rows and of its log_chunks."""
+    names = ', '.join(['id'] + [column.split()[0] for column in columns])
+    return [
+        f'DROP TABLE IF EXISTS {table}_rebuilt',  # left by an interrupted run
+        f"CREATE TABLE {table}_rebuilt (id INTEGER PRIMARY KEY AUTOINCREMENT, {', '.join(columns)})",
+        f'INSERT INTO {table}_rebuilt ({names}) SELECT {names} FROM {table}',
+        f'DROP TABLE {table}',
+        f'ALTER TABLE {table}_rebuilt RENAME TO {table}',
+        index,
+        f"INSERT INTO sqlite_sequence (name, seq) SELECT '{table}', 0 "
+        f"WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = '{table}')",
+        f"UPDATE sqlite_sequence SET seq = MAX(seq, "
+        f"(SELECT COALESCE(MAX(last_id), 0) FROM log_chunks WHERE log_table = '{table}')) WHERE name = '{table}'",
+    ]
+
+MIGRATIONS = [
+    (1, 'Secondary indexes for foreign keys and time-series columns', [
+        'CREATE INDEX IF NOT EXISTS ix_lotes_finca ON lotes ("FincaID")',
+        'CREATE INDEX IF NOT EXISTS ix_bovinos_finca ON bovinos ("FincaID")',
+        'CREATE INDEX IF NOT EXISTS ix_bovinos_lote ON bovinos ("LoteID")',
+        'CREATE INDEX IF NOT EXISTS ix_registros_sanitarios_bovino_fecha ON registros_sanitarios ("BovinoID", "Fecha_Muestra")',
+        'CREATE INDEX IF NOT EXISTS ix_movimientos_animales_bovino_fecha ON movimientos_animales ("BovinoID", "Fecha")',
+        'CREATE INDEX IF NOT EXISTS ix_pesajes_canales_bovino ON pesajes_canales ("BovinoID")',
+        'CREATE INDEX IF NOT EXISTS ix_weight_logs_animal_measured ON weight_logs ("animal_id", "measured_at")',
+        'CREATE INDEX IF NOT EXISTS ix_emission_logs_animal_logged ON emission_logs ("animal_id", "logged_at")',
+        'CREATE INDEX IF NOT EXISTS ix_finance_logs_animal_logged ON finance_logs ("animal_id", "logged_at")',
+        'CREATE INDEX IF NOT EXISTS ix_resource_logs_land_logged ON resource_logs ("land_id", "logged_at")',
+    ]),
+    (2, 'Parent indexes for pedigree queries', [
+        'CREATE INDEX IF NOT EXISTS ix_bovinos_madre ON bovinos ("MadreID")',
+        'CREATE INDEX IF NOT EXISTS ix_bovinos_padre ON bovinos ("PadreID")',
+    ]),
+    # SQLite hands out max(id) + 1 again after the highest row is deleted, which would
+    # repeat IDs already packed into log_chunks; PostgreSQL sequences never go back
+    (3, 'AUTOINCREMENT IDs for the packed log tables', {
+        'sqlite': [
+            *rebuild_with_autoincrement('emission_logs', [
+                'animal_id VARCHAR(50) NOT NULL REFERENCES bovinos ("BovinoID")', 'co2_emissions FLOAT',
+                'methane_emissions FLOAT', 'logged_at DATETIME'
+            ], 'CREATE INDEX IF NOT EXISTS ix_emission_logs_animal_logged ON emission_logs (animal_id, logged_at)'),
+            *rebuild_with_autoincrement('resource_logs', [
+                'land_id INTEGER NOT NULL REFERENCES lotes ("LoteID")', 'feed_available FLOAT',
+                'water_available FLOAT', 'logged_at DATETIME'
+            ], 'CREATE INDEX IF NOT EXISTS ix_resource_logs_land_logged ON resource_logs (land_id, logged_at)'),
+        ],
+    }),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(connection):
+    cursor = connection.cursor()
+    cursor.execute('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)')
+    cursor.execute('SELECT MAX(version) FROM schema_version')
+    row = cursor.fetchone()
+    return row[0] or 0
+
+def migrate(connection, verbose=False, dialect='sqlite'):
+    """Apply every pending migration on a DB-API connection (sqlite3 or engine.raw_connection()).
+
+    dialect is the database's SQLAlchemy dialect name, which picks the statements of the
+    migrations written per dialect (a migration without statements for it only records its version).
+
+    The version row is committed after the migration's statements, so a migration
+    interrupted halfway is simply run again. Returns the list of versions applied.
+    """
+    applied = []
+    version = current_version(connection)
+    connection.commit()
+    for number, description, statements in MIGRATIONS:
+        if number <= version:
+            continue
+        if isinstance(statements, dict):
+            statements = statements.get(dialect, [])
+        cursor = connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f'INSERT INTO schema_version (version) VALUES ({int(number)})')
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        if verbose:
+            print(f'Applied migration {number}: {description}')
+        applied.append(number)
+    return applied
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else 'livestock.db'
+    conn = sqlite3.connect(path)
+    try:
+        if not migrate(conn, verbose=True):
+            print('Nothing to migrate')
+        print(f'{path} is at schema version {current_version(conn)}')
+    finally:
+        conn.close()
@@ -0,0 +1,481 @@
+"""Database models, the helpers that allocate their IDs and the table change counters.
+
+db is created unbound; create_app() attaches it to the app with db.init_app().
+"""
+from datetime import datetime
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+
+db = SQLAlchemy()
+
+# Database models
+class Fincas(db.Model):
+    __tablename__ = 'fincas'
+    FincaID = db.Column(db.Integer, primary_key=True)
+    Nombre = db.Column(db.String(100))
+    Depto = db.Column(db.String(50))
+    Municipio = db.Column(db.String(50))
+    Vereda = db.Column(db.String(50))
+    Area_ha = db.Column(db.Float)
+    Propietario = db.Column(db.String(100))
+    Uso_Suelo = db.Column(db.String(100))
+    Lat = db.Column(db.Float)
+    Lon = db.Column(db.Float)
+    Fecha_Registro = db.Column(db.DateTime)
+
+class Lotes(db.Model):
+    __tablename__ = 'lotes'
+    __table_args__ = (db.Index('ix_lotes_finca', 'FincaID'),)
+    LoteID = db.Column(db.Integer, primary_key=True)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    Nombre_Lote = db.Column(db.String(100))
+    Area_ha = db.Column(db.Float)
+    Actividad_Ganado = db.Column(db.String(100))  # Current livestock activity
+    Observaciones = db.Column(db.Text)
+
+class Bovinos(db.Model):
+    __tablename__ = 'bovinos'
+    __table_args__ = (
+        db.Index('ix_bovinos_finca', 'FincaID'),
+        db.Index('ix_bovinos_lote', 'LoteID'),
+        db.Index('ix_bovinos_madre', 'MadreID'),
+        db.Index('ix_bovinos_padre', 'PadreID'),
+    )
+    BovinoID = db.Column(db.String(50), primary_key=True)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    LoteID = db.Column(db.Integer, db.ForeignKey('lotes.LoteID'), nullable=False)
+    Sexo = db.Column(db.String(10))
+    Raza = db.Column(db.String(50))
+    Fecha_Nac = db.Column(db.DateTime)
+    Estado = db.Column(db.String(50))
+    MadreID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'))
+    PadreID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'))
+    Origen = db.Column(db.String(100))
+    Propósito = db.Column(db.String(100))
+
+class Registros_Sanitarios(db.Model):
+    __tablename__ = 'registros_sanitarios'
+    __table_args__ = (db.Index('ix_registros_sanitarios_bovino_fecha', 'BovinoID', 'Fecha_Muestra'),)
+    RegistroID = db.Column(db.String(50), primary_key=True)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    Tipo_Prueba = db.Column(db.String(100))
+    Estado_Salud = db.Column(db.String(20))  # Sano or Enfermo
+    Resultado = db.Column(db.Text)  # Changed to Text for explanatory content
+    Fecha_Muestra = db.Column(db.DateTime)
+    Laboratorio = db.Column(db.String(100))
+    Costo_Examen = db.Column(db.Float)  # Cost of the exam/vaccination
+    Observaciones = db.Column(db.Text)
+    Archivo_Certificado = db.Column(db.String(200))  # File path for uploaded certificate
+
+class Movimientos_Animales(db.Model):
+    __tablename__ = 'movimientos_animales'
+    __table_args__ = (db.Index('ix_movimientos_animales_bovino_fecha', 'BovinoID', 'Fecha'),)
+    MovID = db.Column(db.String(50), primary_key=True)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    Tipo_Mov = db.Column(db.String(50))
+    Fecha = db.Column(db.DateTime)
+    Finca_Origen = db.Column(db.String(50))
+    Lote_Origen = db.Column(db.String(50))
+    Finca_Destino = db.Column(db.String(50))
+    Lote_Destino = db.Column(db.String(50))
+    Motivo = db.Column(db.String(100))
+
+
+class Pesajes_Canales(db.Model):
+    __tablename__ = 'pesajes_canales'
+    __table_args__ = (db.Index('ix_pesajes_canales_bovino', 'BovinoID'),)
+    CanalID = db.Column(db.String(50), primary_key=True)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    Fecha_Sacrificio = db.Column(db.DateTime)
+    Peso_Vivo = db.Column(db.Float)
+    Peso_Canal = db.Column(db.Float)
+    Rendimiento = db.Column(db.Float)
+    Planta = db.Column(db.String(100))
+    Observaciones = db.Column(db.Text)
+
+class Proveedores(db.Model):
+    __tablename__ = 'proveedores'
+    ProveedorID = db.Column(db.String(50), primary_key=True)
+    Nombre = db.Column(db.String(100))
+    NIT = db.Column(db.String(20))
+    Contacto = db.Column(db.String(100))
+    Telefono = db.Column(db.String(20))
+    Correo = db.Column(db.String(100))
+    Ciudad = db.Column(db.String(50))
+    Direccion = db.Column(db.String(200))
+
+class Insumos(db.Model):
+    __tablename__ = 'insumos'
+    InsumoID = db.Column(db.String(50), primary_key=True)
+    ProveedorID = db.Column(db.String(50), db.ForeignKey('proveedores.ProveedorID'), nullable=False)
+    Categoria = db.Column(db.String(50))
+    Nombre = db.Column(db.String(100))
+    Unidad = db.Column(db.String(20))
+    Precio_Unit = db.Column(db.Float)
+    Es_Suplemento = db.Column(db.String(5))  # Yes/No
+    Es_Medicamento = db.Column(db.String(5))
+    Observaciones = db.Column(db.Text)
+
+class Compras(db.Model):
+    __tablename__ = 'compras'
+    CompraID = db.Column(db.String(50), primary_key=True)
+    ProveedorID = db.Column(db.String(50), db.ForeignKey('proveedores.ProveedorID'), nullable=False)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    InsumoID = db.Column(db.String(50), db.ForeignKey('insumos.InsumoID'), nullable=False)
+    Fecha = db.Column(db.DateTime)
+    Cantidad = db.Column(db.Float)
+    Precio_Unitario = db.Column(db.Float)
+    Moneda = db.Column(db.String(10))
+    Subtotal = db.Column(db.Float)
+    Impuestos = db.Column(db.Float)
+    Total = db.Column(db.Float)
+    Observaciones = db.Column(db.Text)
+
+class Ventas(db.Model):
+    __tablename__ = 'ventas'
+    VentaID = db.Column(db.String(50), primary_key=True)
+    Cliente = db.Column(db.String(100))
+    Tipo_Venta = db.Column(db.String(50))
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    Fecha = db.Column(db.DateTime)
+    Subtotal = db.Column(db.Float)
+    Impuestos = db.Column(db.Float)
+    Total = db.Column(db.Float)
+    Destino = db.Column(db.String(100))
+    Observaciones = db.Column(db.Text)
+
+class Alimentacion(db.Model):
+    __tablename__ = 'alimentacion'
+    RacionID = db.Column(db.String(50), primary_key=True)
+    Nombre_Racion = db.Column(db.String(100))
+    Tipo = db.Column(db.String(50))
+    Objetivo = db.Column(db.String(100))
+    Observaciones = db.Column(db.Text)
+
+class Ingredientes_Racion(db.Model):
+    __tablename__ = 'ingredientes_racion'
+    IngRacionID = db.Column(db.String(50), primary_key=True)
+    RacionID = db.Column(db.String(50), db.ForeignKey('alimentacion.RacionID'), nullable=False)
+    InsumoID = db.Column(db.String(50), db.ForeignKey('insumos.InsumoID'), nullable=False)
+    PorcentajeMS = db.Column(db.Float)
+    Costo_Estimado = db.Column(db.Float)
+
+class Racion_Animal(db.Model):
+    __tablename__ = 'racion_animal'
+    RacionAnimalID = db.Column(db.String(50), primary_key=True)
+    RacionID = db.Column(db.String(50), db.ForeignKey('alimentacion.RacionID'), nullable=False)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    Fecha_Inicio = db.Column(db.DateTime)  # Fecha de inicio de este tipo de alimentación
+    Fecha_Fin = db.Column(db.DateTime)  # Fecha estimada de finalización de la misma
+    Observaciones = db.Column(db.Text)
+
+class Energia_Sostenibilidad(db.Model):
+    __tablename__ = 'energia_sostenibilidad'
+    EnergiaID = db.Column(db.String(50), primary_key=True)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    Fecha = db.Column(db.DateTime)
+    Tipo_Fuente = db.Column(db.String(50))
+    Generacion_kWh = db.Column(db.Float)
+    Consumo_kWh = db.Column(db.Float)
+    Emisiones_ev_CO2e_kg = db.Column(db.Float)
+    Observaciones = db.Column(db.Text)
+
+class Documentos_Exportacion(db.Model):
+    __tablename__ = 'documentos_exportacion'
+    DocExpID = db.Column(db.String(50), primary_key=True)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    LoteID = db.Column(db.Integer, db.ForeignKey('lotes.LoteID'), nullable=False)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    Pais_Destino = db.Column(db.String(50))
+    Puerto_Embarque = db.Column(db.String(100))
+    Fecha_Embarque = db.Column(db.DateTime)
+    Observaciones = db.Column(db.Text)
+
+class Certificados(db.Model):
+    __tablename__ = 'certificados'
+    CertID = db.Column(db.String(50), primary_key=True)
+    DocExpID = db.Column(db.String(50), db.ForeignKey('documentos_exportacion.DocExpID'), nullable=False)
+    Tipo_Cert = db.Column(db.String(50))
+    Codigo = db.Column(db.String(50))
+    Fecha_Emision = db.Column(db.DateTime)
+    Fecha_Vencimiento = db.Column(db.DateTime)
+    Entidad = db.Column(db.String(100))
+    Estado = db.Column(db.String(50))
+    Observaciones = db.Column(db.Text)
+
+class Usuarios(db.Model):
+    __tablename__ = 'usuarios'
+    UsuarioID = db.Column(db.String(50), primary_key=True)
+    Nombre = db.Column(db.String(100))
+    Rol = db.Column(db.String(50))
+    Correo = db.Column(db.String(100))
+    Telefono = db.Column(db.String(20))
+    Organizacion = db.Column(db.String(100))
+    Activo = db.Column(db.String(5))  # Yes/No
+
+class Usuario_Finca(db.Model):
+    __tablename__ = 'usuario_finca'
+    UsuarioFincaID = db.Column(db.String(50), primary_key=True)
+    UsuarioID = db.Column(db.String(50), db.ForeignKey('usuarios.UsuarioID'), nullable=False)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    Rol_En_Finca = db.Column(db.String(50))
+    Fecha_Asignacion = db.Column(db.DateTime)
+
+# Additional models for logs (previously missing)
+class WeightLog(db.Model):
+    __tablename__ = 'weight_logs'
+    __table_args__ = (db.Index('ix_weight_logs_animal_measured', 'animal_id', 'measured_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    animal_id = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    weight_kg = db.Column(db.Float, nullable=False)
+    measured_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class EmissionLog(db.Model):
+    __tablename__ = 'emission_logs'
+    # AUTOINCREMENT: IDs of readings packed into log_chunks are never handed out again
+    __table_args__ = (db.Index('ix_emission_logs_animal_logged', 'animal_id', 'logged_at'),
+                      {'sqlite_autoincrement': True})
+    id = db.Column(db.Integer, primary_key=True)
+    animal_id = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    co2_emissions = db.Column(db.Float, default=0)
+    methane_emissions = db.Column(db.Float, default=0)
+    logged_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class FinanceLog(db.Model):
+    __tablename__ = 'finance_logs'
+    __table_args__ = (db.Index('ix_finance_logs_animal_logged', 'animal_id', 'logged_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    animal_id = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    cost_feed = db.Column(db.Float, default=0)
+    cost_medical = db.Column(db.Float, default=0)
+    revenue_sale = db.Column(db.Float, default=0)
+    logged_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ResourceLog(db.Model):
+    __tablename__ = 'resource_logs'
+    # AUTOINCREMENT, as emission_logs
+    __table_args__ = (db.Index('ix_resource_logs_land_logged', 'land_id', 'logged_at'),
+                      {'sqlite_autoincrement': True})
+    id = db.Column(db.Integer, primary_key=True)
+    land_id = db.Column(db.Integer, db.ForeignKey('lotes.LoteID'), nullable=False)
+    feed_available = db.Column(db.Float, default=0)
+    water_available = db.Column(db.Float, default=0)
+    logged_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class IdSequence(db.Model):
+    __tablename__ = 'id_sequences'
+    name = db.Column(db.String(20), primary_key=True)  # ID prefix, e.g. "MOV" or "Ve-"
+    last_value = db.Column(db.Integer, nullable=False)
+
+class TableVersion(db.Model):
+    # Change counter of a table in VERSIONED_TABLES, bumped in the transaction of every
+    # write to it, so any process can tell whether its cached copy of the table is current
+    __tablename__ = 'table_versions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+
+class AnimalRollup(db.Model):
+    # Per-animal figures for the animal analytics endpoint, kept up to date by the
+    # log, registro and pesaje handlers (see refresh_animal_rollups / add_to_rollups)
+    __tablename__ = 'animal_rollups'
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), primary_key=True)
+    latest_weight_kg = db.Column(db.Float)
+    latest_weight_at = db.Column(db.DateTime)
+    total_emissions = db.Column(db.Float, nullable=False, default=0)  # CO2 + methane
+    total_costs = db.Column(db.Float, nullable=False, default=0)  # feed + medical
+    total_revenue = db.Column(db.Float, nullable=False, default=0)
+    latest_health = db.Column(db.String(20))  # Estado_Salud of the latest registro
+    latest_health_at = db.Column(db.DateTime)
+    carcass_weight_kg = db.Column(db.Float)
+    carcass_live_weight_kg = db.Column(db.Float)
+    carcass_yield_percent = db.Column(db.Float)
+    slaughter_date = db.Column(db.DateTime)
+
+class AnimalLocation(db.Model):
+    # Lot history of each animal, one row per stay: [valid_from, valid_to), with an open
+    # valid_to for the current lot. Rebuilt from the animal's movements whenever they change
+    # (see refresh_animal_locations); valid_from is empty for the stay before the first movement.
+    __tablename__ = 'animal_locations'
+    __table_args__ = (
+        db.Index('ix_animal_locations_lote_period', 'LoteID', 'valid_from', 'valid_to'),
+        db.Index('ix_animal_locations_bovino_from', 'BovinoID', 'valid_from'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    BovinoID = db.Column(db.String(50), db.ForeignKey('bovinos.BovinoID'), nullable=False)
+    FincaID = db.Column(db.Integer, db.ForeignKey('fincas.FincaID'), nullable=False)
+    LoteID = db.Column(db.Integer, db.ForeignKey('lotes.LoteID'), nullable=False)
+    valid_from = db.Column(db.DateTime)
+    valid_to = db.Column(db.DateTime)
+    MovID = db.Column(db.String(50), db.ForeignKey('movimientos_animales.MovID'))  # movement that started the stay
+
+class LogBucket(db.Model):
+    # Daily, weekly and monthly aggregates of each numeric log field per animal, lot and farm,
+    # upserted as the logs are inserted (see add_to_log_buckets) and read by the series endpoint
+    __tablename__ = 'log_buckets'
+    metric = db.Column(db.String(30), primary_key=True)  # log field, e.g. weight_kg or feed_available
+    entity = db.Column(db.String(10), primary_key=True)  # animal, land or farm
+    entity_id = db.Column(db.String(50), primary_key=True)
+    bucket = db.Column(db.String(10), primary_key=True)  # day, week or month
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    total = db.Column(db.Float, nullable=False)
+    min_value = db.Column(db.Float, nullable=False)
+    max_value = db.Column(db.Float, nullable=False)
+    last_value = db.Column(db.Float, nullable=False)  # value of the latest reading in the bucket
+    last_at = db.Column(db.DateTime, nullable=False)
+
+class LogChunk(db.Model):
+    # Readings of one animal or lot and one day from a packed log table, encoded by
+    # logchunks.encode(); written and merged by maintain_log_storage()
+    __tablename__ = 'log_chunks'
+    __table_args__ = (
+        db.Index('ix_log_chunks_parent_period', 'log_table', 'parent_id', 'period_start'),
+        db.Index('ix_log_chunks_first_id', 'log_table', 'first_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    log_table = db.Column(db.String(30), nullable=False)  # emission_logs or resource_logs
+    parent_id = db.Column(db.String(50), nullable=False)  # animal_id or land_id
+    period_start = db.Column(db.DateTime, nullable=False)
+    resolution = db.Column(db.Integer, nullable=False, default=0)  # seconds per downsampled reading, 0 = every reading
+    count = db.Column(db.Integer, nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    first_at = db.Column(db.DateTime, nullable=False)
+    last_at = db.Column(db.DateTime, nullable=False)  # of the latest reading, the one in last_values
+    sums = db.Column(db.JSON, nullable=False)  # {field: sum of the readings}
+    last_values = db.Column(db.JSON, nullable=False)  # {field: value of the latest reading}
+    data = db.Column(db.LargeBinary, nullable=False)
+
+class CertificateFile(db.Model):
+    """An uploaded certificate, stored once per content (see certificates.py)."""
+    __tablename__ = 'certificate_files'
+    __table_args__ = (db.Index('ix_certificate_files_status', 'status'),)
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(200), nullable=False)  # relative to UPLOAD_FOLDER
+    content_type = db.Column(db.String(50), nullable=False)
+    size = db.Column(db.Integer, nullable=False)
+    uploaded_at = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, failed
+    claimed_at = db.Column(db.DateTime)
+    info = db.Column(db.JSON)  # extracted metadata: pdf_version, pages or width, height
+    thumbnail = db.Column(db.String(200))  # relative to UPLOAD_FOLDER
+    error = db.Column(db.Text)
+
+class Job(db.Model):
+    """A queued long-running operation (see blueprints/jobs.py)."""
+    __tablename__ = 'jobs'
+    __table_args__ = (db.Index('ix_jobs_status', 'status', 'id'),)
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    params = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    progress = db.Column(db.Float, nullable=False, default=0)  # 0 to 1
+    message = db.Column(db.String(200))
+    result = db.Column(db.JSON)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+# Helper functions for ID generation
+def next_sequence_value(name, id_column, count=1):
+    """Atomically increment and return the counter for an ID prefix.
+
+    The UPDATE takes the database write lock, so concurrent requests are serialized
+    and the increment commits or rolls back together with the row that uses it.
+    With count > 1 a block of values is reserved and the first one is returned.
+    """
+    sequences = IdSequence.__table__
+    value = db.session.execute(
+        sequences.update()
+        .where(sequences.c.name == name)
+        .values(last_value=sequences.c.last_value + count)
+        .returning(sequences.c.last_value)
+    ).scalar()
+    if value is not None:
+        return value - count + 1
+
+    # First ID for this prefix: continue after the highest existing one (one-time scan).
+    # The suffixes are parsed in Python because casting a non-numeric suffix fails on PostgreSQL.
+    current = max(
+        (int(existing[len(name):]) for existing in db.session.scalars(db.select(id_column).where(id_column.startswith(name)))
+         if existing[len(name):].isdigit()),
+        default=0
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.execute(sequences.insert().values(name=name, last_value=current + count))
+    except IntegrityError:
+        # Another worker created the counter at the same time
+        return next_sequence_value(name, id_column, count)
+    return current + 1
+
+def generate_id(prefix, id_column):
+    """Next formatted ID for a prefix, e.g. generate_id('MOV', Movimientos_Animales.MovID) -> "MOV001"."""
+    return generate_ids(prefix, id_column, 1)[0]
+
+def generate_ids(prefix, id_column, count):
+    """count consecutive new IDs for a prefix, reserved with one counter update."""
+    first = next_sequence_value(prefix, id_column, count)
+    return [f"{prefix}{value:03d}" for value in range(first, first + count)]
+
+def advance_sequence(name, id_column, value):
+    """Make sure the counter for an ID prefix is at least value, e.g. after importing explicit IDs."""
+    next_sequence_value(name, id_column, 0)  # creates the counter if it does not exist yet
+    sequences = IdSequence.__table__
+    db.session.execute(
+        sequences.update()
+        .where(sequences.c.name == name, sequences.c.last_value < value)
+        .values(last_value=value)
+    )
+
+def dialect_insert(table):
+    """INSERT supporting on_conflict_do_update() on the configured database."""
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+# Table change counters
+# Caches derived from whole tables (the /api/bootstrap lookup sets, the pedigree) are
+# kept per process; they are keyed on the table's version, read with one small query,
+# instead of being invalidated by the process that made the write.
+VERSIONED_TABLES = frozenset({'fincas', 'lotes', 'bovinos', 'proveedores', 'insumos', 'alimentacion'})
+
+def table_versions(names):
+    """{name: version} of the given tables (0 for a table never written since the counters exist)."""
+    versions = dict(db.session.execute(db.select(TableVersion.name, TableVersion.version)
+                                       .where(TableVersion.name.in_(names))).all())
+    return {name: versions.get(name, 0) for name in names}
+
+def bump_table_versions(session, names):
+    names = sorted(VERSIONED_TABLES.intersection(names))
+    if not names:
+        return
+    versions = TableVersion.__table__
+    # On the session's connection: a session.execute() here would run the ORM events again
+    connection = session.connection()
+    for name in names:
+        connection.execute(dialect_insert(versions).values(name=name, version=1).on_conflict_do_update(
+            index_elements=['name'], set_={'version': versions.c.version + 1}))
+    session.info.setdefault('changed_tables', set()).update(names)
+
+@event.listens_for(db.session, 'after_flush')
+def bump_flushed_versions(session, flush_context):
+    bump_table_versions(session, {obj.__tablename__ for obj in (*session.new, *session.dirty, *session.deleted)})
+
+@event.listens_for(db.session, 'do_orm_execute')
+def bump_executed_versions(orm_execute_state):
+    # Core and bulk statements (the resources, the importer) bypass the flush
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        bump_table_versions(orm_execute_state.session, {orm_execute_state.statement.table.name})
+
+@event.listens_for(db.session, 'after_transaction_end')
+def forget_changed_tables(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('changed_tables', None)
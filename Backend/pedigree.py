@@ -0,0 +1,121 @@
+"""Inbreeding and relationship coefficients from the MadreID/PadreID pedigree.
+
+Wright's inbreeding coefficient F is computed with the Meuwissen & Luo (1992)
+algorithm: an animal's F follows from the path weights (a row of the L factor
+of the relationship matrix A = LDL') to each of its ancestors, so only the
+ancestors of the animals asked about are visited, never the whole n x n matrix.
+Coefficients are memoized, so each animal of the herd is computed at most once
+per Pedigree, and the F of a prospective calf (sire x dam) reuses the memo.
+"""
+import heapq
+
+class Pedigree:
+    def __init__(self, links):
+        """links: (animal_id, sire_id, dam_id) tuples; unknown parents are None.
+
+        Parents that are not listed themselves are taken as founders, and animals
+        that appear nowhere in the links are unrelated founders. A link that would
+        make an animal its own ancestor is dropped.
+        """
+        self.parents = {}
+        for animal, sire, dam in links:
+            self.parents[animal] = (sire, dam)
+        for sire, dam in list(self.parents.values()):
+            for parent in (sire, dam):
+                if parent is not None and parent not in self.parents:
+                    self.parents[parent] = (None, None)
+        self.order = self._topological_order()
+        self._inbreeding = {}
+        self._variance = {}  # D: Mendelian sampling variance of each animal
+
+    def _topological_order(self):
+        """Number the animals so parents come before their offspring (iterative DFS)."""
+        order = {}
+        visiting = set()
+        for root in self.parents:
+            if root in order:
+                continue
+            stack = [(root, False)]
+            while stack:
+                animal, expanded = stack.pop()
+                if expanded:
+                    visiting.discard(animal)
+                    order[animal] = len(order)
+                    continue
+                if animal in order or animal in visiting:
+                    continue
+                visiting.add(animal)
+                stack.append((animal, True))
+                sire, dam = self.parents[animal]
+                for parent in (sire, dam):
+                    if parent is None or parent in order:
+                        continue
+                    if parent in visiting:
+                        # Cycle in the data: forget this link
+                        self.parents[animal] = tuple(None if p == parent else p for p in self.parents[animal])
+                    else:
+                        stack.append((parent, False))
+        return order
+
+    def _sampling_variance(self, sire, dam):
+        known = [self._inbreeding[parent] for parent in (sire, dam) if parent is not None]
+        return (1.0, 0.75, 0.5)[len(known)] - 0.25 * sum(known)
+
+    def _calf_inbreeding(self, sire, dam):
+        """F of an animal with these parents: sum of L^2 * D over its ancestors, minus one."""
+        if sire is None or dam is None:
+            return 0.0
+        total = self._sampling_variance(sire, dam)
+        weights = {}
+        for parent in (sire, dam):
+            weights[parent] = weights.get(parent, 0.0) + 0.5
+        # Youngest ancestor first, so each one's weight is complete when it is reached
+        heap = [(-self.order[parent], parent) for parent in weights]
+        heapq.heapify(heap)
+        while heap:
+            _, ancestor = heapq.heappop(heap)
+            weight = weights.pop(ancestor)
+            total += weight * weight * self._variance[ancestor]
+            for parent in self.parents[ancestor]:
+                if parent is None:
+                    continue
+                if parent not in weights:
+                    weights[parent] = 0.0
+                    heapq.heappush(heap, (-self.order[parent], parent))
+                weights[parent] += 0.5 * weight
+        return total - 1.0
+
+    def _compute(self, animals):
+        """Memoize F and D for the animals and all their ancestors, oldest first."""
+        pending = set()
+        stack = [animal for animal in animals if animal not in self._inbreeding]
+        while stack:
+            animal = stack.pop()
+            if animal in pending or animal in self._inbreeding:
+                continue
+            pending.add(animal)
+            stack.extend(parent for parent in self.parents[animal] if parent is not None)
+        for animal in sorted(pending, key=self.order.__getitem__):
+            sire, dam = self.parents[animal]
+            self._inbreeding[animal] = self._calf_inbreeding(sire, dam)
+            self._variance[animal] = self._sampling_variance(sire, dam)
+
+    def inbreeding(self, animal):
+        """Wright's inbreeding coefficient of an animal."""
+        if animal not in self.parents:
+            return 0.0
+        self._compute([animal])
+        return self._inbreeding[animal]
+
+    def offspring_inbreeding(self, sire, dam):
+        """F of a calf of sire x dam, which is also the coancestry of the two parents."""
+        if sire not in self.parents or dam not in self.parents:
+            return 0.0
+        self._compute([sire, dam])
+        return self._calf_inbreeding(sire, dam)
+
+    def relationship(self, first, second):
+        """Additive genetic relationship (the A matrix entry) between two animals."""
+        if first == second:
+            return 1.0 + self.inbreeding(first)
+        return 2.0 * self.offspring_inbreeding(first, second)
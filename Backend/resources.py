@@ -0,0 +1,517 @@
+"""CRUD endpoints generated from the models.
+
+A Resource describes one table: the name in its URLs, how new rows get their ID,
+the columns a client must send or may not change, and hooks that keep the derived
+tables (rollups, lot history, analytics cache) in step with a write. register()
+adds the routes to a blueprint:
+
+    GET    /api/<name>          list (fields, filters, date range and keyset pages, see listing.py)
+    POST   /api/<name>          create; answers {<primary key>: value} with 201
+    GET    /api/<name>/<id>     one row
+    PUT    /api/<name>/<id>     change the columns sent, keep the others
+    DELETE /api/<name>/<id>
+    POST   /api/<name>/batch    lists of creates, updates and deletes in one transaction
+
+Rows are read and written with Core statements on the table's columns, returned as
+dicts zipped from the column names the resource computes once, and encoded with
+listing.json_response(). A new table only needs a model and a Resource.
+"""
+import math
+from datetime import datetime
+
+from flask import abort, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from listing import json_response, list_response
+from logs import logs_added
+from models import db, generate_ids
+
+METHODS = ('list', 'create', 'get', 'update', 'delete', 'batch')
+
+# Operations of a batch, applied in this order
+BATCH_ACTIONS = ('create', 'update', 'delete')
+BATCH_MODES = ('atomic', 'partial')
+MAX_BATCH_SIZE = 1000  # items of all the operations of one batch
+
+# name -> Resource, for every resource a registered blueprint declared
+RESOURCES = {}
+
+class ResourceError(ValueError):
+    pass
+
+class Resource:
+    """Declarative description of a table's endpoints.
+
+    id_prefix      new IDs come from generate_id(id_prefix, ...), e.g. 'MOV' -> MOV001
+    auto_id        new integer IDs are assigned by the database (autoincrement) and
+                   may not be sent by the client
+                   (neither: the client sends the ID, or the database assigns it)
+    required       columns a create must include
+    fixed          columns set on create that updates leave alone
+    defaults       values (or functions returning them) for columns a create leaves out
+    validate       validate(values, current) -> error message or None; current is the
+                   row being updated, None on create
+    prepare        prepare(values) fills computed columns of a new row
+    before_write   before_write(action, rows) runs before the statement, e.g. to
+                   invalidate caches while the row can still be found
+    after_write    after_write(action, rows) runs after it, in the same transaction
+
+    The hooks receive a list of row dicts: the new rows on create, the stored rows
+    on update and delete (after_write gets the updated ones). action is 'create',
+    'update' or 'delete'.
+    """
+
+    def __init__(self, model, name, label, date_column=None, id_prefix=None, auto_id=False,
+                 required=(), fixed=(), defaults=None, methods=METHODS, validate=None, prepare=None,
+                 before_write=None, after_write=None):
+        self.model = model
+        self.table = model.__table__
+        self.name = name
+        self.label = label
+        self.date_column = date_column
+        self.id_prefix = id_prefix
+        self.auto_id = auto_id
+        self.required = tuple(required)
+        self.defaults = defaults or {}
+        self.methods = methods
+        self.validate = validate
+        self.prepare = prepare
+        self.before_write = before_write
+        self.after_write = after_write
+
+        self.columns = tuple(self.table.columns)
+        self.names = tuple(column.key for column in self.columns)
+        self.pk = self.table.primary_key.columns.values()[0]
+        self.datetime_columns = frozenset(column.key for column in self.columns
+                                          if isinstance(column.type, db.DateTime))
+        # name -> whether the column is an integer one, for the numeric columns
+        self.number_columns = {column.key: isinstance(column.type, db.Integer) for column in self.columns
+                               if isinstance(column.type, (db.Integer, db.Float, db.Numeric))}
+        self.creatable = frozenset(self.names) - ({self.pk.key} if id_prefix or auto_id else set())
+        self.updatable = frozenset(self.names) - {self.pk.key} - set(fixed)
+        self.id_converter = 'int' if self.pk.type.python_type is int else 'string'
+        RESOURCES[name] = self
+
+    # Rows
+    def row(self, id):
+        """The stored row as a dict, or None."""
+        row = db.session.execute(db.select(*self.columns).where(self.pk == id)).first()
+        return None if row is None else dict(zip(self.names, row))
+
+    def rows(self, ids):
+        """The stored rows of ids as dicts, by ID (missing ones left out)."""
+        rows = db.session.execute(db.select(*self.columns).where(self.pk.in_(ids)))
+        return {row[self.pk.key]: row for row in (dict(zip(self.names, row)) for row in rows)}
+
+    def parse(self, data, allowed, partial):
+        """Column values of a JSON object, with the datetime and numeric columns parsed.
+
+        An empty datetime leaves the stored value alone on update (partial) and is
+        NULL on create; numbers may be sent as JSON numbers or numeric strings, an
+        empty string being NULL; other columns take the value sent, null included.
+        """
+        if not isinstance(data, dict):
+            raise ResourceError('Expected a JSON object')
+        values = {}
+        for name in allowed.intersection(data):
+            value = data[name]
+            if name in self.datetime_columns:
+                if not value:
+                    if partial:
+                        continue
+                    value = None
+                else:
+                    try:
+                        value = datetime.fromisoformat(value)
+                    except (TypeError, ValueError):
+                        raise ResourceError(f'{name} must be an ISO date')
+            elif name in self.number_columns:
+                value = parse_number(name, value, integer=self.number_columns[name])
+            values[name] = value
+        return values
+
+    def new_values(self, data):
+        """Values of a row to insert: parsed, checked and completed with defaults (the ID is
+        added by assign_ids())."""
+        missing = [name for name in self.required if data.get(name) is None] if isinstance(data, dict) else []
+        if missing:
+            raise ResourceError(f"Missing required fields: {', '.join(missing)}")
+        values = self.parse(data, self.creatable, partial=False)
+        for name, default in self.defaults.items():
+            if values.get(name) is None:
+                values[name] = default() if callable(default) else default
+        if self.prepare:
+            self.prepare(values)
+        if self.validate:
+            error = self.validate(values, None)
+            if error:
+                raise ResourceError(error)
+        return values
+
+    def assign_ids(self, rows):
+        """Give new rows their prefixed IDs, all reserved at once (the database assigns the
+        others when they are inserted)."""
+        if self.id_prefix:
+            for values, id in zip(rows, generate_ids(self.id_prefix, self.pk, len(rows))):
+                values[self.pk.key] = id
+
+    def changes(self, data, current):
+        """Parsed and checked values of an update of the row current."""
+        values = self.parse(data, self.updatable, partial=True)
+        if self.validate:
+            error = self.validate(values, current)
+            if error:
+                raise ResourceError(error)
+        return values
+
+    def run_hook(self, hook, action, rows):
+        if hook and rows:
+            hook(action, rows)
+
+    # Statements
+    def insert_rows(self, rows):
+        """INSERT rows, one executemany per set of columns; IDs the database assigns are added to them."""
+        groups = {}
+        for values in rows:
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+        for names, group in groups.items():
+            if self.pk.key in names:
+                db.session.execute(self.table.insert(), group)
+            else:
+                ids = db.session.scalars(self.table.insert().returning(self.pk, sort_by_parameter_order=True), group)
+                for values, id in zip(group, ids):
+                    values[self.pk.key] = id
+
+    def update_rows(self, changes):
+        """UPDATE the rows of changes ((id, values) pairs).
+
+        Rows getting the same values share one UPDATE ... WHERE id IN (...); the others are
+        sent as one executemany per set of columns.
+        """
+        groups = {}
+        for id, values in changes:
+            # repr: values of JSON columns are not hashable
+            key = tuple((name, repr(value)) for name, value in values.items())
+            groups.setdefault(key, (values, []))[1].append(id)
+        singles = {}
+        for values, ids in groups.values():
+            if len(ids) > 1:
+                db.session.execute(self.table.update().where(self.pk.in_(ids)).values(values))
+            else:
+                names = tuple(sorted(values))
+                params = {f'v{position}': values[name] for position, name in enumerate(names)}
+                singles.setdefault(names, []).append({'id_': ids[0], **params})
+        for names, params in singles.items():
+            statement = self.table.update().where(self.pk == db.bindparam('id_')).values(
+                {name: db.bindparam(f'v{position}') for position, name in enumerate(names)})
+            db.session.execute(statement, params)
+
+    def delete_rows(self, ids):
+        db.session.execute(self.table.delete().where(self.pk.in_(ids)))
+
+    # Single-row operations (the caller commits)
+    def create(self, data):
+        return self.create_values(self.new_values(data))
+
+    def create_values(self, values):
+        """Insert a row of new_values() values, running the hooks; returns its ID."""
+        self.assign_ids([values])
+        self.run_hook(self.before_write, 'create', [values])
+        self.insert_rows([values])
+        self.run_hook(self.after_write, 'create', [values])
+        return values[self.pk.key]
+
+    def update(self, id, data):
+        current = self.row(id)
+        if current is None:
+            abort(404)
+        values = self.changes(data, current)
+        self.run_hook(self.before_write, 'update', [current])
+        if values:
+            db.session.execute(self.table.update().where(self.pk == id).values(values))
+        self.run_hook(self.after_write, 'update', [{**current, **values}])
+
+    def delete(self, id):
+        current = self.row(id)
+        if current is None:
+            abort(404)
+        self.run_hook(self.before_write, 'delete', [current])
+        db.session.execute(self.table.delete().where(self.pk == id))
+        self.run_hook(self.after_write, 'delete', [current])
+
+    # Batches (the caller commits or rolls back)
+    def batch(self, operations, partial=False):
+        """Apply the creates, updates and deletes of a batch; returns (results, errors).
+
+        The items of each operation are checked first and the valid ones written with
+        set-based statements. Errors name the operation and the position of the item in
+        its list. Without partial the batch stops at the first operation with errors and
+        the caller rolls everything back; with partial the other items are kept.
+        """
+        results = {'created': [], 'updated': 0, 'deleted': 0}
+        errors = []
+        for action in BATCH_ACTIONS:
+            items = operations.get(action)
+            if not items:
+                continue
+            if action == 'create':
+                results['created'] = self.batch_create(items, errors, partial)
+            elif action == 'update':
+                results['updated'] = self.batch_update(items, errors, partial)
+            else:
+                results['deleted'] = self.batch_delete(items, errors, partial)
+            if errors and not partial:
+                break
+        errors.sort(key=lambda error: (BATCH_ACTIONS.index(error['operation']), error.get('row', -1)))
+        return results, errors
+
+    def batch_create(self, items, errors, partial):
+        def insert(entries):
+            self.insert_rows([values for _, values, _ in entries])
+
+        if self.validate:
+            # Validators may read the table (e.g. the ration totals): insert each row before
+            # checking the next, so it counts for the ones after it
+            written = []
+            for index, data in enumerate(items):
+                try:
+                    values = self.new_values(data)
+                except ResourceError as e:
+                    errors.append({'operation': 'create', 'row': index, 'error': str(e)})
+                    continue
+                if errors and not partial:
+                    continue  # the batch is rolled back; only the remaining errors are of use
+                self.assign_ids([values])
+                written += self.write_entries('create', [(index, values, values)], insert, errors, partial)
+        else:
+            entries = []
+            for index, data in enumerate(items):
+                try:
+                    values = self.new_values(data)
+                except ResourceError as e:
+                    errors.append({'operation': 'create', 'row': index, 'error': str(e)})
+                    continue
+                entries.append((index, values, values))
+            if errors and not partial:
+                return []
+            self.assign_ids([values for _, values, _ in entries])
+            written = self.write_entries('create', entries, insert, errors, partial)
+        return [values[self.pk.key] for _, values, _ in written]
+
+    def batch_update(self, items, errors, partial):
+        """Update items, objects with the primary key and the columns to change."""
+        ids = [data.get(self.pk.key) for data in items if isinstance(data, dict)]
+        stored = self.rows([id for id in ids if self.is_id(id)])
+        entries = []
+        seen = set()
+        for index, data in enumerate(items):
+            id = data.get(self.pk.key) if isinstance(data, dict) else None
+            try:
+                current = self.stored_row(id, stored, seen)
+                values = self.changes(data, current)
+            except ResourceError as e:
+                errors.append({'operation': 'update', 'row': index, 'error': str(e)})
+                continue
+            entries.append((index, current, {**current, **values}))
+        if errors and not partial:
+            return 0
+
+        def update(entries):
+            changes = []
+            for _, current, new in entries:
+                values = {name: value for name, value in new.items() if value != current[name]}
+                if values:
+                    changes.append((current[self.pk.key], values))
+            self.update_rows(changes)
+
+        return len(self.write_entries('update', entries, update, errors, partial))
+
+    def batch_delete(self, items, errors, partial):
+        """Delete items, a list of IDs."""
+        stored = self.rows([id for id in items if self.is_id(id)])
+        entries = []
+        seen = set()
+        for index, id in enumerate(items):
+            try:
+                current = self.stored_row(id, stored, seen)
+            except ResourceError as e:
+                errors.append({'operation': 'delete', 'row': index, 'error': str(e)})
+                continue
+            entries.append((index, current, current))
+        if errors and not partial:
+            return 0
+
+        def delete(entries):
+            self.delete_rows([current[self.pk.key] for _, current, _ in entries])
+
+        return len(self.write_entries('delete', entries, delete, errors, partial))
+
+    def is_id(self, id):
+        """Whether a batch item's ID is of the primary key's type (true and false are not 1 and 0)."""
+        return isinstance(id, self.pk.type.python_type) and not isinstance(id, bool)
+
+    def stored_row(self, id, stored, seen):
+        """The stored row of a batch item's ID, which may only appear once in its operation."""
+        if not self.is_id(id):
+            raise ResourceError(f'Missing or invalid {self.pk.key}')
+        if id in seen:
+            raise ResourceError(f'{self.pk.key} {id} appears more than once')
+        seen.add(id)
+        if id not in stored:
+            raise ResourceError(f'{self.label} {id} not found')
+        return stored[id]
+
+    def write_entries(self, action, entries, execute, errors, partial):
+        """Run the hooks and execute(entries) for (index, stored row, new row) entries; returns
+        the entries written.
+
+        Without partial a broken constraint fails the batch. With partial the entries are
+        written in a savepoint and, if that fails, one savepoint each, to keep the others.
+        (Not every entry is in a savepoint: with pysqlite a savepoint that opens the
+        transaction commits it when released, so the atomic mode does not use them.)
+        """
+        def write(entries):
+            self.run_hook(self.before_write, action, [current for _, current, _ in entries])
+            execute(entries)
+
+        if not entries:
+            return []
+        try:
+            if partial:
+                with db.session.begin_nested():
+                    write(entries)
+            else:
+                write(entries)
+        except IntegrityError as e:
+            if not partial or len(entries) == 1:
+                errors.append({'operation': action, **({'row': entries[0][0]} if len(entries) == 1 else {}),
+                               'error': str(e.orig)})
+                return []
+            written = []
+            for entry in entries:
+                try:
+                    with db.session.begin_nested():
+                        write([entry])
+                    written.append(entry)
+                except IntegrityError as e:
+                    errors.append({'operation': action, 'row': entry[0], 'error': str(e.orig)})
+            entries = written
+        self.run_hook(self.after_write, action, [new for _, _, new in entries])
+        return entries
+
+    # Routes
+    def register(self, bp):
+        collection = f'/api/{self.name}'
+        item = f'{collection}/<{self.id_converter}:id>'
+        views = {
+            'batch': (f'{collection}/batch', 'POST', self.batch_view),
+            'list': (collection, 'GET', self.list_view),
+            'create': (collection, 'POST', self.create_view),
+            'get': (item, 'GET', self.get_view),
+            'update': (item, 'PUT', self.update_view),
+            'delete': (item, 'DELETE', self.delete_view),
+        }
+        for method in self.methods:
+            rule, verb, view = views[method]
+            bp.add_url_rule(rule, f'{method}_{self.name}', view, methods=[verb])
+        return self
+
+    def list_view(self):
+        return list_response(self.model, date_column=self.date_column)
+
+    def get_view(self, id):
+        row = self.row(id)
+        if row is None:
+            abort(404)
+        return json_response(row)
+
+    def create_view(self):
+        try:
+            id = self.create(request.get_json())
+            db.session.commit()
+        except (ResourceError, IntegrityError) as e:
+            return self.rejected(e)
+        return json_response({self.pk.key: id}, 201)
+
+    def update_view(self, id):
+        try:
+            self.update(id, request.get_json())
+            db.session.commit()
+        except (ResourceError, IntegrityError) as e:
+            return self.rejected(e)
+        return jsonify({'message': f'{self.label} updated'})
+
+    def delete_view(self, id):
+        try:
+            self.delete(id)
+            db.session.commit()
+        except (ResourceError, IntegrityError) as e:
+            return self.rejected(e)
+        return jsonify({'message': f'{self.label} deleted'})
+
+    def batch_view(self):
+        # {"create": [{...}], "update": [{<primary key>: id, ...}], "delete": [id, ...],
+        #  "mode": "atomic" (all or nothing, the default) or "partial" (keep the valid items)}
+        data = request.get_json()
+        try:
+            if not isinstance(data, dict):
+                raise ResourceError('Expected a JSON object')
+            allowed = [action for action in BATCH_ACTIONS if action in self.methods]
+            unknown = set(data) - set(allowed) - {'mode'}
+            if unknown:
+                raise ResourceError(f"Unknown or unsupported operations: {', '.join(sorted(unknown))} "
+                                    f"(accepted: {', '.join(allowed)})")
+            if data.get('mode', 'atomic') not in BATCH_MODES:
+                raise ResourceError(f"mode must be one of: {', '.join(BATCH_MODES)}")
+            if not all(isinstance(data.get(action, []), list) for action in allowed):
+                raise ResourceError(f"{', '.join(allowed)} must be lists")
+            if sum(len(data.get(action, [])) for action in allowed) > MAX_BATCH_SIZE:
+                raise ResourceError(f'A batch may have at most {MAX_BATCH_SIZE} items')
+        except ResourceError as e:
+            return jsonify({'error': str(e)}), 400
+
+        partial = data.get('mode') == 'partial'
+        results, errors = self.batch(data, partial)
+        if errors and not partial:
+            db.session.rollback()
+            return json_response({'error': 'Batch rejected, nothing was written', 'errors': errors}, 400)
+        db.session.commit()
+        written = results['created'] or results['updated'] or results['deleted']
+        status = 400 if errors and not written else 200
+        return json_response({**results, 'rejected': len(errors), 'errors': errors}, status)
+
+    def rejected(self, error):
+        """400 for a write that failed validation or broke a constraint."""
+        db.session.rollback()
+        return jsonify({'error': str(error.orig if isinstance(error, IntegrityError) else error)}), 400
+
+def parse_number(name, value, integer=False):
+    """A number column's value sent as a JSON number or a numeric string ('' and null are None)."""
+    if value is None or value == '':
+        return None
+    try:
+        if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+            raise ValueError
+        if integer:
+            number = int(value) if isinstance(value, (int, str)) else value
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            return int(number)
+        number = float(value)
+        if not math.isfinite(number):
+            raise ValueError
+        return number
+    except (ValueError, OverflowError):
+        raise ResourceError(f"{name} must be {'an integer' if integer else 'a number'}")
+
+def log_resource(spec, label):
+    """Resource of a log table (listing and single readings), with the defaults of its
+    BULK_LOG_SPECS entry and the same derived-table updates as the bulk endpoint."""
+    model = spec['model']
+    numbers = spec['numbers']
+    return Resource(
+        model, model.__tablename__, label, date_column=getattr(model, spec['timestamp']), methods=('list', 'create'),
+        required=[spec['key'], *(field for field, default in numbers.items() if default is None)],
+        defaults={**{field: default for field, default in numbers.items() if default is not None},
+                  spec['timestamp']: datetime.utcnow},
+        after_write=lambda action, rows: logs_added(spec, rows))
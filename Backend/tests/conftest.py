@@ -0,0 +1,51 @@
+"""Fixtures shared by the tests.
+
+Each test gets a fresh database built by init_db(): a SQLite file in the test's
+temporary directory, or the server database named by TEST_DATABASE_URL, e.g.
+
+    TEST_DATABASE_URL=postgresql://postgres@localhost/livestock_test python -m pytest
+
+The tables of a server database are dropped again after each test.
+"""
+import os
+
+import pytest
+
+from app import create_app, init_db
+from models import db
+
+@pytest.fixture
+def app(tmp_path):
+    database_url = os.environ.get('TEST_DATABASE_URL') or f'sqlite:///{tmp_path / "livestock.db"}'
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': database_url,
+        'UPLOAD_FOLDER': str(tmp_path / 'uploads'),
+    })
+    with app.app_context():
+        init_db()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        if not database_url.startswith('sqlite'):
+            db.drop_all()
+            with db.engine.begin() as connection:
+                connection.exec_driver_sql('DROP TABLE IF EXISTS schema_version')
+        db.engine.dispose()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def herd(client):
+    """Two farms, a lot on each and animals B01 to B05 on the first lot."""
+    for name in ('Norte', 'Sur'):
+        assert client.post('/api/fincas', json={'Nombre': name}).status_code == 201
+    for farm_id in (1, 2):
+        assert client.post('/api/lotes', json={'FincaID': farm_id, 'Nombre_Lote': f'Lote {farm_id}'}).status_code == 201
+    for number in range(1, 6):
+        response = client.post('/api/bovinos', json={
+            'BovinoID': f'B{number:02d}', 'FincaID': 1, 'LoteID': 1, 'Sexo': 'F', 'Fecha_Nac': '2023-01-01'})
+        assert response.status_code == 201
+    return [f'B{number:02d}' for number in range(1, 6)]
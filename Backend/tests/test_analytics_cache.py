@@ -0,0 +1,41 @@
+def test_unchanged_analytics_answer_304(client, herd):
+    first = client.get('/api/analytics/animal/B01')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'no-cache'
+    etag = first.headers['ETag']
+
+    again = client.get('/api/analytics/animal/B01', headers={'If-None-Match': etag})
+    assert again.status_code == 304
+    assert again.data == b''
+    assert again.headers['ETag'] == etag
+
+def test_a_write_changes_the_etag(client, herd):
+    etag = client.get('/api/analytics/animal/B01').headers['ETag']
+    farm_etag = client.get('/api/analytics/farm/1').headers['ETag']
+
+    response = client.post('/api/pesajes_canales', json={'BovinoID': 'B01', 'Peso_Canal': 250, 'Fecha_Sacrificio': '2024-04-01'})
+    assert response.status_code == 201
+
+    changed = client.get('/api/analytics/animal/B01', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != etag
+    # The carcass also counts for the animal's farm
+    farm = client.get('/api/analytics/farm/1', headers={'If-None-Match': farm_etag})
+    assert farm.status_code == 200
+    assert farm.get_json()['total_meat_production_kg'] == 250
+
+def test_the_etag_follows_the_content(client, herd):
+    # An invalidated entry is computed again, but an unchanged body keeps its ETag
+    etag = client.get('/api/analytics/farm/2').headers['ETag']
+    client.post('/api/registros_sanitarios', data={'BovinoID': 'B01', 'Estado_Salud': 'Sano', 'Fecha_Muestra': '2024-01-05'})
+    assert client.get('/api/analytics/farm/2', headers={'If-None-Match': etag}).status_code == 304
+
+def test_query_string_variants_have_their_own_etag(client, herd):
+    client.post('/api/movimientos_animales', json={'BovinoID': 'B01', 'Fecha': '2024-02-01T00:00:00', 'Lote_Origen': 1, 'Lote_Destino': 2})
+    now = client.get('/api/analytics/land/2')
+    before = client.get('/api/analytics/land/2?at=2024-01-01')
+    assert now.get_json()['animal_count'] == 1
+    assert before.get_json()['animal_count'] == 0
+    assert before.headers['ETag'] != now.headers['ETag']
+    assert client.get('/api/analytics/land/2?at=2024-01-01', headers={'If-None-Match': now.headers['ETag']}).status_code == 200
+    assert client.get('/api/analytics/land/2?at=2024-01-01', headers={'If-None-Match': before.headers['ETag']}).status_code == 304
@@ -0,0 +1,40 @@
+import time
+
+from app import create_app, init_db
+
+def second_app(tmp_path, **config):
+    app = create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "second.db"}',
+                      'UPLOAD_FOLDER': str(tmp_path / 'second-uploads'), **config})
+    with app.app_context():
+        init_db()
+    return app
+
+def wait_for_processing(client, digest, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        status = client.get(f'/api/uploads/{digest}').get_json()['status']
+        if status not in ('pending', 'processing') or time.monotonic() > deadline:
+            return status
+        time.sleep(0.05)
+
+def test_each_app_runs_its_own_certificate_worker(app, client, tmp_path):
+    client.get('/api/fincas')
+    other = second_app(tmp_path)
+    other_client = other.test_client()
+    uploaded = other_client.post('/api/uploads?filename=certificado.pdf', data=b'%PDF-1.4\n%%EOF\n')
+    assert uploaded.status_code == 201
+
+    first, second = app.extensions['certificate_worker'], other.extensions['certificate_worker']
+    assert first is not second and first.is_alive() and second.is_alive()
+    assert app.extensions['certificate_queued'] is not other.extensions['certificate_queued']
+    # The upload woke the second app's worker, which processed it in the second app's database
+    assert wait_for_processing(other_client, uploaded.get_json()['sha256']) in ('done', 'failed')
+
+def test_log_maintenance_runs_per_app_when_logs_are_packed(app, client, tmp_path):
+    client.get('/api/fincas')
+    assert 'log_maintenance' not in app.extensions
+
+    packed = second_app(tmp_path, LOG_STORAGE='packed')
+    packed.test_client().get('/api/fincas')
+    packed.test_client().get('/api/lotes')
+    assert packed.extensions['log_maintenance'].is_alive()
@@ -0,0 +1,131 @@
+import pytest
+from sqlalchemy import event
+
+from models import db
+
+def batch(client, name, body):
+    response = client.post(f'/api/{name}/batch', json=body)
+    return response.status_code, response.get_json()
+
+def estados(client):
+    return {row['BovinoID']: row['Estado'] for row in client.get('/api/bovinos?fields=BovinoID,Estado').get_json()}
+
+@pytest.fixture
+def statements(app):
+    """SQL statements run while the test is active."""
+    executed = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        yield executed
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+def test_create_update_and_delete_in_one_batch(client, herd):
+    status, result = batch(client, 'bovinos', {
+        'create': [{'BovinoID': 'B06', 'FincaID': 1, 'LoteID': 1}],
+        'update': [{'BovinoID': 'B06', 'Sexo': 'M'}, {'BovinoID': 'B01', 'Estado': 'Vendido'}],
+        'delete': ['B05'],
+    })
+    assert status == 200
+    assert result == {'created': ['B06'], 'updated': 2, 'deleted': 1, 'rejected': 0, 'errors': []}
+    assert client.get('/api/bovinos/B06').get_json()['Sexo'] == 'M'
+    assert client.get('/api/bovinos/B05').status_code == 404
+    assert estados(client)['B01'] == 'Vendido'
+
+def test_created_ids_are_generated(client, herd):
+    status, result = batch(client, 'movimientos_animales', {'create': [
+        {'BovinoID': 'B01', 'Fecha': '2024-02-01', 'Lote_Origen': 1, 'Lote_Destino': 2},
+        {'BovinoID': 'B02', 'Fecha': '2024-02-01', 'Lote_Origen': 1, 'Lote_Destino': 2},
+    ]})
+    assert (status, result['created']) == (200, ['MOV001', 'MOV002'])
+    # The movements' hooks ran: the animals are on their new lot
+    animals = client.get('/api/lotes/2/animals').get_json()['animals']
+    assert [animal['BovinoID'] for animal in animals] == ['B01', 'B02']
+
+def test_atomic_batch_writes_nothing_on_any_error(client, herd):
+    status, result = batch(client, 'bovinos', {
+        'create': [{'BovinoID': 'B07', 'FincaID': 1, 'LoteID': 1}],
+        'update': [{'BovinoID': 'B01', 'Estado': 'Vendido'}, {'BovinoID': 'B99', 'Estado': 'Vendido'}],
+        'delete': ['B05'],
+    })
+    assert status == 400
+    assert result['error'] == 'Batch rejected, nothing was written'
+    assert result['errors'] == [{'operation': 'update', 'row': 1, 'error': 'Bovino B99 not found'}]
+    assert client.get('/api/bovinos/B07').status_code == 404
+    assert client.get('/api/bovinos/B05').status_code == 200
+    assert estados(client)['B01'] is None
+
+def test_atomic_batch_rolls_back_a_failed_insert(client, herd):
+    status, result = batch(client, 'bovinos', {'create': [
+        {'BovinoID': 'B08', 'FincaID': 1, 'LoteID': 1},
+        {'BovinoID': 'B01', 'FincaID': 1, 'LoteID': 1},
+    ]})
+    assert status == 400
+    assert result['errors'][0]['operation'] == 'create'
+    assert client.get('/api/bovinos/B08').status_code == 404
+
+def test_partial_batch_keeps_the_valid_items(client, herd):
+    status, result = batch(client, 'bovinos', {
+        'mode': 'partial',
+        'create': [{'BovinoID': 'B08', 'FincaID': 1, 'LoteID': 1}, {'BovinoID': 'B01', 'FincaID': 1, 'LoteID': 1},
+                   {'FincaID': 1}],
+        'update': [{'BovinoID': 'B02', 'Estado': 'Vendido'}, {'BovinoID': 'B99', 'Estado': 'Vendido'},
+                   {'BovinoID': 'B03', 'Fecha_Nac': 'nope'}],
+    })
+    assert status == 200
+    assert result['created'] == ['B08']
+    assert result['updated'] == 1
+    assert result['rejected'] == 4
+    assert [(error['operation'], error['row']) for error in result['errors']] == [
+        ('create', 1), ('create', 2), ('update', 1), ('update', 2)]
+    assert client.get('/api/bovinos/B08').status_code == 200
+    assert estados(client)['B02'] == 'Vendido'
+
+def test_partial_batch_validators_see_earlier_items(client, herd):
+    batch(client, 'alimentacion', {'create': [{'Nombre_Racion': 'Engorde'}]})
+    status, result = batch(client, 'ingredientes_racion', {'mode': 'partial', 'create': [
+        {'RacionID': 'Alim-001', 'InsumoID': 'INS001', 'PorcentajeMS': 60},
+        {'RacionID': 'Alim-001', 'InsumoID': 'INS002', 'PorcentajeMS': 60},
+        {'RacionID': 'Alim-001', 'InsumoID': 'INS003', 'PorcentajeMS': 40},
+    ]})
+    assert status == 200
+    assert result['created'] == ['ING001', 'ING002']
+    assert [error['row'] for error in result['errors']] == [1]
+
+def test_same_values_are_updated_with_one_statement(client, herd, statements):
+    status, result = batch(client, 'bovinos', {'update': [{'BovinoID': animal_id, 'Estado': 'Vendido'} for animal_id in herd]})
+    assert (status, result['updated']) == (200, 5)
+    updates = [statement for statement in statements if statement.startswith('UPDATE bovinos')]
+    assert len(updates) == 1
+    assert set(estados(client).values()) == {'Vendido'}
+
+def test_ids_must_match_the_key_type(client, herd):
+    # true is not farm 1, nor '1'
+    status, result = batch(client, 'fincas', {'delete': [True, '1', None]})
+    assert status == 400
+    assert result['errors'] == [
+        {'operation': 'delete', 'row': row, 'error': 'Missing or invalid FincaID'} for row in range(3)]
+    status, result = batch(client, 'fincas', {'update': [{'FincaID': False, 'Nombre': 'X'}]})
+    assert result['errors'] == [{'operation': 'update', 'row': 0, 'error': 'Missing or invalid FincaID'}]
+    status, result = batch(client, 'fincas', {'mode': 'partial', 'delete': [True, 2]})
+    assert (status, result['deleted'], result['rejected']) == (200, 1, 1)
+    assert [farm['FincaID'] for farm in client.get('/api/fincas').get_json()] == [1]
+    assert batch(client, 'bovinos', {'delete': [1]})[1]['errors'] == [
+        {'operation': 'delete', 'row': 0, 'error': 'Missing or invalid BovinoID'}]
+
+@pytest.mark.parametrize('body, error', [
+    ({'upsert': []}, 'Unknown or unsupported operations: upsert (accepted: create, update, delete)'),
+    ({'mode': 'all'}, 'mode must be one of: atomic, partial'),
+    ({'create': {}}, 'create, update, delete must be lists'),
+    ([], 'Expected a JSON object'),
+    ({'delete': ['B01'] * 1001}, 'A batch may have at most 1000 items'),
+])
+def test_invalid_batches(client, herd, body, error):
+    assert batch(client, 'bovinos', body) == (400, {'error': error})
+
+def test_batch_follows_the_resource_methods(client, herd):
+    # Health records are created from a form with a certificate upload, not in batches
+    status, result = batch(client, 'registros_sanitarios', {'create': [{}]})
+    assert (status, result['error']) == (400, 'Unknown or unsupported operations: create (accepted: update, delete)')
+    assert client.post('/api/weight_logs/batch', json={'create': []}).status_code == 405
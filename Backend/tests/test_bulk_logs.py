@@ -0,0 +1,43 @@
+def bulk(client, name, body):
+    response = client.post(f'/api/{name}/bulk', data=body, content_type='application/x-ndjson')
+    return response.status_code, response.get_json()
+
+def test_bulk_ingest_reports_each_invalid_row(client, herd):
+    status, result = bulk(client, 'weight_logs', '\n'.join([
+        '{"animal_id": "B01", "weight_kg": 300, "measured_at": "2024-01-01T08:00:00"}',
+        '{"animal_id": "B01", "weight_kg": "abc"}',
+        '{"animal_id": "B99", "weight_kg": 300}',
+        'not json',
+        '{"animal_id": "B02", "weight_kg": 310.5}',
+    ]))
+    assert status == 201
+    assert result['inserted'] == 2
+    assert result['errors'] == [
+        {'row': 1, 'error': 'weight_kg must be a number'},
+        {'row': 2, 'error': 'animal_id B99 does not exist'},
+        {'row': 3, 'error': 'Invalid JSON'},
+    ]
+
+def test_values_that_are_not_finite_are_rejected(client, herd):
+    status, result = bulk(client, 'emission_logs', '\n'.join([
+        '{"animal_id": "B01", "co2_emissions": NaN}',
+        '{"animal_id": "B01", "co2_emissions": "inf"}',
+        '{"animal_id": "B01", "co2_emissions": 1, "methane_emissions": "-Infinity"}',
+        '{"animal_id": "B01", "co2_emissions": true}',
+        '{"animal_id": "B01", "co2_emissions": 1e400}',
+    ]))
+    assert status == 400
+    assert result['inserted'] == 0
+    assert [error['error'] for error in result['errors']] == [
+        'co2_emissions must be a finite number',
+        'co2_emissions must be a finite number',
+        'methane_emissions must be a finite number',
+        'co2_emissions must be a number',
+        'co2_emissions must be a finite number',
+    ]
+    assert client.get('/api/emission_logs').get_json() == []
+
+def test_bulk_ingest_needs_a_list(client, herd):
+    response = client.post('/api/weight_logs/bulk', json={'animal_id': 'B01'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Expected a JSON array or an NDJSON body'}
@@ -0,0 +1,58 @@
+import csv
+import gzip
+import io
+import json
+
+import pytest
+
+from blueprints import data
+
+@pytest.fixture
+def weighings(client, herd):
+    """Ten days of weighings of B01 and B02, one each a day from 2024-01-01."""
+    rows = [{'animal_id': animal_id, 'weight_kg': 200 + day, 'measured_at': f'2024-01-{day + 1:02d}T08:00:00'}
+            for day in range(10) for animal_id in ('B01', 'B02')]
+    response = client.post('/api/weight_logs/bulk', json=rows)
+    assert response.get_json()['inserted'] == 20
+    return rows
+
+def ndjson_rows(response):
+    return [json.loads(line) for line in response.data.decode().splitlines()]
+
+def test_ndjson_export_streams_every_row(client, weighings, monkeypatch):
+    # Small batches, so the rows cross several chunks of the stream
+    monkeypatch.setattr(data, 'EXPORT_BATCH_ROWS', 4)
+    response = client.get('/api/export/weight_logs')
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=weight_logs.ndjson'
+    rows = ndjson_rows(response)
+    assert [row['id'] for row in rows] == list(range(1, 21))
+    assert rows[0] == {'id': 1, 'animal_id': 'B01', 'weight_kg': 200.0, 'measured_at': '2024-01-01T08:00:00'}
+
+def test_csv_export_with_fields_and_filters(client, weighings):
+    response = client.get('/api/export/weight_logs?format=csv&fields=animal_id,weight_kg'
+                          '&BovinoID=B02&date_from=2024-01-05&date_to=2024-01-08')
+    assert response.mimetype == 'text/csv'
+    assert list(csv.reader(io.StringIO(response.data.decode()))) == [
+        ['animal_id', 'weight_kg'],
+        ['B02', '204.0'], ['B02', '205.0'], ['B02', '206.0'],
+    ]
+
+def test_empty_csv_export_has_the_header(client, herd):
+    response = client.get('/api/export/compras?format=csv&fields=CompraID,Total')
+    assert response.data.decode().splitlines() == ['CompraID,Total']
+
+def test_gzip_export(client, weighings):
+    response = client.get('/api/export/weight_logs?gzip=1')
+    assert response.headers['Content-Encoding'] == 'gzip'
+    # Reading the stream ends its request before the next one starts
+    compressed = response.data
+    assert gzip.decompress(compressed) == client.get('/api/export/weight_logs').data
+
+def test_export_errors(client, herd):
+    assert client.get('/api/export/users').status_code == 404
+    assert client.get('/api/export/bovinos?format=xml').status_code == 400
+    assert client.get('/api/export/bovinos?date_from=yesterday').status_code == 400
+    assert client.get('/api/export/bovinos?fields=Color').status_code == 400
@@ -0,0 +1,28 @@
+import io
+
+def test_create_from_the_form(client, herd):
+    response = client.post('/api/registros_sanitarios', data={
+        'BovinoID': 'B01', 'Estado_Salud': 'Sano', 'Fecha_Muestra': '2024-01-05', 'Costo_Examen': '12.5',
+        'Laboratorio': '', 'archivo_certificado': (io.BytesIO(b'%PDF-1.4\n%%EOF\n'), 'certificado.pdf'),
+    })
+    assert (response.status_code, response.get_json()) == (201, {'RegistroID': 'RS001'})
+    registro = client.get('/api/registros_sanitarios/RS001').get_json()
+    assert registro['Fecha_Muestra'] == '2024-01-05T00:00:00'
+    assert registro['Costo_Examen'] == 12.5
+    assert registro['Laboratorio'] is None
+    assert registro['Archivo_Certificado'].endswith('.pdf')
+
+def test_invalid_form_fields_answer_400(client, herd):
+    for form, error in [
+        ({'Estado_Salud': 'Sano'}, 'Missing required fields: BovinoID'),
+        ({'BovinoID': 'B01', 'Costo_Examen': 'abc'}, 'Costo_Examen must be a number'),
+        ({'BovinoID': 'B01', 'Costo_Examen': 'nan'}, 'Costo_Examen must be a number'),
+        ({'BovinoID': 'B01', 'Fecha_Muestra': '05/01/2024'}, 'Fecha_Muestra must be an ISO date'),
+    ]:
+        response = client.post('/api/registros_sanitarios', data=form)
+        assert (response.status_code, response.get_json()) == (400, {'error': error})
+    assert client.get('/api/registros_sanitarios').get_json() == []
+
+def test_duplicate_registro_id_answers_400(client, herd):
+    assert client.post('/api/registros_sanitarios', data={'BovinoID': 'B01', 'RegistroID': 'RS-A'}).status_code == 201
+    assert client.post('/api/registros_sanitarios', data={'BovinoID': 'B02', 'RegistroID': 'RS-A'}).status_code == 400
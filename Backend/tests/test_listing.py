@@ -0,0 +1,55 @@
+from listing import encode_cursor
+
+def walk_pages(client, url):
+    """Rows of every page of a list endpoint, following X-Next-Cursor."""
+    pages = []
+    response = client.get(url)
+    while True:
+        assert response.status_code == 200
+        pages.append(response.get_json())
+        cursor = response.headers.get('X-Next-Cursor')
+        if cursor is None:
+            return pages
+        response = client.get(f'{url}&cursor={cursor}')
+
+def test_cursor_pagination_returns_every_row_once(client, herd):
+    pages = walk_pages(client, '/api/bovinos?limit=2&fields=BovinoID')
+    assert [[row['BovinoID'] for row in page] for page in pages] == [['B01', 'B02'], ['B03', 'B04'], ['B05']]
+    # fields leaves out the other columns
+    assert pages[0][0] == {'BovinoID': 'B01'}
+
+def test_cursor_pagination_with_a_filter(client, herd):
+    for animal_id in ('B02', 'B04'):
+        response = client.post('/api/movimientos_animales', json={'BovinoID': animal_id, 'Fecha': '2024-02-01T00:00:00',
+                                                                   'Lote_Origen': 1, 'Lote_Destino': 2})
+        assert response.status_code == 201
+    pages = walk_pages(client, '/api/bovinos?limit=2&LoteID=1&fields=BovinoID')
+    assert [[row['BovinoID'] for row in page] for page in pages] == [['B01', 'B03'], ['B05']]
+
+def test_full_last_page_has_no_next_cursor(client, herd):
+    response = client.get('/api/bovinos?limit=5')
+    assert len(response.get_json()) == 5
+    assert 'X-Next-Cursor' not in response.headers
+
+def test_invalid_list_parameters(client, herd):
+    assert client.get('/api/bovinos?cursor=not-a-cursor!').status_code == 400
+    for limit in ('0', '-5', 'abc', '2.5', '', '²', '0x10'):
+        response = client.get(f'/api/bovinos?limit={limit}')
+        assert (response.status_code, response.get_json()) == (400, {'error': 'limit must be a positive integer'})
+    assert client.get('/api/bovinos?fields=BovinoID,Color').get_json() == {'error': 'Unknown fields: Color'}
+
+def test_cursor_must_hold_a_key_of_the_right_type(client, herd):
+    for value in ([1], {'id': 'B01'}, 3, True, None):
+        response = client.get(f'/api/bovinos?limit=2&cursor={encode_cursor(value)}')
+        assert (response.status_code, response.get_json()) == (400, {'error': 'Invalid cursor'})
+    # Integer keys, packed log tables included
+    assert client.get(f'/api/fincas?cursor={encode_cursor("1")}').status_code == 400
+    assert client.get(f'/api/emission_logs?cursor={encode_cursor([1])}').status_code == 400
+    assert client.get(f'/api/fincas?cursor={encode_cursor(1)}').get_json()[0]['FincaID'] == 2
+
+def test_large_limits_are_capped(client, herd, monkeypatch):
+    monkeypatch.setattr('listing.MAX_PAGE_SIZE', 3)
+    for limit in ('4', '0004', '9' * 5000):
+        response = client.get(f'/api/bovinos?limit={limit}&fields=BovinoID')
+        assert len(response.get_json()) == 3
+        assert 'X-Next-Cursor' in response.headers
@@ -0,0 +1,30 @@
+def locations(client, animal_id):
+    return [(stay['LoteID'], stay['since'], stay['until'])
+            for stay in client.get(f'/api/bovinos/{animal_id}/locations').get_json()]
+
+def move(client, **movement):
+    response = client.post('/api/movimientos_animales', json={'BovinoID': 'B01', 'Fecha': '2024-02-01', **movement})
+    assert response.status_code == 201
+    return response.get_json()['MovID']
+
+def test_stay_before_a_movement_without_origin_is_on_the_registered_lot(client, herd):
+    move(client, Lote_Destino='2')
+    move(client, Fecha='2024-03-01', Lote_Destino='1')
+    assert locations(client, 'B01') == [
+        (1, None, '2024-02-01T00:00:00'),
+        (2, '2024-02-01T00:00:00', '2024-03-01T00:00:00'),
+        (1, '2024-03-01T00:00:00', None),
+    ]
+    animals = client.get('/api/lotes/1/animals?at=2024-01-15').get_json()['animals']
+    assert 'B01' in [animal['BovinoID'] for animal in animals]
+
+def test_origin_of_the_first_movement_comes_first(client, herd):
+    move(client, Lote_Origen='2', Lote_Destino='1')
+    assert locations(client, 'B01')[0] == (2, None, '2024-02-01T00:00:00')
+
+def test_deleting_the_movements_returns_the_animal_to_its_registered_lot(client, herd):
+    mov_id = move(client, Lote_Destino='2')
+    assert client.get('/api/bovinos/B01').get_json()['LoteID'] == 2
+    assert client.delete(f'/api/movimientos_animales/{mov_id}').status_code == 200
+    assert locations(client, 'B01') == [(1, None, None)]
+    assert client.get('/api/bovinos/B01').get_json()['LoteID'] == 1
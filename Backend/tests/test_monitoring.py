@@ -0,0 +1,40 @@
+import sys
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from models import db
+
+def test_failed_statements_leave_no_timer_on_the_connection(app, client):
+    @app.route('/test/failed_statement')
+    def failed_statement():
+        with db.engine.connect() as conn:
+            with pytest.raises(OperationalError):
+                conn.exec_driver_sql('SELECT * FROM missing_table')
+            return {'timers': len(conn.info.get('statement_started', []))}
+
+    assert client.get('/test/failed_statement').get_json() == {'timers': 0}
+
+def test_profiler_stops_when_the_request_raises(app, client, tmp_path):
+    app.config.update(PROFILE_REQUESTS=True, PROFILE_DIR=str(tmp_path / 'profiles'))
+
+    @app.route('/test/error')
+    def error():
+        raise RuntimeError('boom')
+
+    with pytest.raises(RuntimeError):
+        client.get('/test/error?profile=1')
+    assert sys.getprofile() is None
+
+def test_repeated_statements_are_logged(app, client, caplog):
+    app.config['NPLUSONE_THRESHOLD'] = 3
+
+    @app.route('/test/repeated')
+    def repeated():
+        for _ in range(3):
+            db.session.execute(db.text('SELECT 1')).scalar()
+        return {}
+
+    client.get('/test/repeated')
+    warnings = [record for record in caplog.records if record.getMessage().startswith('Possible N+1 query in GET /test/repeated')]
+    assert [record.levelname for record in warnings] == ['WARNING']
@@ -0,0 +1,118 @@
+from datetime import datetime
+
+import pytest
+
+from app import init_db
+from logs import maintain_log_storage
+from models import db, EmissionLog, LogChunk
+
+from test_listing import walk_pages
+
+@pytest.fixture
+def emissions(client, herd):
+    """Readings of B01 and B02 every 6 hours from 2024-01-01 to 2024-01-04, ids 1 to 32."""
+    rows = [{'animal_id': animal_id, 'co2_emissions': day * 10 + hour / 6 + (animal_id == 'B02'),
+             'methane_emissions': 0.5, 'logged_at': f'2024-01-{day:02d}T{hour:02d}:00:00'}
+            for day in range(1, 5) for hour in (0, 6, 12, 18) for animal_id in ('B01', 'B02')]
+    response = client.post('/api/emission_logs/bulk', json=rows)
+    assert response.get_json()['inserted'] == 32
+    return client.get('/api/emission_logs').get_json()
+
+def maintain(app, now, **config):
+    app.config.update(config)
+    with app.app_context():
+        return maintain_log_storage(now=datetime.fromisoformat(now))
+
+def chunks(app):
+    with app.app_context():
+        return db.session.execute(
+            db.select(LogChunk.parent_id, LogChunk.period_start, LogChunk.count, LogChunk.resolution)
+            .where(LogChunk.log_table == 'emission_logs')
+            .order_by(LogChunk.parent_id, LogChunk.period_start)).all()
+
+def test_packing_keeps_the_listing_unchanged(app, client, emissions):
+    # The readings before 2024-01-03 go into one chunk per animal and day
+    assert maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2)['emission_logs'] == (16, 0)
+    assert [(parent, day.day, count) for parent, day, count, _ in chunks(app)] == [
+        ('B01', 1, 4), ('B01', 2, 4), ('B02', 1, 4), ('B02', 2, 4)]
+    with app.app_context():
+        assert db.session.query(EmissionLog).count() == 16
+
+    assert client.get('/api/emission_logs').get_json() == emissions
+    # Pages merge chunks and rows in id order
+    pages = walk_pages(client, '/api/emission_logs?limit=5')
+    assert [row for page in pages for row in page] == emissions
+
+def test_filters_apply_to_chunks_and_rows(app, client, emissions):
+    maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2)
+    url = '/api/emission_logs?BovinoID=B02&date_from=2024-01-02T06:00:00&date_to=2024-01-03T06:00:00&fields=id,logged_at'
+    expected = [{'id': row['id'], 'logged_at': row['logged_at']} for row in emissions
+                if row['animal_id'] == 'B02' and '2024-01-02T06:00:00' <= row['logged_at'] <= '2024-01-03T06:00:00']
+    assert len(expected) == 5
+    assert client.get(url).get_json() == expected
+    assert [row for page in walk_pages(client, url + '&limit=2') for row in page] == expected
+
+def test_export_reads_packed_readings(app, client, emissions):
+    maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2)
+    exported = client.get('/api/export/emission_logs').data.decode().splitlines()
+    assert len(exported) == 32
+
+def test_packed_ids_are_not_reused(app, client, emissions):
+    # Every reading is packed, the one with the highest id too
+    assert maintain(app, '2024-02-01T00:00:00', LOG_PACK_AFTER_DAYS=2)['emission_logs'] == (32, 0)
+    response = client.post('/api/emission_logs', json={'animal_id': 'B01', 'co2_emissions': 1, 'logged_at': '2024-01-31T00:00:00'})
+    assert response.status_code == 201
+    ids = [row['id'] for row in client.get('/api/emission_logs').get_json()]
+    assert ids == list(range(1, 34))
+
+def test_late_readings_are_merged_into_their_day(app, client, emissions):
+    maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2)
+    late = {'animal_id': 'B01', 'co2_emissions': 7, 'methane_emissions': 0, 'logged_at': '2024-01-01T23:00:00'}
+    assert client.post('/api/emission_logs', json=late).status_code == 201
+
+    # The reading is packed into a second chunk of its day, and the two are merged
+    assert maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2)['emission_logs'] == (1, 2)
+    assert [(parent, day.day, count) for parent, day, count, _ in chunks(app)][:2] == [('B01', 1, 5), ('B01', 2, 4)]
+    listing = client.get('/api/emission_logs').get_json()
+    assert listing[:-1] == emissions
+    assert listing[-1] == {'id': 33, **late, 'co2_emissions': 7.0, 'methane_emissions': 0.0}
+
+def test_days_past_the_retention_are_downsampled(app, client, emissions):
+    summary = maintain(app, '2024-01-05T12:00:00', LOG_PACK_AFTER_DAYS=2, LOG_RETENTION_DAYS=3,
+                       LOG_DOWNSAMPLE_MINUTES=720)
+    assert summary['emission_logs'] == (16, 2)
+    # 2024-01-01 is past the retention: its four readings per animal become two sums of 12 hours
+    assert [(parent, day.day, count, resolution) for parent, day, count, resolution in chunks(app)] == [
+        ('B01', 1, 2, 43200), ('B01', 2, 4, 0), ('B02', 1, 2, 43200), ('B02', 2, 4, 0)]
+
+    listing = client.get('/api/emission_logs?BovinoID=B01&date_to=2024-01-01T23:59:59').get_json()
+    before = [row for row in emissions if row['animal_id'] == 'B01' and row['logged_at'] < '2024-01-02']
+    assert [row['logged_at'] for row in listing] == ['2024-01-01T00:00:00', '2024-01-01T12:00:00']
+    # Each merged reading keeps the id of the latest one it replaces, and amounts are summed
+    assert [row['id'] for row in listing] == [before[1]['id'], before[3]['id']]
+    assert sum(row['co2_emissions'] for row in listing) == pytest.approx(sum(row['co2_emissions'] for row in before))
+    assert sum(row['methane_emissions'] for row in listing) == pytest.approx(2.0)
+
+def test_migration_makes_old_tables_autoincrement(app, client, emissions):
+    if app.config['SQLALCHEMY_DATABASE_URI'].split(':')[0] != 'sqlite':
+        pytest.skip('AUTOINCREMENT rebuild is SQLite only')
+    maintain(app, '2024-02-01T00:00:00', LOG_PACK_AFTER_DAYS=2)
+    with app.app_context():
+        # Turn emission_logs back into a table from before migration 3, every reading packed
+        with db.engine.begin() as connection:
+            sql = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emission_logs'").scalar()
+            connection.exec_driver_sql('DROP TABLE emission_logs')
+            connection.exec_driver_sql(sql.replace(' AUTOINCREMENT', ''))
+            connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = 'emission_logs'")
+            connection.exec_driver_sql('DELETE FROM schema_version WHERE version >= 3')
+        init_db()
+        with db.engine.connect() as connection:
+            sql = connection.exec_driver_sql(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'emission_logs'").scalar()
+        assert 'AUTOINCREMENT' in sql
+
+    # The sequence starts after the ids in the chunks, though the table was empty
+    response = client.post('/api/emission_logs', json={'animal_id': 'B01', 'co2_emissions': 1, 'logged_at': '2024-01-31T00:00:00'})
+    assert response.status_code == 201
+    assert [row['id'] for row in client.get('/api/emission_logs').get_json()][-2:] == [32, 33]
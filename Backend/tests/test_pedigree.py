@@ -0,0 +1,28 @@
+import pytest
+
+@pytest.fixture
+def half_siblings(client, herd):
+    """Bull B06 and cow B07, both out of B01."""
+    for animal_id, sex in (('B06', 'M'), ('B07', 'F')):
+        response = client.post('/api/bovinos', json={'BovinoID': animal_id, 'FincaID': 1, 'LoteID': 1, 'Sexo': sex,
+                                                      'MadreID': 'B01'})
+        assert response.status_code == 201
+
+def test_mating_check(client, half_siblings):
+    response = client.post('/api/pedigree/mating_check', json={'bull': 'B06', 'cows': ['B07', 'B03', 'B07']})
+    assert response.status_code == 200
+    assert [(mating['cow'], mating['offspring_inbreeding'], mating['acceptable'])
+            for mating in response.get_json()['matings']] == [('B03', 0, True), ('B07', 0.125, False)]
+
+@pytest.mark.parametrize('body, status, error', [
+    ([], 400, 'Expected a JSON object'),
+    ({'bull': 'B06'}, 400, 'bull and a non-empty cows list are required'),
+    ({'bull': 'B06', 'cows': [{'id': 'B07'}]}, 400, 'bull and cows must be BovinoIDs (strings)'),
+    ({'bull': 'B06', 'cows': [['B07']]}, 400, 'bull and cows must be BovinoIDs (strings)'),
+    ({'bull': ['B06'], 'cows': ['B07']}, 400, 'bull and cows must be BovinoIDs (strings)'),
+    ({'bull': 'B06', 'cows': ['B07'], 'max_inbreeding': 'high'}, 400, 'max_inbreeding must be a number'),
+    ({'bull': 'B06', 'cows': ['B07', 'B99']}, 404, 'Unknown animals: B99'),
+])
+def test_invalid_mating_checks(client, half_siblings, body, status, error):
+    response = client.post('/api/pedigree/mating_check', json=body)
+    assert (response.status_code, response.get_json()) == (status, {'error': error})
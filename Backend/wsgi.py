@@ -0,0 +1,12 @@
+"""Production entry point: gunicorn -c gunicorn.conf.py wsgi:app
+
+The app runs behind a reverse proxy (deploy/nginx.conf) that serves the built
+frontend and forwards everything else, so the client address, scheme and host
+are taken from the proxy's X-Forwarded-* headers.
+"""
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from app import create_app
+
+app = create_app()
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
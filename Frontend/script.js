@@ -1,4 +1,5 @@
-const API_BASE = 'http://localhost:5000/api';
+// Same origin: the app (or nginx in production) serves both the page and the API
+const API_BASE = '/api';
 
 // Utility functions
 function showSection(sectionId) {
@@ -36,9 +37,45 @@ function postData(endpoint, data) {
     }).then(response => response.json());
 }
 
+// Reference data (farms, lands, animals, suppliers, supplies, rations) for the dropdowns
+// comes from /api/bootstrap in one request. The sets are kept in localStorage with their
+// versions, so the server only sends the sets that changed since the last load.
+let lookups = JSON.parse(localStorage.getItem('lookups') || '{}');
+let lookupsRequest = null;
+
+function refreshLookups() {
+    // Loaders called together share one request
+    if (!lookupsRequest) {
+        const versions = Object.entries(lookups).map(([name, set]) => `${name}:${set.version}`).join(',');
+        lookupsRequest = fetchData(`/bootstrap?versions=${encodeURIComponent(versions)}`)
+            .then(sets => {
+                Object.entries(sets).forEach(([name, set]) => {
+                    if (set.rows) {
+                        lookups[name] = set;
+                    }
+                });
+                localStorage.setItem('lookups', JSON.stringify(lookups));
+            })
+            .finally(() => {
+                lookupsRequest = null;
+            });
+    }
+    return lookupsRequest;
+}
+
+// Rows of a lookup set as objects, e.g. lookupRecords('fincas') -> [{FincaID, Nombre, ...}]
+function lookupRecords(name) {
+    const set = lookups[name];
+    if (!set) {
+        return [];
+    }
+    return set.rows.map(row => Object.fromEntries(set.fields.map((field, i) => [field, row[i]])));
+}
+
 // Load data functions
 async function loadFarms() {
-    const farms = await fetchData('/fincas');
+    await refreshLookups();
+    const farms = lookupRecords('fincas');
     const landSelect = document.getElementById('land-farm');
     const animalSelect = document.getElementById('animal-farm');
     const analyticsSelect = document.getElementById('analytics-farm');
@@ -67,7 +104,8 @@ async function loadFarms() {
 }
 
 async function loadSuppliesForIngredients() {
-    const insumos = await fetchData('/insumos');
+    await refreshLookups();
+    const insumos = lookupRecords('insumos');
     const ingredientSelect = document.getElementById('ration-ingredient-supply');
 
     ingredientSelect.innerHTML = '<option value="">Seleccionar Suministro</option>';
@@ -79,7 +117,8 @@ async function loadSuppliesForIngredients() {
 }
 
 async function loadMovementAnimals() {
-    const bovinos = await fetchData('/bovinos');
+    await refreshLookups();
+    const bovinos = lookupRecords('bovinos');
     const movementSelect = document.getElementById('movement-animal');
 
     movementSelect.innerHTML = '<option value="">Seleccionar Animal</option>';
@@ -101,7 +140,8 @@ async function loadMovementAnimals() {
 }
 
 async function loadMovementFarms() {
-    const farms = await fetchData('/fincas');
+    await refreshLookups();
+    const farms = lookupRecords('fincas');
     const originFarmSelect = document.getElementById('movement-origin-farm');
     const destFarmSelect = document.getElementById('movement-dest-farm');
 
@@ -122,7 +162,8 @@ async function loadMovementFarms() {
 // based on selected farms to ensure lands are properly associated with their farms
 
 async function loadHealthAnimals() {
-    const bovinos = await fetchData('/bovinos');
+    await refreshLookups();
+    const bovinos = lookupRecords('bovinos');
     const healthSelect = document.getElementById('health-animal');
 
     healthSelect.innerHTML = '<option value="">Seleccionar Animal</option>';
@@ -134,7 +175,8 @@ async function loadHealthAnimals() {
 }
 
 async function loadLands() {
-    const lotes = await fetchData('/lotes');
+    await refreshLookups();
+    const lotes = lookupRecords('lotes');
     const select = document.getElementById('animal-land');
     const resourceSelect = document.getElementById('resource-land');
     const analyticsSelect = document.getElementById('analytics-land');
@@ -157,8 +199,9 @@ async function loadLands() {
 }
 
 async function loadAnimals() {
-    const bovinos = await fetchData('/bovinos');
-    const lotes = await fetchData('/lotes');
+    await refreshLookups();
+    const bovinos = lookupRecords('bovinos');
+    const lotes = lookupRecords('lotes');
     const weightSelect = document.getElementById('weight-animal');
     const emissionSelect = document.getElementById('emission-animal');
     const financeSelect = document.getElementById('finance-animal');
@@ -222,8 +265,9 @@ document.getElementById('land-form').addEventListener('submit', async (e) => {
 
     // Validate that land area doesn't exceed farm area
     try {
-        const farm = await fetchData(`/fincas/${FincaID}`);
-        const existingLands = await fetchData('/lotes');
+        await refreshLookups();
+        const farm = lookupRecords('fincas').find(f => f.FincaID === FincaID);
+        const existingLands = lookupRecords('lotes');
         const totalUsedArea = existingLands
             .filter(land => land.FincaID === FincaID)
             .reduce((sum, land) => sum + (land.Area_ha || 0), 0);
@@ -355,11 +399,9 @@ function updateOriginLandOptions() {
     }
 
     // Filter lands by selected farm
-    fetchData('/lotes').then(lands => {
-        landSelect.innerHTML = '<option value="">Seleccionar Lote Origen</option>';
-        lands.filter(land => land.FincaID == selectedFarm).forEach(land => {
-            landSelect.innerHTML += `<option value="${land.LoteID}">${land.Nombre_Lote}</option>`;
-        });
+    landSelect.innerHTML = '<option value="">Seleccionar Lote Origen</option>';
+    lookupRecords('lotes').filter(land => land.FincaID == selectedFarm).forEach(land => {
+        landSelect.innerHTML += `<option value="${land.LoteID}">${land.Nombre_Lote}</option>`;
     });
 }
 
@@ -373,11 +415,9 @@ function updateDestLandOptions() {
     }
 
     // Filter lands by selected farm
-    fetchData('/lotes').then(lands => {
-        landSelect.innerHTML = '<option value="">Seleccionar Lote Destino</option>';
-        lands.filter(land => land.FincaID == selectedFarm).forEach(land => {
-            landSelect.innerHTML += `<option value="${land.LoteID}">${land.Nombre_Lote}</option>`;
-        });
+    landSelect.innerHTML = '<option value="">Seleccionar Lote Destino</option>';
+    lookupRecords('lotes').filter(land => land.FincaID == selectedFarm).forEach(land => {
+        landSelect.innerHTML += `<option value="${land.LoteID}">${land.Nombre_Lote}</option>`;
     });
 }
 
@@ -523,7 +563,8 @@ async function deleteSlaughterWeight(id) {
 }
 
 async function loadSuppliers() {
-    const proveedores = await fetchData('/proveedores');
+    await refreshLookups();
+    const proveedores = lookupRecords('proveedores');
     const list = document.getElementById('suppliers-list');
     const supplySelect = document.getElementById('supply-supplier');
     const editSelect = document.getElementById('edit-supplier-select');
@@ -543,7 +584,8 @@ async function loadSuppliers() {
 }
 
 async function loadSupplies() {
-    const insumos = await fetchData('/insumos');
+    await refreshLookups();
+    const insumos = lookupRecords('insumos');
     const list = document.getElementById('supplies-list');
     const editSelect = document.getElementById('edit-supply-select');
     const purchaseSelect = document.getElementById('purchase-supply');
@@ -612,8 +654,8 @@ async function loadEditAnimalForm() {
     }
 
     const animal = await fetchData(`/bovinos/${animalId}`);
-    const farms = await fetchData('/fincas');
-    const lands = await fetchData('/lotes');
+    const farms = lookupRecords('fincas');
+    const lands = lookupRecords('lotes');
 
     // Populate farm dropdown
     const farmSelect = document.getElementById('edit-animal-farm');
@@ -685,7 +727,7 @@ async function loadEditHealthForm() {
     }
 
     const record = await fetchData(`/registros_sanitarios/${recordId}`);
-    const animals = await fetchData('/bovinos');
+    const animals = lookupRecords('bovinos');
 
     // Populate animal dropdown
     const animalSelect = document.getElementById('edit-health-animal');
@@ -745,9 +787,7 @@ async function loadEditMovementForm() {
     }
 
     const movement = await fetchData(`/movimientos_animales/${movementId}`);
-    const animals = await fetchData('/bovinos');
-    const farms = await fetchData('/fincas');
-    const lands = await fetchData('/lotes');
+    const animals = lookupRecords('bovinos');
 
     // Populate animal dropdown
     const animalSelect = document.getElementById('edit-movement-animal');
@@ -824,7 +864,7 @@ async function loadEditSlaughterForm() {
     }
 
     const record = await fetchData(`/pesajes_canales/${slaughterId}`);
-    const animals = await fetchData('/bovinos');
+    const animals = lookupRecords('bovinos');
 
     // Populate animal dropdown
     const animalSelect = document.getElementById('edit-slaughter-animal');
@@ -927,7 +967,7 @@ async function loadEditSupplyForm() {
     }
 
     const supply = await fetchData(`/insumos/${supplyId}`);
-    const suppliers = await fetchData('/proveedores');
+    const suppliers = lookupRecords('proveedores');
 
     // Populate supplier dropdown
     const supplierSelect = document.getElementById('edit-supply-supplier');
@@ -1197,7 +1237,7 @@ async function loadSlaughteredAnimals() {
 
     try {
         const slaughterWeights = await fetchData('/pesajes_canales');
-        const animals = await fetchData('/bovinos');
+        const animals = lookupRecords('bovinos');
 
         // Filter slaughter weights by selected farm
         const farmSlaughterWeights = slaughterWeights.filter(sw => {
@@ -1466,22 +1506,21 @@ function updateLandActivityOptions() {
         return;
     }
 
-    // Get farm data to check its Uso_Suelo
-    fetchData(`/fincas/${selectedFarmId}`).then(farm => {
-        activitySelect.innerHTML = '<option value="">Select Actividad Ganado</option>';
+    // Check the farm's Uso_Suelo
+    const farm = lookupRecords('fincas').find(f => f.FincaID == selectedFarmId);
+    activitySelect.innerHTML = '<option value="">Select Actividad Ganado</option>';
 
-        if (farm.Uso_Suelo === 'Recuperación') {
-            // Only show Recuperación option
-            activitySelect.innerHTML += '<option value="Recuperación">Recuperación</option>';
-        } else {
-            // Show Cría, Levante, Ceba options for Carne farms
-            activitySelect.innerHTML += `
-                <option value="Cría">Cría</option>
-                <option value="Levante">Levante</option>
-                <option value="Ceba">Ceba</option>
-            `;
-        }
-    });
+    if (farm && farm.Uso_Suelo === 'Recuperación') {
+        // Only show Recuperación option
+        activitySelect.innerHTML += '<option value="Recuperación">Recuperación</option>';
+    } else {
+        // Show Cría, Levante, Ceba options for Carne farms
+        activitySelect.innerHTML += `
+            <option value="Cría">Cría</option>
+            <option value="Levante">Levante</option>
+            <option value="Ceba">Ceba</option>
+        `;
+    }
 }
 
 // Add event listener for farm selection change
@@ -1499,7 +1538,7 @@ async function editLand(id) {
     document.getElementById('edit-land-form').style.display = 'flex';
 
     // Load farms for the edit form
-    const farms = await fetchData('/fincas');
+    const farms = lookupRecords('fincas');
     const farmSelect = document.getElementById('edit-land-farm');
     farmSelect.innerHTML = '<option value="">Select Farm</option>';
     farms.forEach(farm => {
@@ -1532,8 +1571,9 @@ document.getElementById('edit-land-form').addEventListener('submit', async (e) =
 
     // Validate that land area doesn't exceed farm area
     try {
-        const farm = await fetchData(`/fincas/${FincaID}`);
-        const existingLands = await fetchData('/lotes');
+        await refreshLookups();
+        const farm = lookupRecords('fincas').find(f => f.FincaID === FincaID);
+        const existingLands = lookupRecords('lotes');
         const totalUsedArea = existingLands
             .filter(land => land.FincaID === FincaID && land.LoteID !== parseInt(landId))
             .reduce((sum, land) => sum + (land.Area_ha || 0), 0);
@@ -1570,22 +1610,21 @@ function updateEditLandActivityOptions() {
         return;
     }
 
-    // Get farm data to check its Uso_Suelo
-    fetchData(`/fincas/${selectedFarmId}`).then(farm => {
-        activitySelect.innerHTML = '<option value="">Select Actividad Ganado</option>';
+    // Check the farm's Uso_Suelo
+    const farm = lookupRecords('fincas').find(f => f.FincaID == selectedFarmId);
+    activitySelect.innerHTML = '<option value="">Select Actividad Ganado</option>';
 
-        if (farm.Uso_Suelo === 'Recuperación') {
-            // Only show Recuperación option
-            activitySelect.innerHTML += '<option value="Recuperación">Recuperación</option>';
-        } else {
-            // Show Cría, Levante, Ceba options for Carne farms
-            activitySelect.innerHTML += `
-                <option value="Cría">Cría</option>
-                <option value="Levante">Levante</option>
-                <option value="Ceba">Ceba</option>
-            `;
-        }
-    });
+    if (farm && farm.Uso_Suelo === 'Recuperación') {
+        // Only show Recuperación option
+        activitySelect.innerHTML += '<option value="Recuperación">Recuperación</option>';
+    } else {
+        // Show Cría, Levante, Ceba options for Carne farms
+        activitySelect.innerHTML += `
+            <option value="Cría">Cría</option>
+            <option value="Levante">Levante</option>
+            <option value="Ceba">Ceba</option>
+        `;
+    }
 }
 
 // Add event listener for edit land farm selection change
@@ -1595,8 +1634,9 @@ document.getElementById('edit-land-farm').addEventListener('change', updateEditL
 async function loadAnimalRations() {
     try {
         const animalRations = await fetchData('/racion_animal');
-        const rations = await fetchData('/alimentacion');
-        const bovinos = await fetchData('/bovinos');
+        await refreshLookups();
+        const rations = lookupRecords('alimentacion');
+        const bovinos = lookupRecords('bovinos');
         const list = document.getElementById('animal-rations-list');
 
         list.innerHTML = '';
@@ -1619,7 +1659,8 @@ async function loadAnimalRations() {
 
 // Load animals for animal rations form
 async function loadAnimalRationsAnimals() {
-    const bovinos = await fetchData('/bovinos');
+    await refreshLookups();
+    const bovinos = lookupRecords('bovinos');
     const animalSelect = document.getElementById('animal-ration-animal');
 
     animalSelect.innerHTML = '<option value="">Seleccionar Animal</option>';
@@ -1689,7 +1730,8 @@ document.addEventListener('DOMContentLoaded', () => {
 // Load rations
 async function loadRations() {
     try {
-        const rations = await fetchData('/alimentacion');
+        await refreshLookups();
+        const rations = lookupRecords('alimentacion');
         const list = document.getElementById('rations-list');
         const editSelect = document.getElementById('edit-ration-select');
         const ingredientSelect = document.getElementById('ration-ingredient-ration');
@@ -1768,7 +1810,7 @@ async function loadEditSaleForm() {
     }
 
     const sale = await fetchData(`/ventas/${saleId}`);
-    const farms = await fetchData('/fincas');
+    const farms = lookupRecords('fincas');
 
     // Populate farm dropdown
     const farmSelect = document.getElementById('edit-sale-farm');